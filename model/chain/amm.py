@@ -0,0 +1,128 @@
+"""
+amm.py: constant-product (Uniswap v2 style) pair math, matching
+PangolinLibrary bit for bit.
+
+All amounts are integers in atomic token units, and every division floors, the
+same as the router's uint256 math. Errors are raised as ValueError with the
+same reason strings the library reverts with, so callers that catch router
+call failures can catch these the same way.
+"""
+
+import numpy as np
+
+UINT256_MAX = 2**256 - 1
+
+# Pangolin charges 0.3% on the input amount
+FEE_NUMERATOR = 997
+FEE_DENOMINATOR = 1000
+
+def _check(value):
+    """
+    Emulate SafeMath overflow checks on an intermediate product.
+    """
+    if value > UINT256_MAX:
+        raise ValueError("ds-math-mul-overflow")
+    return value
+
+def quote(amount_a, reserve_a, reserve_b):
+    """
+    Given some amount of an asset and pair reserves, return the equivalent
+    amount of the other asset, like PangolinLibrary.quote.
+    """
+    if amount_a <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_AMOUNT")
+    if reserve_a <= 0 or reserve_b <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_LIQUIDITY")
+    return _check(amount_a * reserve_b) // reserve_a
+
+def get_amount_out(amount_in, reserve_in, reserve_out):
+    """
+    Given an input amount and pair reserves, return the maximum output amount,
+    like PangolinLibrary.getAmountOut.
+    """
+    if amount_in <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_INPUT_AMOUNT")
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_LIQUIDITY")
+    amount_in_with_fee = _check(amount_in * FEE_NUMERATOR)
+    numerator = _check(amount_in_with_fee * reserve_out)
+    denominator = _check(reserve_in * FEE_DENOMINATOR) + amount_in_with_fee
+    return numerator // denominator
+
+def get_amount_in(amount_out, reserve_in, reserve_out):
+    """
+    Given an output amount and pair reserves, return the required input
+    amount, like PangolinLibrary.getAmountIn.
+    """
+    if amount_out <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_OUTPUT_AMOUNT")
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_LIQUIDITY")
+    if amount_out > reserve_out:
+        raise ValueError("ds-math-sub-underflow")
+    if amount_out == reserve_out:
+        # The router divides by zero here
+        raise ValueError("PangolinLibrary: INSUFFICIENT_LIQUIDITY")
+    numerator = _check(_check(reserve_in * amount_out) * FEE_DENOMINATOR)
+    denominator = _check((reserve_out - amount_out) * FEE_NUMERATOR)
+    return numerator // denominator + 1
+
+def get_amounts_out(amount_in, path, get_reserves):
+    """
+    Chain get_amount_out along a path of token addresses, like
+    PangolinLibrary.getAmountsOut. get_reserves(token_a, token_b) must return
+    the (reserve_a, reserve_b) of the pair for those tokens.
+    """
+    if len(path) < 2:
+        raise ValueError("PangolinLibrary: INVALID_PATH")
+    amounts = [amount_in]
+    for token_in, token_out in zip(path[:-1], path[1:]):
+        reserve_in, reserve_out = get_reserves(token_in, token_out)
+        amounts.append(get_amount_out(amounts[-1], reserve_in, reserve_out))
+    return amounts
+
+def get_amounts_in(amount_out, path, get_reserves):
+    """
+    Chain get_amount_in backwards along a path of token addresses, like
+    PangolinLibrary.getAmountsIn.
+    """
+    if len(path) < 2:
+        raise ValueError("PangolinLibrary: INVALID_PATH")
+    amounts = [amount_out]
+    for token_in, token_out in zip(reversed(path[:-1]), reversed(path[1:])):
+        reserve_in, reserve_out = get_reserves(token_in, token_out)
+        amounts.insert(0, get_amount_in(amounts[0], reserve_in, reserve_out))
+    return amounts
+
+def amounts_out_curve(amounts_in, reserve_in, reserve_out):
+    """
+    Compute get_amount_out for many input sizes against the same reserves at
+    once, e.g. to size an order against the whole depth curve.
+
+    Takes any sequence of positive integers and returns a NumPy array of
+    output amounts. Uses exact integer (object) arithmetic, so every entry is
+    what the router would return for that size alone.
+    """
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_LIQUIDITY")
+    amounts_in = np.asarray([int(a) for a in amounts_in], dtype=object)
+    if len(amounts_in) > 0 and amounts_in.min() <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_INPUT_AMOUNT")
+    amount_in_with_fee = amounts_in * FEE_NUMERATOR
+    return (amount_in_with_fee * reserve_out) // (reserve_in * FEE_DENOMINATOR + amount_in_with_fee)
+
+def amounts_in_curve(amounts_out, reserve_in, reserve_out):
+    """
+    Compute get_amount_in for many output sizes against the same reserves at
+    once. Sizes that the pair can't fill come back as None.
+    """
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_LIQUIDITY")
+    amounts_out = np.asarray([int(a) for a in amounts_out], dtype=object)
+    if len(amounts_out) > 0 and amounts_out.min() <= 0:
+        raise ValueError("PangolinLibrary: INSUFFICIENT_OUTPUT_AMOUNT")
+    fillable = amounts_out < reserve_out
+    # Park unfillable sizes on a harmless value, then blank them out
+    safe_out = np.where(fillable, amounts_out, 0)
+    amounts_in = (reserve_in * safe_out * FEE_DENOMINATOR) // ((reserve_out - safe_out) * FEE_NUMERATOR) + 1
+    return np.where(fillable, amounts_in, None)
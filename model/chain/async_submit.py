@@ -0,0 +1,134 @@
+"""
+async_submit.py: concurrent transaction submission over web3's async provider.
+
+While collecting, transactions are queued per agent instead of sent. Nonces are
+still reserved from the shared nonce table at queue time, so each agent's
+transactions keep their order. flush() then sends every agent's queue at
+once, one coroutine per agent, so a step waits for its slowest agent instead
+of for the sum of all of them.
+
+With a signer.SignerPool, the whole queue is signed across the pool first and
+sent with eth_sendRawTransaction.
+"""
+
+import asyncio
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PendingTx:
+    """
+    A queued transaction. Gets its hash when the queue is flushed.
+    """
+
+    def __init__(self, agent, prepared, transaction):
+        self.agent = agent
+        self.prepared = prepared
+        self.transaction = transaction
+        self.hash = None
+        self.error = None
+        # Signed transaction bytes, when signing locally
+        self.raw = None
+
+    def __repr__(self):
+        return 'PendingTx({}, {}, nonce={}, hash={})'.format(
+            self.transaction['from'], self.prepared.fn_name, self.transaction['nonce'], self.hash)
+
+class AsyncSubmitter:
+    """
+    Queues agents' transactions and sends them concurrently.
+    """
+
+    def __init__(self, endpoint_uri, nonce_table, signer=None, request_timeout=60*300):
+        # The async provider needs a recent web3 5.x; only ask for it when
+        # we're actually submitting asynchronously
+        from web3 import Web3, AsyncHTTPProvider
+        from web3.eth import AsyncEth
+
+        self.w3 = Web3(
+            AsyncHTTPProvider(endpoint_uri, request_kwargs={"timeout": request_timeout}),
+            modules={'eth': (AsyncEth,)},
+            middlewares=[]
+        )
+        self.nonce_table = nonce_table
+        self.signer = signer
+        # Are we queueing transactions instead of sending them?
+        self.collecting = False
+        # Keep one loop around; aiohttp sessions are tied to the loop they were made on
+        self.__loop = asyncio.new_event_loop()
+        # This maps from agent address to a list of PendingTx, in nonce order
+        self.__queues = collections.OrderedDict()
+
+    def start(self):
+        """
+        Start queueing transactions.
+        """
+        self.collecting = True
+
+    def stop(self):
+        """
+        Send anything still queued and go back to sending immediately.
+        """
+        self.flush()
+        self.collecting = False
+
+    def submit(self, agent, prepared, transaction):
+        """
+        Queue a prepared contract function call with its transaction fields
+        (which must include the nonce). Returns a PendingTx.
+        """
+        pending = PendingTx(agent, prepared, transaction)
+        self.__queues.setdefault(transaction['from'], []).append(pending)
+        return pending
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.__queues.values())
+
+    async def __send(self, pending):
+        while pending.hash is None:
+            try:
+                if self.signer is not None and pending.agent in self.signer:
+                    if pending.raw is None:
+                        pending.raw = self.signer.sign(pending.prepared.buildTransaction(pending.transaction))
+                    pending.hash = await self.w3.eth.send_raw_transaction(pending.raw)
+                else:
+                    tx = pending.prepared.buildTransaction(pending.transaction)
+                    pending.hash = await self.w3.eth.send_transaction(tx)
+            except Exception as inst:
+                err_str = str(inst)
+                if 'nonce too low' in err_str or 'replacement transaction underpriced' in err_str:
+                    # Same recovery as transaction_helper: move past the used nonce
+                    pending.transaction['nonce'] = self.nonce_table.reserve(
+                        pending.transaction['from'], floor=pending.transaction['nonce'] + 1)
+                    pending.agent.next_tx_count = pending.transaction['nonce']
+                    pending.raw = None
+                else:
+                    pending.error = inst
+                    logger.info({"agent": pending.transaction['from'], "error": inst, "action": pending.prepared.fn_name})
+                    return
+
+    async def __send_queue(self, queue):
+        # One agent's transactions go out in nonce order
+        for pending in queue:
+            await self.__send(pending)
+
+    async def __send_all(self, queues):
+        await asyncio.gather(*(self.__send_queue(queue) for queue in queues))
+
+    def flush(self):
+        """
+        Send everything queued so far, concurrently across agents. Returns the
+        list of PendingTx that were sent (check .hash / .error).
+        """
+        queues = list(self.__queues.values())
+        self.__queues = collections.OrderedDict()
+        if self.signer is not None:
+            # Sign everything in one go across the pool
+            pendings = [pending for queue in queues for pending in queue if pending.agent in self.signer]
+            signed = self.signer.sign_all([pending.prepared.buildTransaction(pending.transaction) for pending in pendings])
+            for pending, raw in zip(pendings, signed):
+                pending.raw = raw
+        if len(queues) > 0:
+            self.__loop.run_until_complete(self.__send_all(queues))
+        return [pending for queue in queues for pending in queue]
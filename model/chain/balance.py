@@ -0,0 +1,461 @@
+"""
+balance.py: fixed-point token balances.
+
+Kept apart from model.py so code that never talks to the chain can use it.
+"""
+
+import fractions
+
+try:
+    import numpy as np
+except ImportError:
+    # Only BalanceArray needs it
+    np = None
+
+def reg_int(value, scale):
+    """
+    Convert from atomic token units with the given number of decimals, to a
+    Balance with the right number of decimals.
+    """
+    return Balance(value, scale)
+
+def unreg_int(value, scale):
+    """
+    Convert from a Balance with the right number of decimals to atomic token
+    units with the given number of decimals.
+    """
+
+    assert(value.decimals() == scale)
+    return value.to_wei()
+
+def portion_dedusted(total, fraction):
+    """
+    Compute the amount of an asset to use, given that you have
+    total and you don't want to leave behind dust.
+    """
+
+    if type(total) is Balance:
+        # Same as below, without making the Balances in between
+        part = _mul_int(total._wei, fraction)
+        if total._wei - part <= _SCALES[total._decimals]:
+            return total
+        return Balance(part, total._decimals)
+    if isinstance(total, BalanceArray):
+        return total.portion_dedusted(fraction)
+    if total - (fraction * total) <= 1:
+        return total
+    else:
+        return fraction * total
+
+class _Scales(dict):
+    """
+    10**decimals for each number of decimals, worked out once, so we don't
+    raise 10 to a power on every operation.
+    """
+    def __missing__(self, decimals):
+        scale = self[decimals] = 10**decimals
+        return scale
+
+_SCALES = _Scales()
+
+def _ratio(number):
+    """
+    Get a number as an exact (numerator, denominator) pair of ints, with a
+    positive denominator. Floats are taken at their exact binary value.
+    """
+    if type(number) is int:
+        return (number, 1)
+    try:
+        return number.as_integer_ratio()
+    except AttributeError:
+        exact = fractions.Fraction(number)
+        return (exact.numerator, exact.denominator)
+
+def _mul_int(value, number):
+    """
+    Multiply an int by a number exactly, truncating toward zero like int().
+    """
+    if type(number) is int:
+        return value * number
+    (numerator, denominator) = _ratio(number)
+    product = value * numerator
+    if type(number) is float:
+        # The denominator is a power of 2, so shift instead of dividing
+        shift = denominator.bit_length() - 1
+        return product >> shift if product >= 0 else -(-product >> shift)
+    if product >= 0:
+        return product // denominator
+    return -(-product // denominator)
+
+def _div_int(value, number):
+    """
+    Divide an int by a number exactly, rounding down like //.
+    """
+    if type(number) is int:
+        return value // number
+    (numerator, denominator) = _ratio(number)
+    return value * denominator // numerator
+
+def _cmp_tokens(wei, scale, number):
+    """
+    Compare wei atomic units against a number of tokens exactly. Returns the
+    sign of the difference, or NaN if the number is NaN.
+    """
+    try:
+        (numerator, denominator) = _ratio(number)
+    except (ValueError, OverflowError):
+        # Infinite or NaN
+        if number != number:
+            return float('nan')
+        return -1 if number > 0 else 1
+    difference = wei * denominator - numerator * scale
+    return (difference > 0) - (difference < 0)
+
+# Because token balances need to be accuaate to the atomic unit, we can't store
+# them as floats. Otherwise we might turn our float back into a token balance
+# different from the balance we actually had, and try to spend more than we
+# have. But also, it's ugly to throw around total counts of atomic units. So we
+# use this class that represents a fixed-point token balance.
+#
+# Balances are immutable: every operation makes a new one, and += and -=
+# rebind the name instead of changing the Balance in place. So a Balance can
+# be handed out and kept without copying. Arithmetic with plain numbers is
+# done exactly on ints; floats count at their exact binary value.
+class Balance:
+    __slots__ = ('_wei', '_decimals')
+
+    # Make NumPy scalars defer to our reflected operators
+    __array_ufunc__ = None
+
+    def __init__(self, wei=0, decimals=0):
+        self._wei = wei if type(wei) is int else int(wei)
+        self._decimals = decimals if type(decimals) is int else int(decimals)
+
+    def clone(self):
+        """
+        Balances never change, so this is the Balance itself. Kept for code
+        that still asks for a copy.
+        """
+        return self
+
+    def to_decimals(self, new_decimals):
+        """
+        Get a similar balance with a different number of decimals.
+        """
+
+        if new_decimals >= self._decimals:
+            return Balance(self._wei * _SCALES[new_decimals - self._decimals], new_decimals)
+        return Balance(self._wei // _SCALES[self._decimals - new_decimals], new_decimals)
+
+    @classmethod
+    def from_tokens(cls, n, decimals=0):
+        return cls(_mul_int(_SCALES[decimals], n), decimals)
+
+    def __add__(self, other):
+        if type(other) is Balance:
+            if other._decimals != self._decimals:
+                raise ValueError("Cannot add balances with different decimals: {}, {}", self, other)
+            return Balance(self._wei + other._wei, self._decimals)
+        elif isinstance(other, BalanceArray):
+            return NotImplemented
+        else:
+            return Balance(self._wei + _mul_int(_SCALES[self._decimals], other), self._decimals)
+
+    def __radd__(self, other):
+        return self + other
+
+    def __sub__(self, other):
+        if type(other) is Balance:
+            if other._decimals != self._decimals:
+                raise ValueError("Cannot subtract balances with different decimals: {}, {}", self, other)
+            return Balance(self._wei - other._wei, self._decimals)
+        elif isinstance(other, BalanceArray):
+            return NotImplemented
+        else:
+            return Balance(self._wei - _mul_int(_SCALES[self._decimals], other), self._decimals)
+
+    def __rsub__(self, other):
+        return Balance(_mul_int(_SCALES[self._decimals], other) - self._wei, self._decimals)
+
+    def __mul__(self, other):
+        if isinstance(other, (Balance, BalanceArray)):
+            raise TypeError("Cannot multiply two balances")
+        return Balance(_mul_int(self._wei, other), self._decimals)
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __truediv__(self, other):
+        if isinstance(other, (Balance, BalanceArray)):
+            raise TypeError("Cannot divide two balances")
+        return Balance(_div_int(self._wei, other), self._decimals)
+
+    # No rtruediv because dividing by a balance is silly.
+
+    # Todo: floordiv? divmod?
+
+    def _compare(self, other):
+        """
+        Get the sign of self - other, or NaN if other is NaN.
+        """
+        if type(other) is int:
+            difference = self._wei - other * _SCALES[self._decimals]
+        elif type(other) is Balance:
+            if other._decimals != self._decimals:
+                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
+            difference = self._wei - other._wei
+        else:
+            return _cmp_tokens(self._wei, _SCALES[self._decimals], other)
+        return (difference > 0) - (difference < 0)
+
+    def __lt__(self, other):
+        if isinstance(other, BalanceArray):
+            return NotImplemented
+        return self._compare(other) < 0
+
+    def __le__(self, other):
+        if isinstance(other, BalanceArray):
+            return NotImplemented
+        return self._compare(other) <= 0
+
+    def __gt__(self, other):
+        if isinstance(other, BalanceArray):
+            return NotImplemented
+        return self._compare(other) > 0
+
+    def __ge__(self, other):
+        if isinstance(other, BalanceArray):
+            return NotImplemented
+        return self._compare(other) >= 0
+
+    def __eq__(self, other):
+        if isinstance(other, BalanceArray):
+            return NotImplemented
+        try:
+            return self._compare(other) == 0
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, BalanceArray):
+            return NotImplemented
+        try:
+            return self._compare(other) != 0
+        except TypeError:
+            return NotImplemented
+
+    # Equal to numbers without hashing like them, so not hashable
+    __hash__ = None
+
+    def __str__(self):
+        base = _SCALES[self._decimals]
+        ipart = self._wei // base
+        fpart = self._wei - base * ipart
+        return ('{}.{:0' + str(self._decimals) + 'd}').format(ipart, fpart)
+
+    def __repr__(self):
+        return 'Balance({}, {})'.format(self._wei, self._decimals)
+
+    def __float__(self):
+        return self._wei / _SCALES[self._decimals]
+
+    def __round__(self):
+        base = _SCALES[self._decimals]
+        return Balance(self._wei // base * base, self._decimals)
+
+    def __format__(self, s):
+        if s == '':
+            return str(self)
+        return float(self).__format__(s)
+
+    def to_wei(self):
+        return self._wei
+
+    def decimals(self):
+        return self._decimals
+
+class BalanceArray:
+    """
+    Balances of one token for many holders, as a NumPy array of exact int
+    atomic units. Arithmetic and comparisons work element-wise, like
+    Balance's, and broadcast against a Balance, a number of tokens or an
+    array of numbers. Like a Balance, a BalanceArray never changes.
+    """
+
+    __slots__ = ('_wei', '_decimals')
+
+    # Make NumPy arrays and scalars defer to our reflected operators
+    __array_ufunc__ = None
+
+    def __init__(self, wei=(), decimals=0):
+        """
+        wei is atomic units for each holder.
+        """
+        if np is None:
+            raise ImportError("BalanceArray needs numpy")
+        self._wei = np.array([int(w) for w in wei], dtype=object)
+        self._decimals = int(decimals)
+
+    @classmethod
+    def _of(cls, wei, decimals):
+        # Wrap an object array of ints we made, without converting it
+        array = cls.__new__(cls)
+        array._wei = wei
+        array._decimals = decimals
+        return array
+
+    @classmethod
+    def from_balances(cls, balances, decimals=None):
+        """
+        Make a BalanceArray from Balances, which must all have the same
+        number of decimals.
+        """
+        balances = list(balances)
+        if decimals is None:
+            decimals = balances[0].decimals() if balances else 0
+        for balance in balances:
+            if balance.decimals() != decimals:
+                raise ValueError("Cannot mix balances with different decimals: {}, {}", balance, decimals)
+        return cls([balance.to_wei() for balance in balances], decimals)
+
+    @classmethod
+    def zeros(cls, n, decimals=0):
+        return cls([0] * n, decimals)
+
+    def __len__(self):
+        return len(self._wei)
+
+    def __iter__(self):
+        for wei in self._wei:
+            yield Balance(wei, self._decimals)
+
+    def __getitem__(self, key):
+        """
+        Get one holder's Balance, or a BalanceArray for a slice, index array
+        or mask.
+        """
+        picked = self._wei[key]
+        if isinstance(picked, np.ndarray):
+            return BalanceArray._of(picked, self._decimals)
+        return Balance(picked, self._decimals)
+
+    def tolist(self):
+        return list(self)
+
+    def to_wei(self):
+        """
+        Get a copy of the atomic units, as an object array of ints.
+        """
+        return self._wei.copy()
+
+    def to_float(self):
+        """
+        Get the balances in tokens, as float64s.
+        """
+        return (self._wei / _SCALES[self._decimals]).astype(np.float64)
+
+    def decimals(self):
+        return self._decimals
+
+    def to_decimals(self, new_decimals):
+        if new_decimals >= self._decimals:
+            return BalanceArray._of(self._wei * _SCALES[new_decimals - self._decimals], new_decimals)
+        return BalanceArray._of(self._wei // _SCALES[self._decimals - new_decimals], new_decimals)
+
+    def sum(self):
+        """
+        Get the total, as a Balance.
+        """
+        return Balance(sum(self._wei.tolist()), self._decimals)
+
+    def _operand(self, other, verb):
+        """
+        Get what to add to, subtract from or compare with our atomic units,
+        as an int or an object array of them.
+        """
+        if isinstance(other, (Balance, BalanceArray)):
+            if other._decimals != self._decimals:
+                raise ValueError("Cannot {} balances with different decimals: {}, {}".format(verb, self, other))
+            return other._wei
+        scale = _SCALES[self._decimals]
+        if isinstance(other, np.ndarray):
+            return np.frompyfunc(lambda n: _mul_int(scale, n), 1, 1)(other)
+        return _mul_int(scale, other)
+
+    def __add__(self, other):
+        return BalanceArray._of(self._wei + self._operand(other, 'add'), self._decimals)
+
+    def __radd__(self, other):
+        return self + other
+
+    def __sub__(self, other):
+        return BalanceArray._of(self._wei - self._operand(other, 'subtract'), self._decimals)
+
+    def __rsub__(self, other):
+        return BalanceArray._of(self._operand(other, 'subtract') - self._wei, self._decimals)
+
+    def __mul__(self, other):
+        """
+        Multiply by a number, or element-wise by an array of them.
+        """
+        if isinstance(other, (Balance, BalanceArray)):
+            raise TypeError("Cannot multiply two balances")
+        if type(other) is int:
+            return BalanceArray._of(self._wei * other, self._decimals)
+        return BalanceArray._of(np.frompyfunc(_mul_int, 2, 1)(self._wei, other), self._decimals)
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __truediv__(self, other):
+        if isinstance(other, (Balance, BalanceArray)):
+            raise TypeError("Cannot divide two balances")
+        if type(other) is int:
+            return BalanceArray._of(self._wei // other, self._decimals)
+        return BalanceArray._of(np.frompyfunc(_div_int, 2, 1)(self._wei, other), self._decimals)
+
+    def _compare(self, other):
+        """
+        Get the sign of self - other for each holder, as a float array.
+        """
+        if isinstance(other, (Balance, BalanceArray)) or type(other) is int:
+            difference = self._wei - self._operand(other, 'compare')
+            return np.sign(difference.astype(np.float64))
+        scale = _SCALES[self._decimals]
+        return np.frompyfunc(lambda wei, n: _cmp_tokens(wei, scale, n), 2, 1)(self._wei, other).astype(np.float64)
+
+    def __lt__(self, other):
+        return self._compare(other) < 0
+
+    def __le__(self, other):
+        return self._compare(other) <= 0
+
+    def __gt__(self, other):
+        return self._compare(other) > 0
+
+    def __ge__(self, other):
+        return self._compare(other) >= 0
+
+    def __eq__(self, other):
+        return self._compare(other) == 0
+
+    def __ne__(self, other):
+        return self._compare(other) != 0
+
+    __hash__ = None
+
+    def portion_dedusted(self, fraction):
+        """
+        portion_dedusted() for every holder. fraction can be one number or
+        one per holder.
+        """
+        part = self * fraction
+        leftover = self._wei - part._wei
+        kept = (leftover <= _SCALES[self._decimals]).astype(bool)
+        return BalanceArray._of(np.where(kept, self._wei, part._wei), self._decimals)
+
+    def __str__(self):
+        return '[' + ', '.join(str(balance) for balance in self) + ']'
+
+    def __repr__(self):
+        return 'BalanceArray({}, {})'.format(self._wei.tolist(), self._decimals)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+bench_balance.py: measure the Balance operations Model.step performs.
+
+Runs offline, with no chain. The first table times one Balance operation at
+a time, the way an agent's turn in Model.step does them: reading a balance,
+applying a transfer to the ledger, sizing a trade with portion_dedusted(),
+comparing, converting decimals and formatting the log. The second times the
+same dedusting and eligibility checks for a whole population of agents, one
+Balance at a time and as one BalanceArray.
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from balance import Balance, BalanceArray, portion_dedusted
+
+USDT_DECIMALS = 6
+XSD_DECIMALS = 18
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--agents', type=int, default=200, help="population size for the bulk table")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    wei = 1234567890123456789012
+    xsd = Balance(wei, XSD_DECIMALS)
+    usdt = Balance(98765432101, USDT_DECIMALS)
+    moved = Balance(19060347313, XSD_DECIMALS)
+    one_xsd = Balance.from_tokens(1, XSD_DECIMALS)
+    commitment = rng.random() * 0.1
+    price = 1.0345
+
+    # (label, operation): what one agent's turn does, roughly in order
+    cases = [
+        ('Balance(wei, decimals)', lambda: Balance(wei, XSD_DECIMALS)),
+        ('ledger transfer (-)', lambda: xsd - moved),
+        ('Balance.from_tokens', lambda: Balance.from_tokens(1, XSD_DECIMALS)),
+        ('portion_dedusted', lambda: portion_dedusted(xsd, commitment)),
+        ('compare with 0', lambda: xsd > 0),
+        ('compare with Balance', lambda: xsd >= one_xsd),
+        ('multiply by float', lambda: xsd * commitment),
+        ('divide by float price', lambda: usdt / price),
+        ('to_decimals (18 -> 6)', lambda: xsd.to_decimals(USDT_DECIMALS)),
+        ('to_decimals (6 -> 18)', lambda: usdt.to_decimals(XSD_DECIMALS)),
+        ('float()', lambda: float(xsd)),
+        ('log format', lambda: '{:.2f}'.format(xsd)),
+    ]
+
+    print("{:32} {:>12}".format('operation', 'time (us)'))
+    for (label, operation) in cases:
+        t = timed(operation, args.iterations)
+        print("{:32} {:12.3f}".format(label, t * 1e6))
+
+    n = args.agents
+    balances = [Balance(rng.randrange(10**24), XSD_DECIMALS) for _ in range(n)]
+    commitments = [rng.random() * 0.1 for _ in range(n)]
+    array = BalanceArray.from_balances(balances)
+    commitment_array = np.array(commitments)
+
+    def one_at_a_time():
+        return [portion_dedusted(b, c) >= one_xsd for (b, c) in zip(balances, commitments)]
+
+    def all_at_once():
+        return portion_dedusted(array, commitment_array) >= one_xsd
+
+    # Both must agree before we compare their speed
+    assert list(all_at_once()) == one_at_a_time()
+    bulk_iterations = max(1, args.iterations // n)
+    t_loop = timed(one_at_a_time, bulk_iterations)
+    t_array = timed(all_at_once, bulk_iterations)
+    print()
+    print("{:32} {:>12} {:>12} {:>8}".format('{} agents'.format(n), 'loop (us)', 'array (us)', 'speedup'))
+    print("{:32} {:12.1f} {:12.1f} {:7.1f}x".format('dedust and check >= 1 xSD', t_loop * 1e6, t_array * 1e6, t_loop / t_array))
+
+if __name__ == "__main__":
+    main()
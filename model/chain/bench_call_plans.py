@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+bench_call_plans.py: measure per-call client overhead of web3py contract
+callers against call_plans.
+
+Runs offline: eth_call is answered by a provider that returns canned (zero)
+return data, so the numbers are the Python cost of building, encoding and
+decoding a call, without any network time. Run from this directory after
+contracts are compiled (it reads ./build/contracts like model.py does).
+"""
+
+import argparse
+import json
+import time
+
+from eth_utils import function_abi_to_4byte_selector
+from web3 import Web3
+from web3.providers.base import BaseProvider
+from web3._utils.abi import get_abi_output_types
+
+from call_plans import ContractPlans
+
+AGENT = '0x8db97C7cEcE249c2b98bDC0226Cc4C2A57BF52FC'
+TOKEN_A = '0x4Fabb145d64652a948d72533023f6E7A623C7C53'
+TOKEN_B = '0xdAC17F958D2ee523a2206206994597C13D831ec7'
+CONTRACT = '0x5B38Da6a701c568545dCfcB03FcB875f56beddC4'
+
+class CannedProvider(BaseProvider):
+    """
+    Answers eth_call with zeroed return data for whichever function is
+    called, and nothing else.
+    """
+
+    def __init__(self, returns):
+        # This maps from 4-byte selector hex to return data hex
+        self.returns = returns
+
+    def make_request(self, method, params):
+        if method == 'eth_call':
+            return {'jsonrpc': '2.0', 'id': 0, 'result': self.returns[params[0]['data'][:10]]}
+        if method == 'eth_chainId':
+            return {'jsonrpc': '2.0', 'id': 0, 'result': hex(43112)}
+        raise NotImplementedError(method)
+
+    def isConnected(self):
+        return True
+
+def zero_returns(w3, abis):
+    """
+    Build canned return data for every function in the given ABIs.
+    """
+    returns = {}
+    for abi in abis:
+        for entry in abi:
+            if entry.get('type') != 'function':
+                continue
+            types = get_abi_output_types(entry)
+            values = [zero_value(t) for t in types]
+            returns['0x' + function_abi_to_4byte_selector(entry).hex()] = '0x' + w3.codec.encode_abi(types, values).hex()
+    return returns
+
+def split_tuple(abi_type):
+    """
+    Split '(a,(b,c),d)' into ['a', '(b,c)', 'd'].
+    """
+    parts, depth, start = [], 0, 1
+    for i, c in enumerate(abi_type[1:-1], 1):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(abi_type[start:i])
+            start = i + 1
+    parts.append(abi_type[start:-1])
+    return [part for part in parts if part]
+
+def zero_value(abi_type):
+    if abi_type.endswith(']'):
+        (inner, size) = abi_type[:-1].rsplit('[', 1)
+        return [zero_value(inner)] * (int(size) if size else 2)
+    if abi_type.startswith('('):
+        return tuple(zero_value(part) for part in split_tuple(abi_type))
+    if abi_type == 'address':
+        return '0x' + '00' * 20
+    if abi_type == 'bool':
+        return False
+    if abi_type.startswith('bytes') and abi_type != 'bytes':
+        return b'\x00' * int(abi_type[5:])
+    if abi_type in ('bytes', 'string'):
+        return b'' if abi_type == 'bytes' else ''
+    return 0
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    abis = {
+        'Dollar': json.loads(open('./build/contracts/Dollar.json').read())['abi'],
+        'Dao': json.loads(open('./build/contracts/Implementation.json').read())['abi'],
+        'IPangolinPair': json.loads(open('./build/contracts/IPangolinPair.json').read())['abi'],
+        'IPangolinRouter': json.loads(open('./node_modules/@pangolindex/exchange-contracts/artifacts/contracts/pangolin-periphery/interfaces/IPangolinRouter.sol/IPangolinRouter.json').read())['abi'],
+        'MockOracle': json.loads(open('./build/contracts/MockOracle.json').read())['abi'],
+    }
+
+    provider = CannedProvider({})
+    w3 = Web3(provider)
+    provider.returns = zero_returns(w3, abis.values())
+    contracts = {name: w3.eth.contract(abi=abi, address=CONTRACT) for name, abi in abis.items()}
+    plans = {name: ContractPlans.for_contract(contract) for name, contract in contracts.items()}
+    caller = {'from': AGENT, 'gas': 100000}
+    path = [TOKEN_A, TOKEN_B]
+
+    # (label, web3py caller path, call plan path): the calls model.py makes most
+    cases = [
+        ('Dollar.balanceOf',
+            lambda: contracts['Dollar'].caller(caller).balanceOf(AGENT),
+            lambda: plans['Dollar'].balanceOf(AGENT).call(caller)),
+        ('Dao.balanceOfCoupons',
+            lambda: contracts['Dao'].caller(caller).balanceOfCoupons(AGENT, 10),
+            lambda: plans['Dao'].balanceOfCoupons(AGENT, 10).call(caller)),
+        ('Dao.totalRedeemable',
+            lambda: contracts['Dao'].caller(caller).totalRedeemable(),
+            lambda: plans['Dao'].totalRedeemable().call(caller)),
+        ('IPangolinPair.getReserves',
+            lambda: contracts['IPangolinPair'].caller(caller).getReserves(),
+            lambda: plans['IPangolinPair'].getReserves().call(caller)),
+        ('IPangolinRouter.getAmountsOut',
+            lambda: contracts['IPangolinRouter'].caller(caller).getAmountsOut(10**18, path),
+            lambda: plans['IPangolinRouter'].getAmountsOut(10**18, path).call(caller)),
+        ('MockOracle.latestPrice',
+            lambda: contracts['MockOracle'].caller(caller).latestPrice(),
+            lambda: plans['MockOracle'].latestPrice().call(caller)),
+    ]
+
+    print("{:32} {:>12} {:>12} {:>8}".format('call', 'web3 (us)', 'plan (us)', 'speedup'))
+    for (label, before, after) in cases:
+        # Both must agree before we compare their speed
+        assert before() == after(), label
+        t_before = timed(before, args.iterations)
+        t_after = timed(after, args.iterations)
+        print("{:32} {:12.1f} {:12.1f} {:7.1f}x".format(label, t_before * 1e6, t_after * 1e6, t_before / t_after))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""
+bench_step.py: measure how Model.step scales with the number of agents.
+
+For each agent count, starts a fresh stand-in chain (devchain.py, no
+avalanchego needed), deploys the contracts to it, and runs model.py for a
+fixed number of steps from a fixed seed. Its run log and report come down to:
+
+    steps_per_second        steps after the warmup, over their step time
+    step_p50, step_p99      step time percentiles (seconds)
+    rpc_per_step            JSON-RPC calls (and requests, and bytes) per step
+    tx_per_step             agent transactions per step
+    init_seconds            Model construction, including bootstrap()
+    phase_seconds_per_step  wall time per step phase: update is
+                            TokenProxy.update, act sizes and sends the agents'
+                            transactions through transaction_helper, ...
+    peak_rss                model.py's peak resident set size (bytes)
+
+The results go to a JSON file, along with the commit they were measured at,
+so two branches can be compared:
+
+    ./bench_step.py --agents 10 40 200 --steps 50 --out bench-master.json
+    ./bench_step.py --compare bench-master.json bench-mine.json
+
+Run it from this directory, after npm install, with truffle on the path
+and nothing else listening on port 9545. Like run.sh, it clears out
+checkpoint.json and the approvals files, which belong to whatever chain was
+there before.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from devchain import DevChain
+from run_log import read_run_log
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = './checkpoint.json'
+
+# Run log columns the per-step numbers come from
+STEP_COLUMNS = ['step_seconds', 'tx', 'rpc_calls', 'rpc_requests', 'rpc_bytes']
+
+# What --compare shows, and how: (key, label, scale)
+COMPARED = [
+    ('steps_per_second', 'steps/s', 1),
+    ('step_p50', 'p50 (s)', 1),
+    ('step_p99', 'p99 (s)', 1),
+    ('rpc_per_step', 'rpc/step', 1),
+    ('tx_per_step', 'tx/step', 1),
+    ('init_seconds', 'init (s)', 1),
+    ('peak_rss', 'rss (MiB)', 1.0 / 2**20),
+]
+
+def git(*args):
+    try:
+        return subprocess.run(['git'] + list(args), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def describe():
+    """
+    Say what the results were measured on.
+    """
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'branch': git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+def run_model(agents, steps, seed, directory):
+    """
+    Run model.py against the chain, keeping its output, run log and report
+    in directory. Returns the report.
+    """
+    log_path = os.path.join(directory, 'log.bin')
+    report_path = os.path.join(directory, 'report.json')
+    # Like run.sh's rm -f: a fresh checkout has no checkpoint yet
+    for path in [CHECKPOINT_FILE, log_path, report_path] + glob.glob('./*-approvals.json'):
+        if os.path.exists(path):
+            os.remove(path)
+    with open(os.path.join(directory, 'model_output.txt'), 'wb') as output:
+        subprocess.run([
+            sys.executable, './model.py',
+            '--agents', str(agents), '--steps', str(steps), '--seed', str(seed),
+            '--run-log', log_path, '--report', report_path,
+        ], stdout=output, stderr=subprocess.STDOUT, check=True)
+    with open(report_path) as f:
+        return json.load(f)
+
+def summarize(agents, seed, warmup, report, log):
+    """
+    Boil a run's report and run log down to one result.
+    """
+    steps = len(log['step_seconds'])
+    measured = {name: np.asarray(log[name][warmup:], dtype=float) for name in STEP_COLUMNS if name in log}
+    step_seconds = measured['step_seconds']
+    result = {
+        'agents': agents,
+        'seed': seed,
+        'steps': steps,
+        'measured_steps': len(step_seconds),
+        'steps_per_second': len(step_seconds) / step_seconds.sum() if step_seconds.sum() > 0 else None,
+        'step_p50': float(np.percentile(step_seconds, 50)) if len(step_seconds) else None,
+        'step_p99': float(np.percentile(step_seconds, 99)) if len(step_seconds) else None,
+        'tx_per_step': float(measured['tx'].mean()) if len(step_seconds) else None,
+        'init_seconds': report['init_seconds'],
+        'run_seconds': report['run_seconds'],
+        'peak_rss': report['peak_rss'],
+    }
+    for (column, key) in (('rpc_calls', 'rpc_per_step'), ('rpc_requests', 'rpc_requests_per_step'), ('rpc_bytes', 'rpc_bytes_per_step')):
+        if column in measured and len(step_seconds):
+            result[key] = float(measured[column].mean())
+    rpc = report.get('rpc')
+    if rpc and steps:
+        # Over every step, warmup included: the tracer only keeps run totals
+        result['phase_seconds_per_step'] = {name: seconds / steps for name, seconds in rpc['phase_seconds'].items()}
+        result['rpc_per_step_by_method'] = {name: stats['calls'] / steps for name, stats in rpc['method'].items()}
+        result['rpc_per_step_by_site'] = {name: stats['calls'] / steps for name, stats in rpc['site'].items()}
+    return result
+
+def print_results(results):
+    print("{:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format('agents', 'steps/s', 'p50 (s)', 'p99 (s)', 'rpc/step', 'tx/step', 'rss (MiB)'))
+    for result in results:
+        print("{:8d} {:10.3f} {:10.3f} {:10.3f} {:10.1f} {:10.1f} {:10.1f}".format(
+            result['agents'], result['steps_per_second'] or 0, result['step_p50'] or 0, result['step_p99'] or 0,
+            result.get('rpc_per_step', 0), result['tx_per_step'] or 0, result['peak_rss'] / 2**20
+        ))
+
+def compare(before_path, after_path):
+    """
+    Print two result files side by side, with after/before for each number.
+    """
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print("before: {} ({})".format(before['system'].get('commit'), before['system'].get('branch')))
+    print("after:  {} ({})".format(after['system'].get('commit'), after['system'].get('branch')))
+    after_by_agents = {result['agents']: result for result in after['results']}
+    print("{:>8} {:>10} {:>12} {:>12} {:>8}".format('agents', 'metric', 'before', 'after', 'ratio'))
+    for old in before['results']:
+        new = after_by_agents.get(old['agents'])
+        if new is None:
+            continue
+        for (key, label, scale) in COMPARED:
+            (a, b) = (old.get(key), new.get(key))
+            if a is None or b is None:
+                continue
+            print("{:8d} {:>10} {:12.3f} {:12.3f} {:>8}".format(
+                old['agents'], label, a * scale, b * scale, '{:.2f}x'.format(b / a) if a else '-'
+            ))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--agents', type=int, nargs='+', default=[10, 40, 200], help="agent counts to run at")
+    parser.add_argument('--steps', type=int, default=50, help="steps per run")
+    parser.add_argument('--warmup', type=int, default=2, help="first steps to leave out of the per-step numbers")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--block-delay', type=float, default=0.05, help="seconds after a transaction arrives that the chain builds a block")
+    parser.add_argument('--truffle', default='truffle', help="truffle command to deploy with")
+    parser.add_argument('--dir', default='bench', help="where to keep each run's output")
+    parser.add_argument('--out', default='bench.json', help="where to write the results")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files instead of running")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for agents in args.agents:
+        directory = os.path.join(args.dir, 'agents-{}'.format(agents))
+        os.makedirs(directory, exist_ok=True)
+        logger.info("Running {} agents for {} steps".format(agents, args.steps))
+        with DevChain(agents, block_delay=args.block_delay, output=os.path.join(directory, 'devchain_output.txt')) as chain:
+            chain.deploy(args.truffle)
+            report = run_model(agents, args.steps, args.seed, directory)
+        log = read_run_log(os.path.join(directory, 'log.bin'), STEP_COLUMNS)
+        results.append(summarize(agents, args.seed, args.warmup, report, log))
+
+        # Write as we go, so a later run failing keeps what we have
+        output = json.dumps({'system': describe(), 'args': vars(args), 'results': results}, indent=2)
+        with open(args.out, 'w') as f:
+            f.write(output)
+
+    print_results(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+call_plans.py: precompiled contract view calls.
+
+Every contract.caller(...).fn(args) in web3py builds a caller object, looks the
+function up in the ABI by name, validates and checksums every address, and
+works out the selector and encoders again. A ContractPlans does all of that
+once per contract, and interns checksummed addresses, so a call in the hot
+loop is just "selector + encode args" on the way out and "decode" on the way
+back.
+
+A PlannedCall looks enough like a prepared ContractFunction that ViewCache,
+RPCBatch and Multicall take either.
+"""
+
+import functools
+
+from eth_utils import function_abi_to_4byte_selector
+from hexbytes import HexBytes
+from web3 import Web3
+from web3._utils.abi import get_abi_input_types, get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+@functools.lru_cache(maxsize=None)
+def intern_address(address):
+    """
+    Checksum an address once; afterwards it's a dict lookup.
+    """
+    return Web3.toChecksumAddress(address)
+
+class FunctionPlan:
+    """
+    Selector and argument/return types for one ABI function.
+    """
+
+    __slots__ = ('name', 'abi', 'selector', 'input_types', 'output_types', 'address_args', 'codec')
+
+    def __init__(self, codec, abi):
+        self.codec = codec
+        self.abi = abi
+        self.name = abi['name']
+        self.selector = function_abi_to_4byte_selector(abi)
+        self.input_types = get_abi_input_types(abi)
+        self.output_types = get_abi_output_types(abi)
+        # Positions of address arguments, to intern
+        self.address_args = tuple(i for i, t in enumerate(self.input_types) if t == 'address')
+
+    def encode(self, args):
+        """
+        Encode call data for a tuple of arguments, as a hex string.
+        """
+        if self.address_args:
+            args = list(args)
+            for i in self.address_args:
+                args[i] = intern_address(args[i])
+        return '0x' + (self.selector + self.codec.encode_abi(self.input_types, args)).hex()
+
+    def decode(self, raw):
+        """
+        Decode return data the same way ContractFunction.call() would.
+        """
+        decoded = self.codec.decode_abi(self.output_types, HexBytes(raw))
+        normalized = map_abi_data(BASE_RETURN_NORMALIZERS, self.output_types, decoded)
+        return normalized[0] if len(normalized) == 1 else normalized
+
+class PlannedCall:
+    """
+    A FunctionPlan bound to a contract address and arguments.
+    """
+
+    __slots__ = ('w3', 'plan', 'address', 'args', '__data')
+
+    # ContractFunction attributes the caches and batches look at
+    kwargs = None
+
+    def __init__(self, w3, plan, address, args):
+        self.w3 = w3
+        self.plan = plan
+        self.address = address
+        self.args = args
+        self.__data = None
+
+    @property
+    def fn_name(self):
+        return self.plan.name
+
+    @property
+    def abi(self):
+        return self.plan.abi
+
+    def _encode_transaction_data(self):
+        if self.__data is None:
+            self.__data = self.plan.encode(self.args)
+        return self.__data
+
+    def decode(self, raw):
+        return self.plan.decode(raw)
+
+    def call(self, transaction=None, block_identifier='latest'):
+        """
+        Make the call with eth_call, like ContractFunction.call().
+        """
+        params = {'to': self.address, 'data': self._encode_transaction_data()}
+        if transaction:
+            if 'from' in transaction:
+                params['from'] = intern_address(transaction['from'])
+            if 'gas' in transaction:
+                params['gas'] = transaction['gas']
+        return self.decode(self.w3.eth.call(params, block_identifier))
+
+class BoundPlan:
+    """
+    All the overloads of one function name at one address. Calling it with
+    arguments makes a PlannedCall.
+    """
+
+    __slots__ = ('w3', 'address', 'plans')
+
+    def __init__(self, w3, address, plans):
+        self.w3 = w3
+        self.address = address
+        # This maps from argument count to FunctionPlan
+        self.plans = plans
+
+    def __call__(self, *args):
+        try:
+            plan = self.plans[len(args)]
+        except KeyError:
+            raise TypeError("No overload of {} takes {} arguments".format(
+                next(iter(self.plans.values())).name, len(args)))
+        return PlannedCall(self.w3, plan, self.address, args)
+
+class ContractPlans:
+    """
+    Call plans for the functions of a contract, used like contract.functions:
+
+        plans.balanceOf(address).call()
+        view_cache.call(plans.balanceOf(address))
+        batch.add(plans.totalSupply())
+    """
+
+    def __init__(self, w3, abi, address, names=None):
+        """
+        Plan every function in the ABI, or only the given names.
+        """
+        self.address = intern_address(address)
+        by_name = {}
+        for entry in abi:
+            if entry.get('type') != 'function':
+                continue
+            if names is not None and entry['name'] not in names:
+                continue
+            by_name.setdefault(entry['name'], {})[len(entry.get('inputs', []))] = FunctionPlan(w3.codec, entry)
+
+        for name, plans in by_name.items():
+            # Set as attributes so lookup costs nothing in the hot loop
+            setattr(self, name, BoundPlan(w3, self.address, plans))
+
+    @classmethod
+    def for_contract(cls, contract, names=None):
+        """
+        Plan the functions of a web3py contract object.
+        """
+        return cls(contract.web3, contract.abi, contract.address, names)
@@ -0,0 +1,55 @@
+"""
+checkpoint.py: save and load model checkpoints.
+
+A checkpoint is one compact JSON document holding everything the model would
+otherwise have to rebuild from the chain on startup (token ledgers, coupon
+state, nonces, approvals, the RNG state and the step counter), tagged with
+the block it was taken at so it can be checked against the chain before use.
+Writes are atomic: a crash mid-write leaves the previous checkpoint in place.
+"""
+
+import json
+import os
+import random
+
+VERSION = 1
+
+def save(path, state):
+    """
+    Atomically replace the checkpoint at path with the given state dict.
+    """
+    state = dict(state, version=VERSION)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load(path):
+    """
+    Load the checkpoint at path. Returns None if there isn't one. Raises
+    ValueError if it was written by an incompatible version.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        state = json.load(f)
+    if state.get('version') != VERSION:
+        raise ValueError("Checkpoint {} has version {}, expected {}".format(path, state.get('version'), VERSION))
+    return state
+
+def rng_state(rng=random):
+    """
+    Get the state of a random.Random (default: the module RNG) as JSON-able
+    lists.
+    """
+    (version, internal, gauss_next) = rng.getstate()
+    return [version, list(internal), gauss_next]
+
+def set_rng_state(state, rng=random):
+    """
+    Restore a state from rng_state().
+    """
+    (version, internal, gauss_next) = state
+    rng.setstate((version, tuple(internal), gauss_next))
@@ -0,0 +1,239 @@
+"""
+coupon_ledger.py: every account's coupons, kept from the DAO's coupon events.
+
+Finding out which coupons an agent holds from the DAO takes a call for its
+assigned index, then a getCouponsAssignedAtEpoch and a balanceOfCoupons for
+every coupon it was ever assigned, and the model did that for every agent
+that might redeem, every step. A CouponLedger applies the DAO's
+CouponPurchase, CouponRedemption, CouponAutoRedemption, CouponTransfer and
+CouponExpiration events instead, and answers the same questions from
+memory: outstandingCouponsForAddress, balanceOfCoupons, outstandingCoupons
+and the expiries an account can redeem, in expiry order.
+
+Amounts are in atomic units (wei), as the DAO reports them. Like the DAO, an
+expired epoch's coupons stay in their holders' outstanding totals, but no
+longer show up in their balances or expiries.
+"""
+
+import bisect
+
+class CouponLedger:
+    """
+    Coupons by account and expiry epoch, with an index by expiry.
+    """
+
+    def __init__(self):
+        # This maps from address to {expiry epoch: coupons}, as the DAO
+        # stores them; expiry doesn't clear these
+        self.__coupons = {}
+        # This maps from address to coupons ever assigned and not redeemed
+        # or transferred away (outstandingCouponsForAddress)
+        self.__outstanding_for = {}
+        # This maps from expiry epoch to coupons outstanding (outstandingCoupons)
+        self.__outstanding = {}
+        # Total outstanding over all epochs (totalCoupons)
+        self.__total = 0
+
+        # The index: sorted epochs with coupons outstanding, the addresses
+        # holding each one, and the sorted epochs each address holds
+        self.__epochs = []
+        self.__holders = {}
+        self.__expiries = {}
+
+        # Counters
+        self.applied = 0
+
+    def __len__(self):
+        """
+        Get the number of accounts holding unexpired coupons.
+        """
+        return len(self.__expiries)
+
+    @property
+    def total(self):
+        return self.__total
+
+    def apply(self, event):
+        """
+        Apply one decoded DAO event, as (name, args) in the order the event
+        declares its fields. Events that aren't about coupons are ignored.
+        """
+        (name, args) = event
+        if name == 'CouponPurchase':
+            (account, epoch, dollar_amount, coupon_amount) = args
+            self.purchase(account, epoch, coupon_amount)
+        elif name in ('CouponRedemption', 'CouponAutoRedemption'):
+            (account, epoch, coupon_amount) = args
+            self.redeem(account, epoch, coupon_amount)
+        elif name == 'CouponTransfer':
+            (sender, recipient, epoch, value) = args
+            self.transfer(sender, recipient, epoch, value)
+        elif name == 'CouponExpiration':
+            self.expire(args[0])
+        else:
+            return
+        self.applied += 1
+
+    def purchase(self, account, epoch, amount):
+        """
+        Give account amount coupons expiring at epoch, as a settled bid does.
+        """
+        self.__increment(account, epoch, amount)
+
+    def redeem(self, account, epoch, amount):
+        """
+        Take amount of account's coupons expiring at epoch, as redeeming does.
+        """
+        self.__decrement(account, epoch, amount)
+
+    def transfer(self, sender, recipient, epoch, amount):
+        self.__decrement(sender, epoch, amount)
+        self.__increment(recipient, epoch, amount)
+
+    def expire(self, epoch):
+        """
+        Expire every coupon for epoch. Holders keep them in their
+        outstanding totals, as in the DAO.
+        """
+        outstanding = self.__outstanding.pop(epoch, 0)
+        if outstanding == 0:
+            return
+        self.__total -= outstanding
+        self.__epochs.remove(epoch)
+        for account in self.__holders.pop(epoch, ()):
+            self.__unindex(account, epoch)
+
+    def __increment(self, account, epoch, amount):
+        coupons = self.__coupons.setdefault(account, {})
+        coupons[epoch] = coupons.get(epoch, 0) + amount
+        self.__outstanding_for[account] = self.__outstanding_for.get(account, 0) + amount
+        outstanding = self.__outstanding.get(epoch, 0)
+        self.__outstanding[epoch] = outstanding + amount
+        self.__total += amount
+        if amount == 0:
+            return
+        if outstanding == 0:
+            bisect.insort(self.__epochs, epoch)
+        holders = self.__holders.setdefault(epoch, set())
+        if account not in holders:
+            holders.add(account)
+            bisect.insort(self.__expiries.setdefault(account, []), epoch)
+
+    def __decrement(self, account, epoch, amount):
+        coupons = self.__coupons.get(account, {})
+        left = coupons.get(epoch, 0) - amount
+        if left < 0:
+            raise ValueError("Coupon balance of {} at epoch {} would go negative".format(account, epoch))
+        if left == 0:
+            coupons.pop(epoch, None)
+            holders = self.__holders.get(epoch)
+            if holders is not None and account in holders:
+                holders.discard(account)
+                self.__unindex(account, epoch)
+        else:
+            coupons[epoch] = left
+        self.__outstanding_for[account] = self.__outstanding_for.get(account, 0) - amount
+        outstanding = self.__outstanding.get(epoch, 0) - amount
+        self.__total -= amount
+        if outstanding <= 0:
+            if self.__outstanding.pop(epoch, 0) > 0:
+                self.__epochs.remove(epoch)
+            self.__holders.pop(epoch, None)
+        else:
+            self.__outstanding[epoch] = outstanding
+
+    def __unindex(self, account, epoch):
+        expiries = self.__expiries[account]
+        del expiries[bisect.bisect_left(expiries, epoch)]
+        if not expiries:
+            del self.__expiries[account]
+
+    def outstanding_for(self, account):
+        """
+        Get account's coupons ever assigned and not redeemed or transferred
+        away, expired or not, like outstandingCouponsForAddress.
+        """
+        return self.__outstanding_for.get(getattr(account, 'address', account), 0)
+
+    def outstanding(self, epoch):
+        """
+        Get the unexpired coupons for epoch, like outstandingCoupons.
+        """
+        return self.__outstanding.get(epoch, 0)
+
+    def balance(self, account, epoch):
+        """
+        Get account's coupons for epoch, like balanceOfCoupons: none once
+        the epoch has expired.
+        """
+        if epoch not in self.__outstanding:
+            return 0
+        return self.__coupons.get(getattr(account, 'address', account), {}).get(epoch, 0)
+
+    def expiries(self, account):
+        """
+        Get the expiry epochs account holds unexpired coupons for, earliest
+        first.
+        """
+        return list(self.__expiries.get(getattr(account, 'address', account), ()))
+
+    def redeemable(self, account, total_redeemable):
+        """
+        Get (epoch, coupons) for each of account's unexpired coupon balances,
+        earliest expiry first, for as many as total_redeemable covers in
+        full.
+        """
+        account = getattr(account, 'address', account)
+        coupons = self.__coupons.get(account, {})
+        plan = []
+        for epoch in self.__expiries.get(account, ()):
+            amount = coupons[epoch]
+            if amount > total_redeemable:
+                break
+            plan.append((epoch, amount))
+            total_redeemable -= amount
+        return plan
+
+    def by_expiry(self):
+        """
+        Yield (epoch, address, coupons) for every unexpired coupon balance,
+        earliest expiry first, and by address within an epoch.
+        """
+        for epoch in self.__epochs:
+            for account in sorted(self.__holders.get(epoch, ())):
+                yield (epoch, account, self.__coupons[account][epoch])
+
+    def state(self):
+        """
+        Get the ledger as JSON-able data, for a checkpoint.
+        """
+        return {
+            'coupons': [
+                [account, epoch, amount]
+                for account, coupons in self.__coupons.items()
+                for epoch, amount in coupons.items()
+            ],
+            'outstanding_for': self.__outstanding_for,
+            'outstanding': [[epoch, amount] for epoch, amount in self.__outstanding.items()],
+            'applied': self.applied,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Make a ledger from state(), rebuilding the index.
+        """
+        ledger = cls()
+        for (account, epoch, amount) in state['coupons']:
+            ledger.__coupons.setdefault(account, {})[epoch] = amount
+        ledger.__outstanding_for = dict(state['outstanding_for'])
+        ledger.__outstanding = {epoch: amount for (epoch, amount) in state['outstanding']}
+        ledger.__total = sum(ledger.__outstanding.values())
+        ledger.__epochs = sorted(ledger.__outstanding)
+        for account, coupons in ledger.__coupons.items():
+            for epoch, amount in coupons.items():
+                if amount > 0 and epoch in ledger.__outstanding:
+                    ledger.__holders.setdefault(epoch, set()).add(account)
+                    bisect.insort(ledger.__expiries.setdefault(account, []), epoch)
+        ledger.applied = state.get('applied', 0)
+        return ledger
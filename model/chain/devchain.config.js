@@ -0,0 +1,30 @@
+/**
+ * Hardhat network settings for devchain.py, which runs a Hardhat node as a
+ * stand-in for the local AvalancheGo C-chain. Kept close to what the model
+ * expects of AvalancheGo: chain ID 43112, an 8M gas block limit, pre-London
+ * gas pricing, unlocked funded accounts, and failed transactions that are
+ * mined with status 0 instead of rejected.
+ */
+
+module.exports = {
+  networks: {
+    hardhat: {
+      chainId: 43112,
+      hardfork: "berlin",
+      blockGasLimit: 8000000,
+      gas: 8000000,
+      gasPrice: 225000000000,
+      throwOnTransactionFailures: false,
+      accounts: {
+        count: parseInt(process.env.DEVCHAIN_ACCOUNTS || "40"),
+        // 1M AVAX each, as make_accounts.js seeds them
+        accountsBalance: "1000000000000000000000000"
+      },
+      // Deploys are mined as they come; devchain.py takes over block
+      // building once the contracts are in
+      mining: {
+        auto: true
+      }
+    }
+  }
+};
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+"""
+devchain.py: a stand-in for the local AvalancheGo C-chain, for benchmarks and
+for trying the model without an avalanchego install.
+
+It runs a Hardhat node (from this project's devDependencies, with the
+settings in devchain.config.js) behind a proxy on 127.0.0.1:9545 that serves
+the endpoints model.py, truffle.js and run.sh use: /ext/bc/C/rpc over HTTP,
+/ext/bc/C/ws over a websocket, and /ext/bc/C/avax. The proxy turns the
+AvalancheGo-only methods into their Hardhat equivalents:
+
+    avax.issueBlock       evm_mine
+    debug_increaseTime    evm_increaseTime
+
+and answers JSON-RPC batches one request at a time. Subscriptions
+(newHeads, for receipts.py) go over a websocket to the node.
+
+The contracts are deployed the way run.sh deploys them, with truffle
+migrate, while the node mines every transaction as it comes. After that the
+node stops mining on its own. Like AvalancheGo, the proxy builds a block a
+moment (block_delay) after a transaction arrives, with everything pending,
+or at once on avax.issueBlock.
+
+    ./devchain.py                       # start, deploy, and wait for ^C
+    ./devchain.py --accounts 200
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Where AvalancheGo serves the C-chain
+PORT = 9545
+RPC_PATH = '/ext/bc/C/rpc'
+WS_PATH = '/ext/bc/C/ws'
+AVAX_PATH = '/ext/bc/C/avax'
+# Where the Hardhat node listens, behind the proxy
+HARDHAT_PORT = 8545
+HARDHAT_READY = b'Started HTTP and WebSocket JSON-RPC server'
+CONFIG = './devchain.config.js'
+OUTPUT = './devchain_output.txt'
+DEPLOY_OUTPUT = './deploy_output.txt'
+
+# How far run.sh moves the clock on before deploying (seconds)
+START_CLOCK_ADVANCE = 308501
+
+# AvalancheGo-only methods, and what the Hardhat node does instead
+METHODS = {
+    'avax.issueBlock': 'evm_mine',
+    'debug_increaseTime': 'evm_increaseTime',
+}
+# Methods that put a transaction in the pool
+SEND_METHODS = ('eth_sendTransaction', 'eth_sendRawTransaction')
+SUBSCRIBE_METHODS = ('eth_subscribe', 'eth_unsubscribe')
+
+def translate(request):
+    """
+    Get the request the Hardhat node should see for a JSON-RPC request dict.
+    """
+    method = METHODS.get(request.get('method'))
+    if method is None:
+        return request
+    params = request.get('params')
+    return dict(request, method=method, params=params if isinstance(params, list) else [])
+
+class Proxy:
+    """
+    Serves the AvalancheGo C-chain endpoints from a Hardhat node.
+    """
+
+    def __init__(self, upstream_port=HARDHAT_PORT, port=PORT, block_delay=0.05):
+        """
+        Once build_blocks() is called, a block is built block_delay seconds
+        after a transaction arrives; None builds them only on avax.issueBlock.
+        """
+        self.upstream = 'http://127.0.0.1:{}'.format(upstream_port)
+        self.upstream_ws = 'ws://127.0.0.1:{}'.format(upstream_port)
+        self.port = port
+        self.block_delay = block_delay
+
+        # Counters
+        self.requests = 0
+        self.blocks_built = 0
+
+        self.__ids = itertools.count()
+        self.__loop = None
+        self.__session = None
+        self.__runner = None
+        self.__building = False
+        self.__block_pending = False
+
+    def start(self):
+        """
+        Start serving, on a thread of our own.
+        """
+        ready = threading.Event()
+
+        def serve():
+            self.__loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.__loop)
+            self.__loop.run_until_complete(self.__serve())
+            ready.set()
+            self.__loop.run_forever()
+        threading.Thread(target=serve, name='devchain', daemon=True).start()
+        ready.wait()
+
+    def run(self, coroutine):
+        """
+        Run a coroutine on the proxy's thread, and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
+
+    def stop(self):
+        self.run(self.__close())
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+
+    async def __serve(self):
+        self.__session = aiohttp.ClientSession()
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post(RPC_PATH, self.__http)
+        app.router.add_post(AVAX_PATH, self.__http)
+        app.router.add_get(WS_PATH, self.__websocket)
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, '127.0.0.1', self.port).start()
+
+    async def __close(self):
+        await self.__runner.cleanup()
+        await self.__session.close()
+
+    async def call(self, request):
+        """
+        Pass one JSON-RPC request dict on to the node, and get its response.
+        """
+        self.requests += 1
+        async with self.__session.post(self.upstream, json=translate(request)) as response:
+            result = await response.json(content_type=None)
+        if request.get('method') in SEND_METHODS and 'result' in result:
+            self.__schedule_block()
+        return result
+
+    async def __answer(self, message):
+        if isinstance(message, list):
+            # In order, so transactions in a batch reach the pool in order
+            return [await self.call(request) for request in message]
+        return await self.call(message)
+
+    async def build_blocks(self):
+        """
+        Stop the node mining each transaction as it comes, and build blocks
+        ourselves from here on.
+        """
+        await self.call({'jsonrpc': '2.0', 'id': next(self.__ids), 'method': 'evm_setAutomine', 'params': [False]})
+        self.__building = True
+
+    def __schedule_block(self):
+        if not self.__building or self.block_delay is None or self.__block_pending:
+            return
+        self.__block_pending = True
+        self.__loop.call_later(self.block_delay, lambda: asyncio.ensure_future(self.__build_block()))
+
+    async def __build_block(self):
+        # Transactions arriving while this one is built get a block of their own
+        self.__block_pending = False
+        await self.call({'jsonrpc': '2.0', 'id': next(self.__ids), 'method': 'avax.issueBlock', 'params': {}})
+        self.blocks_built += 1
+
+    async def __http(self, request):
+        message = await request.json()
+        return web.json_response(await self.__answer(message))
+
+    async def __websocket(self, request):
+        client = web.WebSocketResponse(max_msg_size=0)
+        await client.prepare(request)
+        # Subscriptions are the node's to keep, on a connection of their own
+        upstream = None
+        relay = None
+        try:
+            async for message in client:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                body = json.loads(message.data)
+                if isinstance(body, dict) and body.get('method') in SUBSCRIBE_METHODS:
+                    if upstream is None:
+                        upstream = await self.__session.ws_connect(self.upstream_ws, max_msg_size=0)
+                        relay = asyncio.ensure_future(self.__relay(upstream, client))
+                    # The answer comes back through the relay
+                    await upstream.send_str(message.data)
+                    continue
+                await client.send_str(json.dumps(await self.__answer(body)))
+        finally:
+            if relay is not None:
+                relay.cancel()
+                await upstream.close()
+        return client
+
+    async def __relay(self, upstream, client):
+        async for message in upstream:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                await client.send_str(message.data)
+
+class DevChain:
+    """
+    A Hardhat node, and the proxy that makes it look like AvalancheGo.
+    """
+
+    def __init__(self, accounts=40, port=PORT, hardhat_port=HARDHAT_PORT, block_delay=0.05, output=OUTPUT):
+        """
+        accounts is how many funded, unlocked accounts the node has; the
+        model runs one agent per account.
+        """
+        self.accounts = accounts
+        self.port = port
+        self.hardhat_port = hardhat_port
+        self.block_delay = block_delay
+        self.output = output
+        self.proxy = None
+        self.__node = None
+
+    def start(self, timeout=120):
+        """
+        Start the node and the proxy, and move the clock on as run.sh does.
+        """
+        env = dict(os.environ, DEVCHAIN_ACCOUNTS=str(self.accounts))
+        with open(self.output, 'wb') as output:
+            self.__node = subprocess.Popen(
+                ['npx', 'hardhat', 'node', '--config', CONFIG, '--hostname', '127.0.0.1', '--port', str(self.hardhat_port)],
+                stdout=output, stderr=subprocess.STDOUT, env=env
+            )
+        deadline = time.time() + timeout
+        while True:
+            with open(self.output, 'rb') as output:
+                if HARDHAT_READY in output.read():
+                    break
+            if self.__node.poll() is not None:
+                raise RuntimeError("Hardhat node exited; see {}".format(self.output))
+            if time.time() > deadline:
+                self.__node.terminate()
+                raise RuntimeError("Hardhat node didn't start in {} s; see {}".format(timeout, self.output))
+            time.sleep(0.5)
+
+        self.proxy = Proxy(self.hardhat_port, self.port, self.block_delay)
+        self.proxy.start()
+        self.request('debug_increaseTime', [START_CLOCK_ADVANCE])
+        logger.info("Stand-in chain on port {} ({} accounts)".format(self.port, self.accounts))
+
+    def request(self, method, params):
+        """
+        Make a JSON-RPC request through the proxy, and get its result.
+        """
+        response = self.proxy.run(self.proxy.call({'jsonrpc': '2.0', 'id': 0, 'method': method, 'params': params}))
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+    def deploy(self, truffle='truffle'):
+        """
+        Deploy the contracts, as run.sh does, writing deploy_output.txt for
+        model.py. Blocks are built like AvalancheGo builds them from then on.
+        """
+        start = time.time()
+        with open(DEPLOY_OUTPUT, 'wb') as output:
+            subprocess.run([truffle, 'migrate', '--reset', '--skip-dry-run', '--network=development'], stdout=output, stderr=subprocess.STDOUT, check=True)
+        self.proxy.run(self.proxy.build_blocks())
+        logger.info("Deployed in {:.1f} (s)".format(time.time() - start))
+
+    def stop(self):
+        if self.proxy is not None:
+            self.proxy.stop()
+            self.proxy = None
+        if self.__node is not None:
+            self.__node.terminate()
+            self.__node.wait()
+            self.__node = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=40, help="funded accounts on the chain, one per agent")
+    parser.add_argument('--block-delay', type=float, default=0.05, help="seconds after a transaction arrives to build a block")
+    parser.add_argument('--no-deploy', action='store_true', help="don't deploy the contracts")
+    parser.add_argument('--truffle', default='truffle', help="truffle command to deploy with")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with DevChain(args.accounts, block_delay=args.block_delay) as chain:
+        if not args.no_deploy:
+            chain.deploy(args.truffle)
+        logger.info("Ready; ^C to stop")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+economy.py: what the agents do each step, whatever the contracts run on.
+
+Model in model.py steps the agents against the contracts on a chain, and
+SimModel in sim.py against their in-memory stand-ins. Both hold a DAO,
+PangolinPool and TokenProxies (or SimDAO, SimPangolinPool and SimTokens,
+which answer the same calls), and share the deciding, trading and redeeming
+here, so the two can't drift apart.
+"""
+
+import json
+import logging
+import time
+
+import amm
+from balance import Balance, reg_int, portion_dedusted
+from redeem_planner import plan_redemptions, per_block
+
+logger = logging.getLogger(__name__)
+
+class Economy:
+    """
+    Mixin for models of the xSD economy. Subclasses set agents, dao,
+    pangolin, usdt_token, xsd_token, agent_coupons, population, keeper,
+    is_batched_redeem, redemption_stats, has_prev_advanced, the
+    params.MODEL_DEFAULTS limits, and rng (anything with random(), choices()
+    and shuffle(), like the random module), and implement mine() and
+    mine_alone().
+    """
+
+    def mine(self):
+        """
+        Build a block out of everything pending, now.
+        """
+        raise NotImplementedError()
+
+    def mine_alone(self, tx):
+        """
+        Get a transaction, as the DAO or PangolinPool returned it, into a
+        block of its own now. Returns (the transaction, as it should be
+        waited on from then on, its receipt).
+        """
+        raise NotImplementedError()
+
+    def get_overall_faith(self, current_timestamp, price=None):
+        """
+        What target should the system be trying to hit in xSD market cap?
+        """
+        if price is None:
+            price = self.pangolin.xsd_price()
+        return self.agents[0].get_faith(current_timestamp, price, self.dao.xsd_supply())
+
+    def log(self, stream, seleted_advancer, current_timestamp, header=False):
+        """
+        Log model statistics a TSV line.
+        If header is True, include a header.
+        """
+
+        if header:
+            stream.write("#block\tepoch\tprice\tsupply\tcoupons\ttotal_redeemable\tlp_supply\tfaith\n")
+
+        snapshot = self.snapshot(seleted_advancer.address, with_agents=False)
+        xsd_supply = snapshot['xsd_supply']
+
+        stream.write('{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\n'.format(
+                snapshot['block'],
+                snapshot['epoch'],
+                snapshot['price'],
+                xsd_supply,
+                snapshot['total_coupons'],
+                snapshot['total_redeemable'],
+                float(snapshot['xsd_b']) / float(xsd_supply) * 100 if xsd_supply > 0 else 0.0,
+                self.get_overall_faith(current_timestamp, snapshot['price'])
+            )
+        )
+
+    def pick_advancer(self):
+        """
+        Randomly pick the agent to advance the epoch.
+        """
+        return self.agents[int(self.rng.random() * (len(self.agents) - 1))]
+
+    def decide(self, a, current_timestamp, dao_xsd_supply, total_coupons, usdt_b, is_pgl_op):
+        """
+        Pick one agent's action for the step, when not deciding for everyone
+        at once.
+
+        Returns (action, or None if the agent can't act, commitment).
+        """
+        # TODO: real strategy
+        options = []
+        commitment = self.rng.random() * 0.1
+
+        if portion_dedusted(a.usdt, commitment) > 0 and is_pgl_op:
+            options.append("buy")
+        if portion_dedusted(a.xsd, commitment) > 0 and is_pgl_op:
+            options.append("sell")
+        '''
+        TODO: CURRENTLY NO INCENTIVE TO BOND INTO LP OR DAO (EXCEPT FOR VOTING, MAY USE THIS TO DISTRUBTION EXPANSIONARY PROFITS)
+        if a.xsd > 0:
+            options.append("bond")
+        if a.xsds > 0:
+            options.append("unbond")
+        if a.coupons > 0 and epoch_start_price > 1.0:
+            options.append("redeem")
+        '''
+        if usdt_b >= self.min_usdt_balance and portion_dedusted(a.xsd, commitment) >= Balance.from_tokens(1, self.xsd_token.decimals) and self.dao.has_coupon_bid():
+            options.append("coupon_bid")
+        if portion_dedusted(a.usdt, commitment) > 0 and portion_dedusted(a.xsd, commitment) > 0:
+            options.append("provide_liquidity")
+        if a.lp > 0:
+            options.append("remove_liquidity")
+
+        if len(options) == 0:
+            return (None, commitment)
+
+        strategy = a.get_strategy(current_timestamp, self.pangolin.xsd_price(), dao_xsd_supply, total_coupons, self.agent_coupons[a.address])
+        weights = [strategy[o] for o in options]
+        return (self.rng.choices(options, weights=weights)[0], commitment)
+
+    def redeem(self, total_redeemable):
+        """
+        Pay out total_redeemable (in atomic units) to agents' coupons, as one
+        plan if is_batched_redeem and the DAO keeps a coupon ledger, or agent
+        by agent otherwise, and count it in redemption_stats.
+
+        Returns (transaction, coupons) for each redemption sent.
+        """
+        redeem_start = time.time()
+        if self.is_batched_redeem and self.dao.coupon_ledger is not None:
+            (redemptions, blocks) = self.redeem_planned(total_redeemable)
+        else:
+            (redemptions, blocks) = self.redeem_by_agent()
+        self.redemption_stats.record(len(redemptions), blocks, time.time() - redeem_start)
+        return redemptions
+
+    def redeem_by_agent(self):
+        """
+        Redeem agent by agent, in the shuffled order: each agent whose
+        coupons all fit in what is redeemable redeems every expiry it
+        holds, a block each.
+
+        Returns (transaction, coupons) for each redemption, and how many
+        blocks were built.
+        """
+        redemptions = []
+        blocks = 0
+        for agent_num, a in enumerate(self.agents):
+            tr = self.dao.total_redeemable(a.address).to_wei()
+            if tr == 0:
+                break
+
+            if self.agent_coupons[a.address] > 0 and tr >= self.agent_coupons[a.address]:
+                self.dao.get_coupon_expirirations(a)
+                if len(a.coupon_expirys) == 0:
+                    #logger.info("ERROR WITH EXIPRIATION LIST")
+                    continue
+                else:
+                    # if agent has coupons
+                    logger.info("COUPON EXP: Agent {}, exp_epochs: {}".format(a.address, json.dumps(a.coupon_expirys)))
+
+                    a.redeem_count += 1
+                    for c_idx, c_exp in enumerate(a.coupon_expirys):
+                        try:
+                            coupons = self.dao.coupon_balance_at_epoch(a.address, c_exp)
+                            redeem_tx = self.dao.redeem(a, c_exp)
+                            self.mine()
+                            blocks += 1
+                            if redeem_tx is not None:
+                                redemptions.append((redeem_tx, coupons))
+                        except Exception as inst:
+                            logger.info({"agent": a.address, "error": inst, "action": "redeem", "exact_expiry": c_exp})
+        return redemptions, blocks
+
+    def redeem_planned(self, total_redeemable):
+        """
+        Pay out total_redeemable (in atomic units) to agents' coupons,
+        earliest expiry first, with the keeper sending every redemption on
+        consecutive nonces and a block built per block's worth.
+
+        Returns (transaction, coupons) for each redemption, and how many
+        blocks were built.
+        """
+        by_address = {a.address: a for a in self.agents}
+        plan = plan_redemptions(self.dao.coupon_ledger, total_redeemable, by_address)
+        batch = per_block()
+        redemptions = []
+        blocks = 0
+        for (epoch, address, coupons) in plan:
+            try:
+                redeem_tx = self.dao.redeem_for_account(self.keeper, address, epoch, coupons)
+            except Exception as inst:
+                logger.info({"agent": address, "error": inst, "action": "redeem", "exact_expiry": epoch})
+                continue
+            redemptions.append((redeem_tx, coupons))
+            if len(redemptions) % batch == 0:
+                self.mine()
+                blocks += 1
+        if len(redemptions) % batch != 0:
+            self.mine()
+            blocks += 1
+
+        for address in set(address for (_, address, _) in plan):
+            by_address[address].redeem_count += 1
+        if plan:
+            logger.info("Redeeming {} coupons in {} transactions from {} over {} blocks".format(
+                sum(coupons for (_, _, coupons) in plan), len(redemptions), self.keeper.address, blocks))
+        return redemptions, blocks
+
+    def decide_all(self, current_timestamp, dao_xsd_supply, usdt_b, is_pgl_op):
+        """
+        Decide for everyone at once, if we have a Population. Returns
+        (action, commitment, expiry draw, premium draw) per agent, in order,
+        or None to decide agent by agent.
+        """
+        if self.population is None:
+            return None
+        # From the ledgers update() brought up to date, as decide() sees them
+        self.population.load(
+            {a.address: a.usdt for a in self.agents},
+            {a.address: a.xsd for a in self.agents},
+            {a.address: a.lp for a in self.agents},
+            self.agent_coupons
+        )
+        return self.population.actions(self.population.decide(
+            [a.address for a in self.agents],
+            current_timestamp,
+            self.pangolin.xsd_price(),
+            dao_xsd_supply,
+            is_pgl_op,
+            usdt_b >= self.min_usdt_balance and self.dao.has_coupon_bid()
+        ))
+
+    def act(self, snapshot, current_timestamp, seleted_advancer):
+        """
+        Have every agent, in order, decide on and send its action for the
+        step, from a snapshot() taken after the advance.
+
+        Returns (True if anyone could act, (type, transaction) for each
+        transaction sent).
+        """
+        xsd_decimals = self.xsd_token.decimals
+        usdt_decimals = self.usdt_token.decimals
+        revs = snapshot['reserves']
+        usdt_b = snapshot['usdt_b']
+        current_epoch = snapshot['epoch']
+        epoch_start_price = snapshot['price']
+        dao_xsd_supply = snapshot['xsd_supply']
+        total_coupons = snapshot['total_coupons']
+        is_pgl_op = self.pangolin.operational(revs)
+
+        anyone_acted = False
+        txs = []
+        decisions = self.decide_all(current_timestamp, dao_xsd_supply, usdt_b, is_pgl_op)
+
+        for agent_num, a in enumerate(self.agents):
+            if decisions is not None:
+                (action, commitment, expiry_draw, premium_draw) = decisions[agent_num]
+            else:
+                (action, commitment) = self.decide(a, current_timestamp, dao_xsd_supply, total_coupons, usdt_b, is_pgl_op)
+
+            if action is not None:
+                # We can act
+
+                '''
+                    TODO:
+                        bond, unbond
+
+                    TOTEST:
+                        bond, unbond
+                    WORKS:
+                        advance, provide_liquidity, remove_liquidity, buy, sell, coupon_bid, redeem,
+                '''
+
+                # What fraction of the total possible amount of doing this
+                # action will the agent do?
+
+                if action == "buy":
+                    # this will limit the size of orders avaialble
+                    (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
+                    if xsd_b > 0 and usdt_b > 0:
+                        usdt_in = portion_dedusted(
+                            min(a.usdt, xsd_b.to_decimals(usdt_decimals)),
+                            commitment
+                        )
+                    else:
+                        continue
+
+                    try:
+                        (max_amount, _) = self.pangolin.getAmountsIn(
+                            a,
+                            usdt_in.to_wei(),
+                            [self.usdt_token.address, self.xsd_token.address]
+                        )
+
+                        if max_amount == 1:
+                            normed_max_out =  (usdt_in * epoch_start_price)
+                            max_amount = normed_max_out.to_decimals(xsd_decimals)
+
+                    except Exception as inst:
+                        # not enough on market to fill bid
+                        logger.info({"agent": a.address, "error": inst, "action": "buy", "amount_in": usdt_in})
+                        continue
+
+                    try:
+                        #logger.info("Buy init {:.2f} xSD @ {:.2f} for {:.2f} USDT".format(usdt_in, epoch_start_price, max_amount))
+                        txs.append(('buy', self.pangolin.buy(a, usdt_in, max_amount, current_timestamp)))
+                    except Exception as inst:
+                        logger.info({"agent": a.address, "error": inst, "action": "buy", "usdt_in": usdt_in, "max_amount": max_amount})
+                        continue
+                elif action == "sell":
+                    # this will limit the size of orders avaialble
+                    (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
+                    if xsd_b > 0 and usdt_b > 0:
+                        xsd_out = min(
+                            portion_dedusted(
+                                a.xsd,
+                                commitment
+                            ),
+                            usdt_b.to_decimals(xsd_decimals)
+                        )
+                    else:
+                        continue
+
+                    # Without a quote, the sell fails below and is logged
+                    max_amount = None
+                    try:
+                        (_, max_amount) = self.pangolin.getAmountsOut(
+                            a,
+                            xsd_out.to_wei(),
+                            [self.xsd_token.address, self.usdt_token.address]
+                        )
+
+                        max_amount = reg_int(max_amount, usdt_decimals)
+                    except Exception as inst:
+                        logger.info({"agent": a.address, "error": inst, "action": "sell", "amount_out": xsd_out})
+
+                    try:
+                        #logger.info("Sell init {:.2f} xSD @ {:.2f} for {:.2f} USDT".format(xsd_out, epoch_start_price, max_amount))
+                        txs.append(('sell', self.pangolin.sell(a, xsd_out, max_amount, seleted_advancer, usdt_b.to_decimals(xsd_decimals), current_timestamp)))
+                    except Exception as inst:
+                        logger.info({"agent": a.address, "error": inst, "action": "sell", "xsd_out": xsd_out, "max_amount": max_amount, "account_xsd": a.xsd})
+                elif action == "coupon_bid":
+                    '''
+                        TODO: NEED TO FIGURE OUT BETTER WAY TO TRACK THIS?
+                    '''
+                    xsd_at_risk = max(Balance.from_tokens(1, 18), portion_dedusted(a.xsd, commitment))
+                    if decisions is None:
+                        expiry_draw = self.rng.random()
+                        premium_draw = self.rng.random()
+                    rand_epoch_expiry = int(expiry_draw * self.max_coupon_exp)
+                    rand_max_coupons =  round(max(1.01, min(premium_draw * self.max_coupon_premium, self.max_coupon_premium)) * xsd_at_risk)
+
+                    #rand_max_coupons =  round(max(1.01, min(random.random() + 1.0, self.max_coupon_premium)) * xsd_at_risk)
+                    #rand_max_coupons =  round(max(1.01, int(math.floor(self.max_coupon_premium))) * xsd_at_risk)
+
+
+                    if rand_max_coupons < xsd_at_risk:
+                        xsd_at_risk = rand_max_coupons
+                    exact_expiry = rand_epoch_expiry + current_epoch
+                    try:
+                        #logger.info("Addr {} Bid to burn init {:.2f} xSD for {:.2f} coupons with expiry at epoch {}".format(a.address, xsd_at_risk, rand_max_coupons, exact_expiry))
+                        coupon_bid_tx = self.dao.coupon_bid(a, rand_epoch_expiry, xsd_at_risk, rand_max_coupons)
+
+                        #if (latest_valid == True):
+                        if (self.has_prev_advanced == False):
+                            # The bid may advance the epoch, so it goes in a block of its own
+                            (coupon_bid_tx, coup_adv_recp) = self.mine_alone(coupon_bid_tx)
+                            self.has_prev_advanced = coup_adv_recp["status"] == 1
+                            logger.info("Coupon Advance from {}, is_advance_fail: {}".format(a.address, not self.has_prev_advanced))
+
+                        txs.append(('coupon_bid', coupon_bid_tx))
+                        self.agent_coupons[a.address] = a.coupons
+                        #logger.info("Addr {} Bid to burn end {:.2f} xSD for {:.2f} coupons with expiry at epoch {}".format(a.address, xsd_at_risk, rand_max_coupons, exact_expiry))
+                    except Exception as inst:
+                        logger.info({"agent": a.address, "error": inst, "action": "coupon_bid", "exact_expiry": exact_expiry, "xsd_at_risk": xsd_at_risk})
+                elif action == "provide_liquidity":
+                    min_xsd_needed = Balance(0, xsd_decimals)
+                    usdt = Balance(0, usdt_decimals)
+                    if float(a.xsd) < float(a.usdt):
+                        usdt = portion_dedusted(a.xsd.to_decimals(usdt_decimals), commitment)
+                    else:
+                        usdt = portion_dedusted(a.usdt, commitment)
+
+                    try:
+                        if revs[1] > 0:
+                            min_xsd_needed = reg_int(
+                                amm.quote(usdt.to_wei(), revs[0], revs[1]),
+                                xsd_decimals
+                            )
+                            if min_xsd_needed == 0:
+                                min_xsd_needed = (usdt / float(epoch_start_price)).to_decimals(xsd_decimals)
+                        else:
+                            min_xsd_needed = usdt.to_decimals(xsd_decimals)
+
+                        if min_xsd_needed == 0:
+                            continue
+
+                        #logger.info("Provide {:.2f} xSD (of {:.2f} xSD) and {:.2f} USDT".format(min_xsd_needed, a.xsd, usdt))
+                        txs.append(('provide_liquidity', self.pangolin.provide_liquidity(a, min_xsd_needed, usdt, current_timestamp)))
+                    except Exception as inst:
+                        # SLENCE TRANSFER_FROM_FAILED ISSUES
+                        #logger.info({"agent": a.address, "error": inst, "action": "provide_liquidity", "min_xsd_needed": min_xsd_needed, "usdt": usdt})
+                        continue
+                elif action == "remove_liquidity":
+                    (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
+                    lp = portion_dedusted(a.lp, commitment)
+                    total_lp = self.pangolin.total_lp(a)
+                    min_xsd_amount = max(Balance(0, xsd_decimals), Balance(float(xsd_b) * float(lp / float(total_lp)), xsd_decimals))
+                    min_usdt_amount = max(Balance(0, usdt_decimals), Balance(float(usdt_b) * float(lp / float(total_lp)), usdt_decimals))
+
+                    if not (min_xsd_amount > 0 and min_usdt_amount > 0):
+                        continue
+
+                    try:
+                        #logger.info("Stop providing {:.2f} xSD and {:.2f} USDT".format(min_xsd_amount, min_usdt_amount))
+                        txs.append(('remove_liquidity', self.pangolin.remove_liquidity(a, lp, min_xsd_amount, min_usdt_amount, current_timestamp)))
+                    except Exception as inst:
+                        logger.info({"agent": a.address, "error": inst, "action": "remove_liquidity", "min_xsd_needed": min_xsd_amount, "usdt": min_usdt_amount})
+                else:
+                    raise RuntimeError("Bad action: " + action)
+
+                anyone_acted = True
+            else:
+                # It's normal for agents other then the first to advance to not be able to act on block 0.
+                pass
+
+        return anyone_acted, txs
@@ -0,0 +1,145 @@
+"""
+log_ingest.py: read a contract's event logs over a long block range in bulk.
+
+A filter only sees events from when it was made, and one eth_getLogs over the
+whole history of a busy chain can be more than the node will answer at once.
+fetch_logs() cuts the range into chunks of blocks, asks for several chunks
+at a time in one JSON-RPC batch, fetches the next batch while the caller
+works through the last one, and hands back the logs in chain order. A chunk
+the node refuses (too many results, or too many blocks) is split in half and
+asked for again.
+"""
+
+import concurrent.futures
+import itertools
+import logging
+
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+from call_plans import intern_address
+from rpc_batch import make_batch_request
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC ids for our requests
+_request_ids = itertools.count()
+
+# topic0 of ERC20 Transfer(address indexed from, address indexed to, uint256 value)
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+
+# The DAO's coupon events, by name: (signature, how many fields are indexed)
+COUPON_EVENTS = {
+    'CouponPurchase': ('CouponPurchase(address,uint256,uint256,uint256)', 2),
+    'CouponRedemption': ('CouponRedemption(address,uint256,uint256)', 2),
+    'CouponAutoRedemption': ('CouponAutoRedemption(address,uint256,uint256)', 2),
+    'CouponTransfer': ('CouponTransfer(address,address,uint256,uint256)', 3),
+    'CouponExpiration': ('CouponExpiration(uint256,uint256,uint256,uint256,uint256)', 1),
+}
+# This maps from topic0 bytes to (event name, signature, indexed fields)
+_coupon_events_by_topic = {
+    keccak(text=signature): (name, signature, indexed)
+    for name, (signature, indexed) in COUPON_EVENTS.items()
+}
+# topic0s of all the coupon events, for one filter that matches any of them
+COUPON_TOPICS = ['0x' + topic.hex() for topic in _coupon_events_by_topic]
+
+def chunk_ranges(from_block, to_block, chunk_blocks):
+    """
+    Cut the inclusive block range into inclusive (start, end) chunks.
+    """
+    return [
+        (start, min(start + chunk_blocks - 1, to_block))
+        for start in range(from_block, to_block + 1, chunk_blocks)
+    ]
+
+def _request(address, topics, start, end):
+    return {
+        'jsonrpc': '2.0',
+        'id': next(_request_ids),
+        'method': 'eth_getLogs',
+        'params': [{
+            'address': address,
+            'topics': topics,
+            'fromBlock': hex(start),
+            'toBlock': hex(end),
+        }],
+    }
+
+def _fetch_batch(provider, address, topics, chunks):
+    """
+    Get the logs for each chunk, asking for all of them in one batch and
+    splitting any the node refuses. Returns a list of log lists, one per
+    chunk, in order.
+    """
+    responses = make_batch_request(provider, [_request(address, topics, start, end) for (start, end) in chunks])
+    results = []
+    for (start, end), response in zip(chunks, responses):
+        if 'error' not in response:
+            results.append(response['result'])
+        elif start == end:
+            raise ValueError("eth_getLogs failed for block {}: {}".format(start, response['error']))
+        else:
+            middle = (start + end) // 2
+            logger.info("Splitting logs for blocks {}-{}: {}".format(start, end, response['error']))
+            halves = _fetch_batch(provider, address, topics, [(start, middle), (middle + 1, end)])
+            results.append(halves[0] + halves[1])
+    return results
+
+def fetch_logs(provider, address, topics, from_block, to_block, chunk_blocks=2000, parallel=8):
+    """
+    Yield the raw log dicts for the contract at address matching topics,
+    from from_block through to_block, in chain order.
+
+    Each batch request asks for up to parallel chunks of chunk_blocks
+    blocks. The next batch is fetched in the background while the logs of
+    the last one are being consumed; only one request is in flight at a
+    time, so this is safe on the shared websocket.
+    """
+    chunks = chunk_ranges(from_block, to_block, chunk_blocks)
+    batches = [chunks[i:i + parallel] for i in range(0, len(chunks), parallel)]
+    if not batches:
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(_fetch_batch, provider, address, topics, batches[0])
+        for i in range(len(batches)):
+            results = pending.result()
+            if i + 1 < len(batches):
+                pending = executor.submit(_fetch_batch, provider, address, topics, batches[i + 1])
+            for logs in results:
+                # Nodes return a chunk's logs in order, but don't trust it
+                logs.sort(key=lambda log: (int(log['blockNumber'], 16), int(log['logIndex'], 16)))
+                yield from logs
+
+def _topic_address(topic):
+    return intern_address('0x' + topic[-40:])
+
+def _field(kind, word):
+    # One ABI-encoded static field, from a 32-byte word
+    if kind == 'address':
+        return intern_address('0x' + word[-20:].hex())
+    return int.from_bytes(word, 'big')
+
+def decode_transfer(log):
+    """
+    Get (from, to, value) out of a raw Transfer log, with checksummed
+    addresses like web3py's event decoding gives.
+    """
+    topics = log['topics']
+    return (_topic_address(topics[1]), _topic_address(topics[2]), int.from_bytes(HexBytes(log['data']), 'big'))
+
+def decode_coupon_event(log):
+    """
+    Get (event name, args) out of a raw DAO coupon event log, with args in
+    the order the event declares them, or None for any other log. Takes the
+    raw dicts fetch_logs() gives, or the ones a web3py filter gives.
+    """
+    topics = [bytes(HexBytes(topic)) for topic in log['topics']]
+    if not topics or topics[0] not in _coupon_events_by_topic:
+        return None
+    (name, signature, indexed) = _coupon_events_by_topic[topics[0]]
+    kinds = signature[signature.index('(') + 1:-1].split(',')
+    data = bytes(HexBytes(log['data']))
+    words = topics[1:1 + indexed] + [data[i:i + 32] for i in range(0, len(data), 32)]
+    return (name, tuple(_field(kind, word) for kind, word in zip(kinds, words)))
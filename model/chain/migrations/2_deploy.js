@@ -7,6 +7,7 @@ const Implementation = artifacts.require("Implementation");
 const Root = artifacts.require("Root");
 const TestnetUSDT = artifacts.require("TestnetUSDT");
 const Constants = artifacts.require("Constants");
+const Multicall = artifacts.require("Multicall");
 
 const PangolinFactoryBytecode = require('@pangolindex/exchange-contracts/artifacts/contracts/pangolin-core/PangolinFactory.sol/PangolinFactory.json').bytecode
 const PangolinRouter02Bytecode = require('@pangolindex/exchange-contracts/artifacts/contracts/pangolin-periphery/PangolinRouter.sol/PangolinRouter.json').bytecode;
@@ -90,6 +91,10 @@ async function deployTestnet(deployer, network, accounts) {
   const implementation = await deployer.deploy(Implementation);
   console.log('Implement current Implementation');
   await rootAsD3.implement(implementation.address);
+
+  console.log('Deploy Multicall');
+  const multicall = await deployer.deploy(Multicall);
+  console.log('Multicall is at: ' + multicall.address);
 }
 
 module.exports = function(deployer, network, accounts) {
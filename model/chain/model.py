@@ -4,6 +4,7 @@
 model.py: agent-based model of xSD system behavior, against a testnet
 """
 
+import argparse
 import json
 import collections
 import random
@@ -12,29 +13,130 @@ import logging
 import time
 import sys
 import os
-import base64
-import mmap
-from eth_abi import encode_single, decode_single
+import resource
 from web3 import Web3
+from web3._utils.events import event_abi_to_log_topic
+
+import amm
+from balance import Balance, reg_int, unreg_int
+from strategy import Strategy
+from economy import Economy
+from nonces import NonceTable
+from rpc_batch import RPCBatch, make_batch_request
+from multicall import Multicall
+from view_cache import ViewCache
+from async_submit import AsyncSubmitter, PendingTx
+from receipts import ReceiptCollector
+from signer import SignerPool, load_keys
+from call_plans import ContractPlans, intern_address
+from population import Population
+from log_ingest import TRANSFER_TOPIC, COUPON_TOPICS, fetch_logs, decode_transfer, decode_coupon_event
+from pending_ledger import PendingLedger
+from coupon_ledger import CouponLedger
+from redeem_planner import REDEEM_FOR_ACCOUNT_GAS, RedemptionStats
+from params import model_params
+from run_log import RunLogWriter
+from rpc_trace import RPCTracer, install as install_rpc_tracer
+import checkpoint
 
 IS_DEBUG = False
 is_try_model_mine = False
+# Send each step's agent transactions concurrently over the async provider
+is_async_step = False
+# Sign agent transactions ourselves, with keys from AGENT_KEYS, instead of on the node.
+# Only is_async_step signs a step's transactions across cores; otherwise each
+# one is signed in this process as it's sent
+is_local_signing = False
 max_accounts = 40
-block_offset = 18 + max_accounts
-tx_pool_latency = 0.01
+# Blocks the deploy makes (including the Multicall) plus one per sim account
+block_offset = 19 + max_accounts
+# How often to look for receipts without a newHeads subscription (seconds)
+receipt_poll_interval = 0.01
+# Longest we trust a cached chain head before checking it again (seconds)
+view_cache_ttl = 1.0
+# Steps between checkpoints of the model state, 0 for none
+checkpoint_interval = 100
+# Decide every agent's action in one vectorized pass (population.py) instead of agent by agent
+is_vector_decisions = True
+# Seed for the vectorized decisions' Generator, None for fresh entropy
+decision_seed = None
+# Rebuild token ledgers from every Transfer log instead of polling balanceOf per holder
+is_full_ledger = True
+# Blocks per eth_getLogs request, and requests per batch, when reading logs in bulk
+log_chunk_blocks = 2000
+log_parallel_chunks = 8
+# Show agents their balances with their own in-flight transactions applied
+is_pending_overlay = True
+# Keep everyone's coupons from the DAO's coupon events instead of reading them per agent
+is_coupon_index = True
+# Redeem coupons as one plan sent by a keeper account (redeem_planner.py) instead of agent by agent
+is_batched_redeem = True
+# Address of the keeper that sends planned redemptions, None for the first agent
+redeem_keeper = None
+# Log each step's metrics to a binary run log (run_log.py) instead of log.tsv
+is_run_log = True
+# Count and time every JSON-RPC call (rpc_trace.py) by method, call site and step phase
+is_rpc_trace = True
+# Most RPC calls a step should make, by method, site or phase name, or '*' for all; steps over are warned about
+rpc_call_budgets = {}
 
 DEADLINE_FROM_NOW = 60 * 60 * 24 * 7 * 52
 UINT256_MAX = 2**256 - 1
 ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
 MMAP_FILE = '/tmp/avax-cchain-nonces'
+CHECKPOINT_FILE = './checkpoint.json'
+RUN_LOG_FILE = './log.bin'
+ASYNC_RPC_URI = 'http://127.0.0.1:9545/ext/bc/C/rpc'
+# JSON file of {address: private key}, or a keystore directory (password '')
+AGENT_KEYS = './agent_keys.json'
+
+# Kinds of agent transaction, as tx_hashes records them
+TX_TYPES = ['buy', 'sell', 'coupon_bid', 'provide_liquidity', 'remove_liquidity', 'redeem']
+
+# Columns of the run log, filled from Model.metrics
+RUN_LOG_COLUMNS = [
+    ('block', 'u8'),
+    ('epoch', 'u8'),
+    ('timestamp', 'u8'),
+    ('price', 'f8'),
+    ('oracle_price', 'f8'),
+    ('oracle_valid', 'u1'),
+    ('supply', 'f8'),
+    ('coupons', 'f8'),
+    ('total_redeemable', 'f8'),
+    ('lp_supply', 'f8'),
+    ('faith', 'f8'),
+    ('liquidity_xsd', 'f8'),
+    ('liquidity_usdt', 'f8'),
+    ('earliest_active_auction', 'u8'),
+    ('advance_ok', 'u1'),
+    ('advance_seconds', 'f8'),
+    ('step_seconds', 'f8'),
+    ('tx', 'u4'),
+    ('tx_ok', 'u4'),
+    ('tx_unsent', 'u4'),
+] + [('fail_' + tx_type, 'u4') for tx_type in TX_TYPES] + [
+    ('coupon_bidders', 'u4'),
+    ('redemptions', 'u4'),
+    ('rpc_calls', 'u4'),
+    ('rpc_requests', 'u4'),
+    ('rpc_bytes', 'u8'),
+    ('rpc_seconds', 'f8'),
+]
 
 deploy_data = None
 with open("deploy_output.txt", 'r+') as f:
     deploy_data = f.read()
 
 logger = logging.getLogger(__name__)
+
+# SignerPool for is_local_signing. Its workers fork here, before the websocket
+# provider below starts web3's event loop thread.
+transaction_signer = SignerPool(load_keys(AGENT_KEYS)) if is_local_signing else None
+
 #provider = Web3.HTTPProvider('http://127.0.0.1:7545/ext/bc/C/rpc', request_kwargs={"timeout": 60*300})
-provider = Web3.WebsocketProvider('ws://127.0.0.1:9545/ext/bc/C/ws', websocket_timeout=60*300)
+WS_URI = 'ws://127.0.0.1:9545/ext/bc/C/ws'
+provider = Web3.WebsocketProvider(WS_URI, websocket_timeout=60*300)
 
 '''
 curl -X POST --data '{ "jsonrpc":"2.0", "id" :1, "method" :"platform.incrementTimeTx", "params" :{ "time": 10000 }}' -H 'content-type:application/json;' http://127.0.0.1:9545/ext/P
@@ -42,6 +144,13 @@ curl -X POST --data '{ "jsonrpc":"2.0", "id" :1, "method" :"platform.incrementTi
 curl -X POST --data '{ "jsonrpc":"2.0", "id" :1, "method" :"evm.increaseTime", "params" : [0]}' -H 'content-type:application/json;' http://127.0.0.1:9545/ext/bc/C/rpc
 '''
 providerAvax = Web3.HTTPProvider('http://127.0.0.1:9545/ext/bc/C/avax', request_kwargs={"timeout": 60*300})
+
+# Counts every call on both providers; sites are registered once the classes exist
+rpc_tracer = RPCTracer(rpc_call_budgets)
+if is_rpc_trace:
+    install_rpc_tracer(provider, rpc_tracer)
+    install_rpc_tracer(providerAvax, rpc_tracer)
+
 w3 = Web3(provider)
 from web3.middleware import geth_poa_middleware
 w3.middleware_onion.inject(geth_poa_middleware, layer=0)
@@ -81,11 +190,22 @@ PGLRouter = {
     "deploy_slug": "PangolinRouter is at: "
 }
 
+#Multicall is at: 
+MULTICALL = {
+    "addr": "",
+    "deploy_slug": "Multicall is at: "
+}
+
 for contract in [PGL, USDT, PGLLP, PGLRouter]:
     logger.info(contract["deploy_slug"])
     contract["addr"] = deploy_data.split(contract["deploy_slug"])[1].split('\n')[0]
     logger.info('\t'+contract["addr"])
 
+if MULTICALL["deploy_slug"] in deploy_data:
+    # Older (SAVE_STATE) chains were deployed without one
+    MULTICALL["addr"] = deploy_data.split(MULTICALL["deploy_slug"])[1].split('\n')[0]
+    logger.info(MULTICALL["deploy_slug"] + MULTICALL["addr"])
+
 
 # dao (from Deploy current Implementation on testnet)
 xSD = {
@@ -101,8 +221,6 @@ xSDS = {
   "symbol": 'xSDS',
 }
 
-AGENT_NONCES = {}
-
 DaoContract = json.loads(open('./build/contracts/Implementation.json', 'r+').read())
 USDTContract = json.loads(open('./build/contracts/TestnetUSDT.json', 'r+').read())
 # Use the full Dollar ABI so we can interrogate the token for metadata
@@ -113,6 +231,11 @@ PangolinRouterAbiContract = json.loads(open('./node_modules/@pangolindex/exchang
 TokenContract = json.loads(open('./build/contracts/Root.json', 'r+').read())
 PoolContract = json.loads(open('./build/contracts/Pool.json', 'r+').read())
 OracleContract = json.loads(open('./build/contracts/MockOracle.json', 'r+').read())
+# Only chains deployed with a Multicall have its artifact
+MulticallContract = None
+if MULTICALL["addr"]:
+    with open('./build/contracts/Multicall.json', 'r') as f:
+        MulticallContract = json.loads(f.read())
 
 def get_addr_from_contract(contract):
     return contract["networks"][str(sorted(map(int,contract["networks"].keys()))[0])]["address"]
@@ -121,126 +244,170 @@ xSD['addr'] = get_addr_from_contract(DaoContract)
 xSDS['addr'] = get_addr_from_contract(TokenContract)
 
 
-avax_cchain_nonces = None
-mm = None
-
-def lock_nonce(agent):
-    global mm
-    # DECODE START
-    if not mm:
-        mm = mmap.mmap(avax_cchain_nonces.fileno(), 0)
+# Shared NonceTable, opened in main()
+nonce_table = None
 
-    mm.seek(0)
-    raw_data_cov = mm.read().decode('utf8')
-    nonce_data = json.loads(raw_data_cov)
+# AsyncSubmitter for is_async_step, made in main()
+transaction_submitter = None
 
-    nonce_data['locked'] = '1'
-    out_data = bytes(json.dumps(nonce_data), 'utf8')
-    mm[:] = out_data
+# Block-scoped cache for contract view calls
+view_cache = ViewCache(w3, head_ttl=view_cache_ttl)
 
-def get_nonce(agent):
-    global mm
-    # DECODE START
-    if not mm:
-        mm = mmap.mmap(avax_cchain_nonces.fileno(), 0)
+# Waits for receipts in bulk, woken by newHeads
+receipt_collector = ReceiptCollector(provider, WS_URI, poll_interval=receipt_poll_interval)
 
-    mm.seek(0)
-    raw_data_cov = mm.read().decode('utf8')
-    nonce_data = json.loads(raw_data_cov)
-    current_block = int(w3.eth.get_block('latest')["number"])
+# Expected effects of agents' transactions the token ledgers haven't seen yet
+pending_ledger = PendingLedger()
 
-    while nonce_data['locked'] == '1':
-        mm.seek(0)
-        raw_data_cov = mm.read().decode('utf8')
-        nonce_data = json.loads(raw_data_cov)
-        mm.seek(0)
-        continue
-
-    # locked == '1', unlocked == '0'
-    
-    nonce_data[agent.address]["seen_block"] = decode_single('uint256', base64.b64decode(nonce_data[agent.address]["seen_block"]))
-    nonce_data[agent.address]["next_tx_count"] = decode_single('uint256', base64.b64decode(nonce_data[agent.address]["next_tx_count"]))
-    # DECODE END
-
-    if current_block != nonce_data[agent.address]["seen_block"]:
-        if (nonce_data[agent.address]["seen_block"] == 0):
-            nonce_data[agent.address]["seen_block"] = current_block
-            nonce_data[agent.address]["next_tx_count"] = agent.next_tx_count
-        else:
-            nonce_data[agent.address]["seen_block"] = current_block
-            nonce_data[agent.address]["next_tx_count"] = agent.next_tx_count
-            nonce_data[agent.address]["next_tx_count"] += 1
-            agent.next_tx_count = nonce_data[agent.address]["next_tx_count"]
-    else:
-        nonce_data[agent.address]["next_tx_count"] = agent.next_tx_count
-        nonce_data[agent.address]["next_tx_count"] += 1
-        agent.next_tx_count = nonce_data[agent.address]["next_tx_count"]
+def expect_effects(tx_hash, effects):
+    """
+    Record the expected (token, holder, Balance change) effects of a
+    transaction from transaction_helper(), if we are overlaying them.
+    """
+    if is_pending_overlay:
+        pending_ledger.expect(tx_hash, effects)
 
-    # ENCODE START
-    nonce_data[agent.address]["seen_block"] = base64.b64encode(encode_single('uint256', nonce_data[agent.address]["seen_block"])).decode('ascii')
-    nonce_data[agent.address]["next_tx_count"] = base64.b64encode(encode_single('uint256', nonce_data[agent.address]["next_tx_count"])).decode('ascii')
-    
-    # ENCODE END
-    return agent.next_tx_count
+def issue_block():
+    """
+    Have the node build a block out of pending transactions now.
+    """
+    result = providerAvax.make_request("avax.issueBlock", {})
+    view_cache.mark_dirty()
+    return result
 
-def unlock_nonce(agent):
-    global mm
-    # DECODE START
-    if not mm:
-        mm = mmap.mmap(avax_cchain_nonces.fileno(), 0)
+def new_reads(block_identifier='latest'):
+    """
+    Make a batch to queue contract view calls into. Uses the Multicall
+    contract when one is deployed, so all the reads come from one block, and
+    falls back to a JSON-RPC batch otherwise.
+    """
+    if MulticallContract is not None:
+        return Multicall(w3, w3.eth.contract(abi=MulticallContract['abi'], address=MULTICALL["addr"]), block_identifier)
+    return RPCBatch(w3, provider, block_identifier)
 
-    mm.seek(0)
-    raw_data_cov = mm.read().decode('utf8')
-    nonce_data = json.loads(raw_data_cov)
+def transaction_helper(agent, prepped_function_call, gas):
+    """
+    Submit a prepared contract function call from the given agent, using the
+    next nonce from the shared nonce table.
 
-    nonce_data['locked'] = '0'
-    out_data = bytes(json.dumps(nonce_data), 'utf8')
-    mm[:] = out_data
+    While the transaction submitter is collecting, the call is queued instead
+    and a PendingTx is returned; see send_pending().
 
-def transaction_helper(agent, prepped_function_call, gas):
+    If we hold the agent's key, the transaction is signed here and sent raw.
+    """
     tx_hash = None
-    nonce = get_nonce(agent)
+    nonce = nonce_table.reserve(agent, floor=agent.next_tx_count)
+    if transaction_submitter is not None and transaction_submitter.collecting:
+        agent.next_tx_count = nonce
+        return transaction_submitter.submit(agent, prepped_function_call, {
+            'chainId': 43112,
+            'nonce': nonce,
+            'from' : getattr(agent, 'address', agent),
+            'gas': gas,
+            'gasPrice': Web3.toWei(225, 'gwei'),
+        })
     while tx_hash is None:
         try:
             agent.next_tx_count = nonce
-            lock_nonce(agent)
-            tx_hash = prepped_function_call.transact({
+            transaction = {
                 'chainId': 43112,
                 'nonce': nonce,
                 'from' : getattr(agent, 'address', agent),
                 'gas': gas,
                 'gasPrice': Web3.toWei(225, 'gwei'),
-            })
-            unlock_nonce(agent)
+            }
+            if transaction_signer is not None and agent in transaction_signer:
+                tx_hash = w3.eth.sendRawTransaction(
+                    transaction_signer.sign(prepped_function_call.buildTransaction(transaction))
+                )
+            else:
+                tx_hash = prepped_function_call.transact(transaction)
+            view_cache.mark_dirty()
         except Exception as inst:
             err_str = str(inst)
             if 'nonce too low' in err_str:
-                # increment tx_hash
-                unlock_nonce(agent)
-                nonce +=1
+                # Someone else used this nonce, take the next one
+                nonce = nonce_table.reserve(agent, floor=nonce + 1)
             elif 'replacement transaction underpriced' in err_str:
-                # increment tx_hash
-                unlock_nonce(agent)
-                nonce +=1
+                # Something with this nonce is already pending, take the next one
+                nonce = nonce_table.reserve(agent, floor=nonce + 1)
             else:
                 print(inst)
     return tx_hash
 
-def reg_int(value, scale):
+def send_pending(tx_hash):
     """
-    Convert from atomic token units with the given number of decimals, to a
-    Balance with the right number of decimals.
+    Make sure a transaction from transaction_helper() has actually been sent,
+    flushing the submitter's queue if it is still waiting there. Returns the
+    real transaction hash.
     """
-    return Balance(value, scale)
+    if not isinstance(tx_hash, PendingTx):
+        return tx_hash
+    if tx_hash.hash is None and tx_hash.error is None:
+        transaction_submitter.flush()
+    if tx_hash.error is not None:
+        raise tx_hash.error
+    view_cache.mark_dirty()
+    return tx_hash.hash
+
+def load_checkpoint(path, addresses):
+    """
+    Load the checkpoint at path, if there is one and it still describes this
+    chain: its block must still be in the chain with the same hash, and it
+    must cover the given agent addresses. Nonces are moved up to the chain's
+    transaction counts, in case anything was sent after the checkpoint.
 
-def unreg_int(value, scale):
+    Returns the checkpoint, or None to start fresh.
     """
-    Convert from a Balance with the right number of decimals to atomic token
-    units with the given number of decimals.
+    try:
+        state = checkpoint.load(path)
+    except ValueError as inst:
+        logger.info({"error": inst, "action": "load checkpoint"})
+        return None
+    if state is None:
+        return None
+
+    try:
+        block = w3.eth.get_block(state['block'])
+    except Exception as inst:
+        logger.info("Checkpoint block {} is not in this chain: {}".format(state['block'], inst))
+        return None
+    if block['hash'].hex() != state['block_hash']:
+        logger.info("Checkpoint block {} has a different hash in this chain".format(state['block']))
+        return None
+    missing = [address for address in addresses if address not in state['nonces']]
+    if len(missing) > 0:
+        logger.info("Checkpoint does not cover agents {}".format(missing))
+        return None
+
+    # One batch for every agent's transaction count
+    responses = make_batch_request(provider, [{
+        'jsonrpc': '2.0',
+        'id': i,
+        'method': 'eth_getTransactionCount',
+        'params': [address, 'latest'],
+    } for i, address in enumerate(addresses)])
+    for address, response in zip(addresses, responses):
+        state['nonces'][address] = max(state['nonces'][address], int(response['result'], 16))
+    return state
+
+def mine_all(tx_hashes):
     """
-    
-    assert(value.decimals() == scale)
-    return value.to_wei()
+    Issue blocks until every one of the given (sent) transactions is mined.
+    Returns their receipts, in order, and how many blocks it took.
+    """
+    receipts = {}
+    pending = list(tx_hashes)
+    blocks = 0
+    while len(pending) > 0:
+        issue_block()
+        blocks += 1
+        # Wait for the block to land, and see everything that made it in
+        for tx_hash, receipt in zip(pending, receipt_collector.wait_some(pending)):
+            if receipt is not None:
+                receipts[tx_hash] = receipt
+        pending = [tx_hash for tx_hash in pending if tx_hash not in receipts]
+    return [receipts[tx_hash] for tx_hash in tx_hashes], blocks
 
 def pretty(d, indent=0):
    """
@@ -256,191 +423,12 @@ def pretty(d, indent=0):
       else:
          print('\t' * (indent+1) + str(value))
 
-def portion_dedusted(total, fraction):
-    """
-    Compute the amount of an asset to use, given that you have
-    total and you don't want to leave behind dust.
-    """
-    
-    if total - (fraction * total) <= 1:
-        return total
-    else:
-        return fraction * total
-
 def defaultdict_from_dict(d):
     #nd = lambda: collections.defaultdict(nd)
     ni = collections.defaultdict(set)
     ni.update(d)
     return ni
 
-# Because token balances need to be accuaate to the atomic unit, we can't store
-# them as floats. Otherwise we might turn our float back into a token balance
-# different from the balance we actually had, and try to spend more than we
-# have. But also, it's ugly to throw around total counts of atomic units. So we
-# use this class that represents a fixed-point token balance.
-class Balance:
-    def __init__(self, wei=0, decimals=0):
-        self._wei = int(wei)
-        self._decimals = int(decimals)
-        
-    def clone(self):
-        """
-        Make a deep copy so += and -= on us won't infect the copy.
-        """
-        return Balance(self._wei, self._decimals)
-        
-    def to_decimals(self, new_decimals):
-        """
-        Get a similar balance with a different number of decimals.
-        """
-        
-        return Balance(self._wei * 10**new_decimals // 10**self._decimals, new_decimals)
-        
-    @classmethod
-    def from_tokens(cls, n, decimals=0):
-        return cls(n * 10**decimals, decimals)
-
-    def __add__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot add balances with different decimals: {}, {}", self, other)
-            return Balance(self._wei + other._wei, self._decimals)
-        else:
-            return Balance(self._wei + other * 10**self._decimals, self._decimals)
-
-    def __iadd__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot add balances with different decimals: {}, {}", self, other)
-            self._wei += other._wei
-        else:
-            self._wei += other * 10**self._decimals
-        return self
-        
-    def __radd__(self, other):
-        return self + other
-        
-    def __sub__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot subtract balances with different decimals: {}, {}", self, other)
-            return Balance(self._wei - other._wei, self._decimals)
-        else:
-            return Balance(self._wei - other * 10**self._decimals, self._decimals)
-
-    def __isub__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot subtract balances with different decimals: {}, {}", self, other)
-            self._wei -= other._wei
-        else:
-            self._wei -= other * 10**self._decimals
-        return self
-        
-    def __rsub__(self, other):
-        return Balance(other * 10**self._decimals, self._decimals) - self
-        
-    def __mul__(self, other):
-        if isinstance(other, Balance):
-            raise TypeError("Cannot multiply two balances")
-        return Balance(self._wei * other, self._decimals)
-        
-    def __imul__(self, other):
-        if isinstance(other, Balance):
-            raise TypeError("Cannot multiply two balances")
-        self._wei = int(self._wei * other)
-        
-    def __rmul__(self, other):
-        return self * other
-        
-    def __truediv__(self, other):
-        if isinstance(other, Balance):
-            raise TypeError("Cannot divide two balances")
-        return Balance(self._wei // other, self._decimals)
-        
-    def __itruediv__(self, other):
-        if isinstance(other, Balance):
-            raise TypeError("Cannot divide two balances")
-        self._wei = int(self._wei // other)
-        
-    # No rtruediv because dividing by a balance is silly.
-    
-    # Todo: floordiv? divmod?
-    
-    def __lt__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
-            return self._wei < other._wei
-        else:
-            return float(self) < other
-            
-    def __le__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
-            return self._wei <= other._wei
-        else:
-            return float(self) <= other
-            
-    def __gt__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
-            return self._wei > other._wei
-        else:
-            return float(self) > other
-            
-    def __ge__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
-            return self._wei >= other._wei
-        else:
-            return float(self) >= other
-            
-    def __eq__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
-            return self._wei == other._wei
-        else:
-            return float(self) == other
-            
-    def __ne__(self, other):
-        if isinstance(other, Balance):
-            if other._decimals != self._decimals:
-                raise ValueError("Cannot compare balances with different decimals: {}, {}", self, other)
-            return self._wei != other._wei
-        else:
-            return float(self) != other
-
-    def __str__(self):
-        base = 10**self._decimals
-        ipart = self._wei // base
-        fpart = self._wei - base * ipart
-        return ('{}.{:0' + str(self._decimals) + 'd}').format(ipart, fpart)
-
-    def __repr__(self):
-        return 'Balance({}, {})'.format(self._wei, self._decimals)
-        
-    def __float__(self):
-        return self._wei / 10**self._decimals
-
-    def __round__(self):
-        return Balance(int(math.floor(self._wei / 10**self._decimals)) * 10**self._decimals, self._decimals)
-        
-    def __format__(self, s):
-        if s == '':
-            return str(self)
-        return float(self).__format__(s)
-        
-    def to_wei(self):
-        return self._wei
-        
-    def decimals(self):
-        return self._decimals
-
 class TokenProxy:
     """
     A proxy for an ERC20 token. Monitors events, processes them when update()
@@ -456,6 +444,9 @@ class TokenProxy:
         self.__transfer_filter = self.__contract.events.Transfer.createFilter(fromBlock='latest')
         # This maps from string address to Balance balance
         self.__balances = {}
+        # True once the ledger holds everyone with a balance, so anyone
+        # missing from it has none
+        self.__complete = False
         # This records who we approved for who
         self.__approved_file = "{}-{}.json".format(str(contract.address), 'approvals')
 
@@ -471,9 +462,13 @@ class TokenProxy:
         
         # Load initial parameters from the chain.
         # Assumes no events are happening to change the supply while we are doing this.
-        self.__decimals = self.__contract.functions.decimals().call()
-        self.__symbol = self.__contract.functions.symbol().call()
-        self.__supply = Balance(self.__contract.functions.totalSupply().call(), self.__decimals)
+        self.__plans = ContractPlans.for_contract(contract, ['balanceOf', 'totalSupply', 'decimals', 'symbol'])
+        self.__decimals = view_cache.call(self.__plans.decimals(), permanent=True)
+        self.__symbol = view_cache.call(self.__plans.symbol(), permanent=True)
+        self.__supply = Balance(self.__plans.totalSupply().call(), self.__decimals)
+        # Totals over the transfers we have seen
+        self.__minted = Balance(0, self.__decimals)
+        self.__burned = Balance(0, self.__decimals)
 
     # Expose some properties to make us easy to use in place of the contract
         
@@ -489,6 +484,14 @@ class TokenProxy:
     def totalSupply(self):
         return self.__supply
         
+    @property
+    def minted(self):
+        return self.__minted
+
+    @property
+    def burned(self):
+        return self.__burned
+
     @property
     def address(self):
         return self.__contract.address
@@ -496,6 +499,10 @@ class TokenProxy:
     @property
     def contract(self):
         return self.__contract
+
+    @property
+    def plans(self):
+        return self.__plans
         
     def update(self, is_init_agents=[]):
         """
@@ -503,11 +510,26 @@ class TokenProxy:
         Assumes no transactions are still in flight.
         """
         
+        transfers = self.__transfer_filter.get_new_entries()
+        new_addresses = self.__apply_transfers(
+            (t['args']['from'], t['args']['to'], t['args']['value'])
+            for t in transfers
+        )
+        self.__poll_balances(new_addresses, is_init_agents)
+        # The ledger has these transactions' real effects now
+        pending_ledger.reconcile(self, (t['transactionHash'] for t in transfers))
+
+    def __apply_transfers(self, transfers):
+        """
+        Apply transfers, as (from, to, value in atomic units), to the ledger.
+        Returns the addresses we saw that we have no balance for.
+        """
         # These addresses need to be polled because we have no balance from
         # before all these events.
         new_addresses = set()
+        zero = Balance(0, self.__decimals)
         
-        for transfer in self.__transfer_filter.get_new_entries():
+        for (sender, recipient, value) in transfers:
             # For every transfer event since we last updated...
             
             # Each loooks something like:
@@ -518,32 +540,115 @@ class TokenProxy:
             # 'address': '0xa2Ff73731Ee46aBb6766087CE33216aee5a30d5e', 
             # 'blockHash': HexBytes('0xb5ffd135318581fcd5cd2463cf3eef8aaf238bef545e460c284ad6283928ed08'),
             # 'blockNumber': 17})
-            args = transfer['args']
-            
-            moved = Balance(args['value'], self.__decimals)
-            if args['from'] in self.__balances:
-                self.__balances[args['from']] -= moved
-            elif args['from'] == ZERO_ADDRESS:
+            moved = Balance(value, self.__decimals)
+            if sender in self.__balances:
+                self.__balances[sender] -= moved
+            elif sender == ZERO_ADDRESS:
                 # This is a mint
                 self.__supply += moved
+                self.__minted += moved
+            elif self.__complete:
+                self.__balances[sender] = zero - moved
             else:
-                new_addresses.add(args['from'])
-            if args['to'] in self.__balances:
-                self.__balances[args['to']] += moved
-            elif args['to'] == ZERO_ADDRESS:
-                # This is a burn
-                self.__supply -= moved
+                new_addresses.add(sender)
+            if recipient in self.__balances:
+                self.__balances[recipient] += moved
+            elif recipient == ZERO_ADDRESS:
+                if sender != ZERO_ADDRESS:
+                    # This is a burn
+                    self.__supply -= moved
+                    self.__burned += moved
+                # Otherwise it is a mint to the zero address, like the
+                # pair's locked MINIMUM_LIQUIDITY, which still counts
+            elif self.__complete:
+                self.__balances[recipient] = moved
             else:
-                new_addresses.add(args['to'])
-        
-        for address in new_addresses:
-            # TODO: can we get a return value and a correct-as-of block in the same call?
-            self.__balances[address] = Balance(self.__contract.caller({'from' : address, 'gas': 100000}).balanceOf(address), self.__decimals)
+                new_addresses.add(recipient)
+        return new_addresses
+
+    def __poll_balances(self, new_addresses, is_init_agents=[]):
+        # Poll everyone we need a balance for in one batch, all as of the same block
+        to_poll = set(new_addresses)
+        if not self.__complete:
+            to_poll.update(agent.address for agent in is_init_agents)
+        if to_poll:
+            reads = new_reads()
+            balance_reads = self.queue_balances(reads, to_poll)
+            reads.execute()
+            for address, balance_read in balance_reads.items():
+                self.__balances[address] = balance_read.result()
+
+    def state(self):
+        """
+        Get the ledger and approvals as JSON-able data, for a checkpoint.
+        """
+        return {
+            'supply': self.__supply.to_wei(),
+            'minted': self.__minted.to_wei(),
+            'burned': self.__burned.to_wei(),
+            'complete': self.__complete,
+            'balances': {address: balance.to_wei() for address, balance in self.__balances.items()},
+            'approved': self.__approved,
+        }
+
+    def restore(self, state, from_block):
+        """
+        Load a ledger from state() taken at from_block, then catch up on the
+        transfers since then from the chain's logs.
+        """
+        self.__supply = Balance(state['supply'], self.__decimals)
+        self.__minted = Balance(state.get('minted', 0), self.__decimals)
+        self.__burned = Balance(state.get('burned', 0), self.__decimals)
+        self.__complete = state.get('complete', False)
+        self.__balances = {address: Balance(wei, self.__decimals) for address, wei in state['balances'].items()}
+        for owner, spenders in state['approved'].items():
+            self.__approved.setdefault(owner, {}).update(spenders)
+        self.save_approvals()
+        self.__catch_up(from_block + 1)
+
+    def rebuild(self, from_block=0):
+        """
+        Rebuild the whole ledger (balances, supply and mint and burn totals)
+        from every Transfer since from_block, which should be at or before
+        the token's deployment. Afterwards everyone with a balance is in the
+        ledger, so nobody needs a balanceOf poll.
+        """
+        self.__supply = Balance(0, self.__decimals)
+        self.__minted = Balance(0, self.__decimals)
+        self.__burned = Balance(0, self.__decimals)
+        self.__balances = {}
+        self.__complete = True
+        self.__catch_up(from_block)
+        logger.info("Rebuilt {} ledger: {} holders, supply {}".format(self.__symbol, len(self.__balances), self.__supply))
 
-        if is_init_agents:
-            for agent in is_init_agents:
-                # TODO: can we get a return value and a correct-as-of block in the same call?
-                self.__balances[agent.address] = Balance(self.__contract.caller({'from' : agent.address, 'gas': 100000}).balanceOf(agent.address), self.__decimals)
+    def __catch_up(self, from_block):
+        """
+        Apply every transfer from from_block to the head, read in bulk from
+        the chain's logs, then watch for new ones from the next block on.
+        """
+        head = w3.eth.blockNumber
+        self.__transfer_filter = self.__contract.events.Transfer.createFilter(fromBlock=head + 1)
+        transfers = fetch_logs(
+            provider, self.__contract.address, [TRANSFER_TOPIC], from_block, head,
+            chunk_blocks=log_chunk_blocks, parallel=log_parallel_chunks
+        )
+        self.__poll_balances(self.__apply_transfers(decode_transfer(log) for log in transfers))
+
+    def queue_balances(self, batch, addresses):
+        """
+        Queue balanceOf reads for the given addresses (or things with
+        addresses) into a batch. Returns a dict from address to BatchCall
+        resolving to a Balance.
+        """
+        balance_reads = {}
+        for address in addresses:
+            address = getattr(address, 'address', address)
+            balance_reads[address] = batch.add(
+                self.__plans.balanceOf(address),
+                {'from' : address, 'gas': 100000},
+                self.from_wei
+            )
+        return balance_reads
 
             
     def __getitem__(self, address):
@@ -556,38 +661,80 @@ class TokenProxy:
         address = getattr(address, 'address', address)
         
         if address not in self.__balances:
-            # Don't actually cache here; wait for a transfer.
-            # Transactions may still be in flight
-            return Balance(self.__contract.caller({'from' : address, 'gas': 100000}).balanceOf(address), self.__decimals)
+            if self.__complete:
+                # Nothing was ever sent to them, as of the last update()
+                balance = Balance(0, self.__decimals)
+            else:
+                # Don't actually cache here; wait for a transfer.
+                # Transactions may still be in flight
+                balance = Balance(view_cache.call(self.__plans.balanceOf(address), {'from' : address, 'gas': 100000}), self.__decimals)
         else:
-            # Clone the stored balance so it doesn't get modified and upset the user
-            return self.__balances[address].clone()
+            # Balances are immutable, so the stored one can be handed out
+            balance = self.__balances[address]
+
+        if is_pending_overlay:
+            # Count what our own transactions in flight will do
+            change = pending_ledger.change(self.address, address)
+            if change != 0:
+                balance = balance + Balance(change, self.__decimals)
+        return balance
             
+    def is_approved(self, owner, spender):
+        """
+        Return True if we know the owner approved the spender.
+        """
+        owner = getattr(owner, 'address', owner)
+        spender = getattr(spender, 'address', spender)
+        return owner in self.__approved and spender in self.__approved[owner]
+
+    def approve(self, owner, spender, gas=500000):
+        """
+        Send an approval for the spender to spend all the owner's tokens,
+        without waiting for it. Returns the tx hash, or None if the spender
+        is already approved.
+
+        Call mark_approved() once it's mined.
+        """
+        if self.is_approved(owner, spender):
+            return None
+        #logger.info('WAITING FOR APPROVAL {} for {}'.format(getattr(owner, 'address', owner), spender))
+        return transaction_helper(
+            owner,
+            self.__contract.functions.approve(getattr(spender, 'address', spender), UINT256_MAX), 
+            gas
+        )
+
+    def mark_approved(self, owner, spender, save=True):
+        """
+        Record that the owner approved the spender.
+        """
+        owner = getattr(owner, 'address', owner)
+        spender = getattr(spender, 'address', spender)
+        if owner not in self.__approved:
+            self.__approved[owner] = {spender: 1}
+        else:
+            self.__approved[owner][spender] = 1
+        if save:
+            self.save_approvals()
+
+    def save_approvals(self):
+        open(self.__approved_file, 'w+').write(json.dumps(self.__approved))
+
     def ensure_approved(self, owner, spender):
         """
         Approve the given spender to spend all the owner's tokens on their behalf.
         
         Owner and spender may be addresses or things with addresses.
         """
-        spender = getattr(spender, 'address', spender)
-        
-        if (getattr(owner, 'address', owner) not in self.__approved) or (spender not in self.__approved[getattr(owner, 'address', owner)]):
-            # Issue an approval
-            #logger.info('WAITING FOR APPROVAL {} for {}'.format(getattr(owner, 'address', owner), spender))
-            tx_hash = transaction_helper(
-                owner,
-                self.__contract.functions.approve(spender, UINT256_MAX), 
-                500000
-            )
-            providerAvax.make_request("avax.issueBlock", {})
-            receipt = w3.eth.waitForTransactionReceipt(tx_hash, poll_latency=tx_pool_latency)
+        tx_hash = self.approve(owner, spender)
+        if tx_hash is not None:
+            if not isinstance(tx_hash, PendingTx):
+                issue_block()
+                receipt = receipt_collector.wait(tx_hash)
+            # Otherwise the approval is queued ahead of the owner's next
+            # transaction, so nonce order puts it in the block first.
             #logger.info('APPROVED')
-            if getattr(owner, 'address', owner) not in self.__approved:
-                self.__approved[getattr(owner, 'address', owner)] = {spender: 1}
-            else:
-                self.__approved[getattr(owner, 'address', owner)][spender] = 1
-
-            open(self.__approved_file, 'w+').write(json.dumps(self.__approved))
+            self.mark_approved(owner, spender)
             
     def from_wei(self, wei):
         """
@@ -605,7 +752,7 @@ class TokenProxy:
         
         return Balance.from_tokens(tokens, self.__decimals)
         
-class Agent:
+class Agent(Strategy):
     """
     Represents an agent. Tracks all the agent's balances.
     """
@@ -632,9 +779,12 @@ class Agent:
         self.min_faith = kwargs.get("min_faith", 0.0)
         # Should we even use faith?
         self.use_faith = kwargs.get("use_faith", True)
+        # How likely we are to provide liquidity, and to remove it above the peg
+        self.provide_liquidity_weight = kwargs.get("provide_liquidity_weight", Strategy.provide_liquidity_weight)
+        self.remove_liquidity_weight = kwargs.get("remove_liquidity_weight", Strategy.remove_liquidity_weight)
 
         # add wallet addr
-        self.address = kwargs.get("wallet_address", '0x0000000000000000000000000000000000000000')
+        self.address = intern_address(kwargs.get("wallet_address", '0x0000000000000000000000000000000000000000'))
 
         #coupon expirys
         self.coupon_expirys = []
@@ -651,23 +801,13 @@ class Agent:
 
         # keeps track of latest block seen for nonce tracking/tx
         self.seen_block = {}
-        self.next_tx_count = w3.eth.getTransactionCount(self.address, block_identifier=int(w3.eth.get_block('latest')["number"]))
+        self.next_tx_count = kwargs.get("next_tx_count", None)
+        if self.next_tx_count is None:
+            self.next_tx_count = w3.eth.getTransactionCount(self.address, block_identifier=int(w3.eth.get_block('latest')["number"]))
         self.current_block = 0
 
-        if True:#kwargs.get("is_mint", False):
-            # need to mint USDT to the wallets for each agent
-            start_usdt_formatted = kwargs.get("starting_usdt", Balance(0, USDT["decimals"]))
-            providerAvax.make_request("avax.issueBlock", {})
-            tx_hash = transaction_helper(
-                self,
-                self.usdt_token.contract.functions.mint(
-                    self.address, start_usdt_formatted.to_wei()
-                ), 
-                500000
-            )
-            time.sleep(1.1)
-            providerAvax.make_request("avax.issueBlock", {})
-            w3.eth.waitForTransactionReceipt(tx_hash, poll_latency=tx_pool_latency)
+        # USDT to mint to the wallet, in Model.bootstrap()
+        self.starting_usdt = kwargs.get("starting_usdt", Balance(0, USDT["decimals"]))
         
     @property
     def xsd(self):
@@ -696,6 +836,21 @@ class Agent:
         Get the current balance in of coupons for agent
         """
         return self.dao.total_coupons_for_agent(self)
+
+    def state(self):
+        """
+        Get the agent's coupon bookkeeping as JSON-able data, for a checkpoint.
+        """
+        return {
+            'coupon_expirys': self.coupon_expirys,
+            'max_coupon_epoch_index': self.max_coupon_epoch_index,
+            'redeem_count': self.redeem_count,
+        }
+
+    def restore(self, state):
+        self.coupon_expirys = list(state['coupon_expirys'])
+        self.max_coupon_epoch_index = state['max_coupon_epoch_index']
+        self.redeem_count = state['redeem_count']
     
     def __str__(self):
         """
@@ -703,78 +858,6 @@ class Agent:
         """
         return "Agent(xSD={:.2f}, usdt={:.2f}, avax={}, lp={}, coupons={:.2f})".format(
             self.xsd, self.usdt, self.avax, self.lp, self.coupons)
-
-        
-    def get_strategy(self, current_timestamp, price, total_supply, total_coupons, agent_coupons):
-        """
-        Get weights, as a dict from action to float, as a function of the price.
-        """
-        
-        strategy = collections.defaultdict(lambda: 1.0)
-        
-        # TODO: real (learned? adversarial? GA?) model of the agents
-        # TODO: agent preferences/utility function
-
-        # People are fast to coupon bid to get in front of redemption queue
-        strategy["coupon_bid"] = 2.0
-
-
-        strategy["provide_liquidity"] = 0.1
-        
-        
-        if price >= 1.0:
-            # No rewards for expansion by itself
-            strategy["bond"] = 0
-            # And not unbond
-            strategy["unbond"] = 0
-            # Or redeem if possible
-            # strategy["redeem"] = 10000000000000.0 if self.coupons > 0 else 0
-            # incetive to buy above 1 is for more coupons
-            strategy["buy"] = 1.0
-            strategy["sell"] = 1.0
-
-            # less incentive to remove liquidity above 1
-            strategy["remove_liquidity"] = 0.1
-        else:
-            # We probably want to unbond due to no returns
-            strategy["unbond"] = 0
-            # And not bond
-            strategy["bond"] = 0
-
-            # likely to remove liquidity below peg to reduce IL?
-            strategy["remove_liquidity"] = 4.0 if agent_coupons > 0 else 1.0
-       
-        if self.use_faith:
-            # Vary our strategy based on how much xSD we think ought to exist
-            if price * total_supply > self.get_faith(current_timestamp, price, total_supply):
-                # There is too much xSD, so we want to sell
-                strategy["sell"] = 2.0
-            else:
-                # no faith based buying, just selling
-                pass
-        
-        return strategy
-        
-    def get_faith(self, current_timestamp, price, total_supply):
-        """
-        Get the total faith in xSD that this agent has, in USDT.
-        
-        If the market cap is over the faith, the agent thinks the system is
-        over-valued. If the market cap is under the faith, the agent thinks the
-        system is under-valued.
-        """
-        
-        # TODO: model the real economy as bidding on utility in
-        # mutually-beneficial exchanges conducted in xSD, for which a velocity
-        # is needed, instead of an abstract faith?
-        
-        # TODO: different faith for different people
-        
-        center_faith = (self.max_faith + self.min_faith) / 2
-        swing_faith = (self.max_faith - self.min_faith) / 2
-        faith = center_faith + swing_faith * math.sin(current_timestamp * (2 * math.pi / 5000000))
-        
-        return faith
         
 class PangolinPool:
     """
@@ -787,50 +870,135 @@ class PangolinPool:
         self.pangolin_token = pangolin_token
         self.usdt_token = usdt_token
         self.xsd_token = xsd_token
+
+        exchange = self.pangolin_pair_token.contract
+        # Watch every log the pair emits with one filter, and tell the events
+        # we mirror apart by their first topic.
+        self.__pair_filter = w3.eth.filter({'address': exchange.address, 'fromBlock': 'latest'})
+        self.__pair_events = {}
+        for event_abi in exchange.abi:
+            if event_abi.get('type') == 'event' and event_abi['name'] in ('Sync', 'Mint', 'Burn', 'Swap'):
+                self.__pair_events[event_abi_to_log_topic(event_abi)] = getattr(exchange.events, event_abi['name'])()
+
+        # Load initial parameters from the chain. Sync carries absolute
+        # reserves, so an event that races these reads does no harm.
+        self.__pair_plans = ContractPlans.for_contract(exchange, ['getReserves', 'token0'])
+        self.__router_plans = ContractPlans.for_contract(self.pangolin_router, ['getAmountsIn', 'getAmountsOut'])
+        self.__token0 = view_cache.call(self.__pair_plans.token0(), permanent=True)
+        self.__reserves = list(self.__pair_plans.getReserves().call())
+
+        # Activity seen on the pair since we started watching it
+        self.swap_count = 0
+        self.mint_count = 0
+        self.burn_count = 0
+
+    def state(self):
+        """
+        Get the pair activity counters, for a checkpoint. The reserves are
+        always re-read from the chain.
+        """
+        return {
+            'swap_count': self.swap_count,
+            'mint_count': self.mint_count,
+            'burn_count': self.burn_count,
+        }
+
+    def restore(self, state):
+        self.swap_count = state['swap_count']
+        self.mint_count = state['mint_count']
+        self.burn_count = state['burn_count']
     
-    def operational(self):
+    def operational(self, reserve=None):
         """
         Return true if buying and selling is possible.
+
+        Uses the given (already fetched) reserves if any.
         """
-        reserve = self.getReserves()
+        if reserve is None:
+            reserve = self.getReserves()
         token0Balance = reserve[0]
         token1Balance = reserve[1]
         return token0Balance > 0 and token1Balance > 0
     
     def getToken0(self):
-        exchange = self.pangolin_pair_token.contract
-        return exchange.functions.token0().call()
+        return self.__token0
 
     def getReserves(self):
-        exchange = self.pangolin_pair_token.contract
-        return exchange.functions.getReserves().call()
+        """
+        Get the pair's [reserve0, reserve1, blockTimestampLast], as of the
+        last update().
+        """
+        return list(self.__reserves)
+
+    def reservesFor(self, token_a, token_b):
+        """
+        Get (reserve_a, reserve_b) of the mirrored pair, in the order asked
+        for, like PangolinLibrary.getReserves. Raises KeyError for any other
+        pair.
+        """
+        if {token_a.lower(), token_b.lower()} != {self.xsd_token.address.lower(), self.usdt_token.address.lower()}:
+            raise KeyError("No mirrored pair for {} and {}".format(token_a, token_b))
+        reserve = self.getReserves()
+        if token_a.lower() == self.__token0.lower():
+            return reserve[0], reserve[1]
+        return reserve[1], reserve[0]
 
-    def getTokenBalance(self):
-        reserve, token0 = self.getReserves(), self.getToken0()
+    def getAmountsIn(self, agent, amount_out, path):
+        """
+        Work out the input amounts along path needed to get amount_out, like
+        the router's getAmountsIn. Computed locally from the mirrored reserves
+        when we mirror every pair on the path.
+        """
+        try:
+            return amm.get_amounts_in(amount_out, path, self.reservesFor)
+        except KeyError:
+            return view_cache.call(self.__router_plans.getAmountsIn(amount_out, path), {'from' : agent.address, 'gas': 100000})
+
+    def getAmountsOut(self, agent, amount_in, path):
+        """
+        Work out the output amounts along path for amount_in, like the
+        router's getAmountsOut. Computed locally from the mirrored reserves
+        when we mirror every pair on the path.
+        """
+        try:
+            return amm.get_amounts_out(amount_in, path, self.reservesFor)
+        except KeyError:
+            return view_cache.call(self.__router_plans.getAmountsOut(amount_in, path), {'from' : agent.address, 'gas': 100000})
+
+    def getTokenBalance(self, reserve=None, token0=None):
+        if reserve is None:
+            reserve = self.getReserves()
+        if token0 is None:
+            token0 = self.getToken0()
         token0Balance = reserve[0]
         token1Balance = reserve[1]
         if (token0.lower() == USDT["addr"].lower()):
             return reg_int(token0Balance, USDT['decimals']), reg_int(token1Balance, xSD['decimals'])
         return reg_int(token1Balance, USDT['decimals']), reg_int(token0Balance, xSD['decimals'])
 
-    def getInstantaneousPrice(self):
-      reserve, token0 = self.getReserves(), self.getToken0()
+    def getInstantaneousPrice(self, reserve=None, token0=None):
+      if reserve is None:
+        reserve = self.getReserves()
+      if token0 is None:
+        token0 = self.getToken0()
       token0Balance = reserve[0]
       token1Balance = reserve[1]
       if (token0.lower() == USDT["addr"].lower()):
         return int(token0Balance) * pow(10, PGLRouter['decimals']) / float(int(token1Balance)) if int(token1Balance) != 0 else 0
       return int(token1Balance) * pow(10, PGLRouter['decimals']) / float(int(token0Balance)) if int(token0Balance) != 0 else 0
     
-    def xsd_price(self):
+    def xsd_price(self, reserve=None, token0=None):
         """
         Get the current xSD price in USDT.
+
+        If reserve and token0 are given (e.g. from a batch), no RPC is made.
         """
         
-        if self.operational():
+        if self.operational(reserve):
             success = False
             while not success:
                 try:
-                    price = self.getInstantaneousPrice()
+                    price = self.getInstantaneousPrice(reserve, token0)
                     success = True
                     return price
                 except Exception as inst:
@@ -843,8 +1011,16 @@ class PangolinPool:
         else:
             return 1.0
 
+    def queue_reads(self, batch):
+        """
+        Queue the pair reads a step needs into a batch (RPCBatch or Multicall).
+        Returns the (reserves, token0) BatchCalls.
+        """
+        exchange = self.pangolin_pair_token.contract
+        return batch.add(self.__pair_plans.getReserves()), batch.add(self.__pair_plans.token0())
+
     def total_lp(self, agent):
-        return reg_int(self.pangolin_pair_token.contract.caller({'from' : agent.address, 'gas': 100000}).totalSupply(), PGLRouter['decimals'])
+        return reg_int(self.pangolin_pair_token.totalSupply.to_wei(), PGLRouter['decimals'])
         
     def provide_liquidity(self, agent, xsd, usdt, current_timestamp):
         """
@@ -880,6 +1056,8 @@ class PangolinPool:
             ), 
             500000
         )
+        # At most this much goes in; the LP shares out aren't known yet
+        expect_effects(tx_hash, [(self.xsd_token, agent, 0 - xsd), (self.usdt_token, agent, 0 - usdt)])
 
         return tx_hash
         
@@ -907,6 +1085,11 @@ class PangolinPool:
             ), 
             500000
         )
+        expect_effects(tx_hash, [
+            (self.pangolin_pair_token, agent, 0 - shares),
+            (self.xsd_token, agent, min_xsd_amount),
+            (self.usdt_token, agent, min_usdt_amount),
+        ])
 
         return tx_hash
         
@@ -934,6 +1117,8 @@ class PangolinPool:
             ), 
             500000
         )
+        # The second amount is the least xSD the swap will take
+        expect_effects(tx_hash, [(self.usdt_token, agent, 0 - usdt), (self.xsd_token, agent, max_usdt_amount)])
         return tx_hash
         
     def sell(self, agent, xsd, min_usdt_amount, advancer, pangolin_usdt_supply, current_timestamp):
@@ -959,11 +1144,34 @@ class PangolinPool:
             ), 
             500000
         )
+        expect_effects(tx_hash, [(self.xsd_token, agent, 0 - xsd), (self.usdt_token, agent, min_usdt_amount)])
         return tx_hash
 
     def update(self, is_init_agents=[]):
+        """
+        Process pending pair events, and update the mirrored reserves and LP
+        supply to match chain.
+        """
         self.pangolin_pair_token.update(is_init_agents=is_init_agents)
 
+        for log in self.__pair_filter.get_new_entries():
+            event = self.__pair_events.get(bytes(log['topics'][0]))
+            if event is None:
+                # Transfer/Approval, which the TokenProxy handles
+                continue
+            
+            event = event.processLog(log)
+            args = event['args']
+            if event['event'] == 'Sync':
+                # Every change to the reserves ends with a Sync of the new values
+                self.__reserves = [args['reserve0'], args['reserve1'], self.__reserves[2]]
+            elif event['event'] == 'Swap':
+                self.swap_count += 1
+            elif event['event'] == 'Mint':
+                self.mint_count += 1
+            elif event['event'] == 'Burn':
+                self.burn_count += 1
+
 class DAO:
     """
     Represents the xSD DAO. Tracks xSD balance of DAO and total outstanding xSDS.
@@ -974,7 +1182,11 @@ class DAO:
         Take keyword arguments to nspecify experimental parameters.
         """
         self.contract = contract  
+        self.plans = ContractPlans.for_contract(contract)
         self.xsd_token = xsd    
+        # Everyone's coupons, from the DAO's events, if is_coupon_index
+        self.coupon_ledger = None
+        self.__coupon_filter = None
 
     def xsd_supply(self):
         '''
@@ -983,7 +1195,7 @@ class DAO:
         return self.xsd_token.totalSupply
 
     def total_coupons_at_epoch(self, address, epoch):
-        total_coupons = self.contract.caller({'from' : address, 'gas': 100000}).outstandingCoupons(epoch)
+        total_coupons = view_cache.call(self.plans.outstandingCoupons(epoch), {'from' : address, 'gas': 100000})
         return Balance.from_tokens(total_coupons, xSD['decimals'])
         
     def total_coupons(self, address):
@@ -991,7 +1203,7 @@ class DAO:
         Get all outstanding unexpired coupons.
         """
         
-        total = self.contract.caller({'from' : address, 'gas': 100000}).totalCoupons()
+        total = view_cache.call(self.plans.totalCoupons(), {'from' : address, 'gas': 100000})
         return reg_int(total, xSD['decimals'])
 
     def total_redeemable(self, address):
@@ -999,12 +1211,73 @@ class DAO:
         Get total reedeemable supply.
         """
         
-        total = self.contract.caller({'from' : address, 'gas': 100000}).totalRedeemable()
+        total = view_cache.call(self.plans.totalRedeemable(), {'from' : address, 'gas': 100000})
         return reg_int(total, xSD['decimals'])
 
 
+    def sync(self, from_block=0):
+        """
+        Rebuild the coupon ledger from every coupon event since from_block,
+        which should be at or before the DAO's deployment.
+        """
+        self.coupon_ledger = CouponLedger()
+        self.__catch_up(from_block)
+        logger.info("Rebuilt coupon ledger: {} holders, {} events, {} coupons outstanding".format(
+            len(self.coupon_ledger), self.coupon_ledger.applied, self.coupon_ledger.total))
+
+    def update(self):
+        """
+        Apply coupon events since the last update() to the coupon ledger.
+        """
+        if self.coupon_ledger is None:
+            return
+        for log in self.__coupon_filter.get_new_entries():
+            self.__apply(log)
+
+    def state(self):
+        """
+        Get the coupon ledger as JSON-able data, for a checkpoint.
+        """
+        return self.coupon_ledger.state() if self.coupon_ledger is not None else None
+
+    def restore(self, state, from_block):
+        """
+        Load the coupon ledger from state() taken at from_block, then catch
+        up on the coupon events since then.
+        """
+        if state is None:
+            self.sync()
+            return
+        self.coupon_ledger = CouponLedger.from_state(state)
+        self.__catch_up(from_block + 1)
+
+    def __catch_up(self, from_block):
+        """
+        Apply every coupon event from from_block to the head, read in bulk
+        from the chain's logs, then watch for new ones from the next block on.
+        """
+        head = w3.eth.blockNumber
+        self.__coupon_filter = w3.eth.filter({
+            'address': self.contract.address,
+            'topics': [COUPON_TOPICS],
+            'fromBlock': head + 1,
+        })
+        logs = fetch_logs(
+            provider, self.contract.address, [COUPON_TOPICS], from_block, head,
+            chunk_blocks=log_chunk_blocks, parallel=log_parallel_chunks
+        )
+        for log in logs:
+            self.__apply(log)
+
+    def __apply(self, log):
+        event = decode_coupon_event(log)
+        if event is not None:
+            self.coupon_ledger.apply(event)
+
     def total_coupons_for_agent(self, agent):
-        total_coupons = self.contract.caller({'from' : agent.address, 'gas': 100000}).outstandingCouponsForAddress(agent.address)
+        if self.coupon_ledger is not None:
+            return self.coupon_ledger.outstanding_for(agent)
+        total_coupons = view_cache.call(self.plans.outstandingCouponsForAddress(agent.address), {'from' : agent.address, 'gas': 100000})
         return total_coupons
 
     def coupon_balance_at_epoch(self, address, epoch):
@@ -1013,18 +1286,24 @@ class DAO:
         '''
         if epoch == 0:
             return 0
-        total_coupons = self.contract.caller({'from' : address, 'gas': 100000}).balanceOfCoupons(address, epoch)
+        if self.coupon_ledger is not None:
+            return self.coupon_ledger.balance(address, epoch)
+        total_coupons = view_cache.call(self.plans.balanceOfCoupons(address, epoch), {'from' : address, 'gas': 100000})
         return total_coupons
 
     def get_coupon_expirirations(self, agent):
         '''
             Return a list of coupon expirations for an address from last time called
         '''
+        if self.coupon_ledger is not None:
+            agent.coupon_expirys = self.coupon_ledger.expiries(agent)
+            return agent.coupon_expirys
+
         epochs = []
-        epoch_index_max = self.contract.caller({'from' : agent.address, 'gas': 100000}).getCouponsCurrentAssignedIndex(agent.address)
+        epoch_index_max = view_cache.call(self.plans.getCouponsCurrentAssignedIndex(agent.address), {'from' : agent.address, 'gas': 100000})
 
         for i in range(agent.max_coupon_epoch_index, epoch_index_max):
-            t_epoch = self.contract.caller({'from' : agent.address, 'gas': 100000}).getCouponsAssignedAtEpoch(agent.address, i)
+            t_epoch = view_cache.call(self.plans.getCouponsAssignedAtEpoch(agent.address, i), {'from' : agent.address, 'gas': 100000})
             total_coupons = self.coupon_balance_at_epoch(agent.address, t_epoch)
             if total_coupons == 0:
                 continue
@@ -1039,7 +1318,34 @@ class DAO:
         return agent.coupon_expirys
 
     def epoch(self, address):
-        return self.contract.caller({'from' : address, 'gas': 100000}).epoch()
+        return view_cache.call(self.plans.epoch(), {'from' : address, 'gas': 100000})
+
+    def queue_reads(self, batch, address, agents=[]):
+        """
+        Queue the DAO reads a step needs into a batch (RPCBatch or Multicall),
+        decoded the same way as epoch(), total_coupons(), total_redeemable()
+        and total_coupons_for_agent(). Returns a dict of BatchCalls.
+
+        With the coupon ledger, agents' coupons come from it instead, and
+        are not read.
+        """
+        caller = {'from' : address, 'gas': 100000}
+        functions = self.plans
+        agent_coupons = {}
+        if self.coupon_ledger is None:
+            agent_coupons = {
+                agent.address: batch.add(
+                    functions.outstandingCouponsForAddress(agent.address),
+                    {'from' : agent.address, 'gas': 100000}
+                ) for agent in agents
+            }
+        return {
+            'epoch': batch.add(functions.epoch(), caller),
+            'total_coupons': batch.add(functions.totalCoupons(), caller, lambda v: reg_int(v, xSD['decimals'])),
+            'total_redeemable': batch.add(functions.totalRedeemable(), caller, lambda v: reg_int(v, xSD['decimals'])),
+            'earliest_active_auction': batch.add(functions.getEarliestActiveAuctionEpoch(), caller),
+            'agent_coupons': agent_coupons,
+        }
         
     def has_coupon_bid(self):
         """
@@ -1062,6 +1368,8 @@ class DAO:
             ), 
             4000000
         )
+        # Settlement burns the bid's xSD; keep it from being spent meanwhile
+        expect_effects(tx_hash, [(self.xsd_token, agent, 0 - xsd_amount)])
         return tx_hash
         
     def redeem(self, agent, epoch_expired):
@@ -1085,6 +1393,25 @@ class DAO:
             ), 
             8000000
         )
+        # Coupons redeem one for one into newly minted xSD
+        expect_effects(tx_hash, [(self.xsd_token, agent, Balance(total_coupons, xSD['decimals']))])
+        return tx_hash
+
+    def redeem_for_account(self, keeper, address, epoch, amount):
+        """
+        Have keeper redeem amount (in atomic units) of the coupons address
+        holds expiring at epoch, paying address.
+        """
+        tx_hash = transaction_helper(
+            keeper,
+            self.contract.functions.redeemCouponsForAccount(
+                epoch,
+                amount,
+                address
+            ),
+            REDEEM_FOR_ACCOUNT_GAS
+        )
+        expect_effects(tx_hash, [(self.xsd_token, address, Balance(amount, xSD['decimals']))])
         return tx_hash
 
 
@@ -1100,36 +1427,59 @@ class DAO:
             self.contract.functions.advance(), 
             8000000
         )
-        providerAvax.make_request("avax.issueBlock", {})
+        issue_block()
         return tx_hash
                         
-class Model:
+class Model(Economy):
     """
-    Full model of the economy.
+    Full model of the economy, on the chain.
     """
     
     def __init__(self, dao, pangolin, usdt, pangolin_router, pangolin_token, xsd, oracle, agents, **kwargs):
         """
         Takes in experiment parameters and forwards them on to all components.
+        The model-level ones are in params.MODEL_DEFAULTS; vector_decisions,
+        decision_seed, try_model_mine, batched_redeem and redeem_keeper
+        default to the module globals.
+
+        If a checkpoint (from load_checkpoint()) is given, resume from it
+        instead of funding the agents and syncing everything from the chain.
         """
+        resume = kwargs.pop('checkpoint', None)
+        params = model_params(kwargs)
+        vector_decisions = kwargs.pop('vector_decisions', is_vector_decisions)
+        seed = kwargs.pop('decision_seed', decision_seed)
+        try_model_mine = kwargs.pop('try_model_mine', is_try_model_mine)
+        self.is_batched_redeem = kwargs.pop('batched_redeem', is_batched_redeem)
+        keeper = intern_address(kwargs.pop('redeem_keeper', redeem_keeper) or agents[0])
+        if keeper not in [intern_address(address) for address in agents]:
+            raise ValueError("Redeem keeper {} is not one of the agents".format(keeper))
         self.pangolin = PangolinPool(pangolin, pangolin_router, pangolin_token, usdt, xsd, **kwargs)
         self.dao = DAO(dao, xsd, **kwargs)
         self.oracle = oracle
+        self.oracle_plans = ContractPlans.for_contract(oracle, ['latestPrice', 'latestValid'])
         self.agents = []
         self.usdt_token = usdt
         self.pangolin_router = pangolin_router
         self.xsd_token = xsd
-        self.max_avax = Balance.from_tokens(1000000, 18)
-        self.max_usdt = self.usdt_token.from_tokens(100000000)
-        self.bootstrap_epoch = 2
-        self.max_coupon_exp = 131400
-        self.max_coupon_premium = 10.0
-        self.min_usdt_balance = self.usdt_token.from_tokens(1)
+        self.max_avax = Balance.from_tokens(params['max_avax'], 18)
+        self.max_usdt = self.usdt_token.from_tokens(params['max_usdt'])
+        self.bootstrap_epoch = params['bootstrap_epoch']
+        self.max_coupon_exp = params['max_coupon_exp']
+        self.max_coupon_premium = params['max_coupon_premium']
+        self.min_usdt_balance = self.usdt_token.from_tokens(params['min_usdt_balance'])
+        self.is_try_model_mine = try_model_mine
         self.agent_coupons = {x: 0 for x in agents}
         self.has_prev_advanced = True
+        # Random choices come from the random module, which main() seeds
+        self.rng = random
+        # Steps taken so far, across resumes
+        self.step_count = 0
+        # What the last step saw and did, for the run log
+        self.metrics = {}
 
 
-        is_mint = is_try_model_mine
+        is_mint = try_model_mine
         if w3.eth.get_block('latest')["number"] == block_offset:
             # THIS ONLY NEEDS TO BE RUN ON NEW CONTRACTS
             # TODO: tolerate redeployment or time-based generation
@@ -1141,10 +1491,33 @@ class Model:
             start_usdt = random.random() * self.max_usdt
             
             address = agents[i]
+            if resume is not None:
+                kwargs['next_tx_count'] = resume['nonces'][address]
             agent = Agent(self.dao, pangolin, xsd, usdt, starting_axax=start_avax, starting_usdt=start_usdt, wallet_address=address, is_mint=is_mint, **kwargs)
              
             self.agents.append(agent)
 
+        # Sends planned redemptions, if is_batched_redeem
+        self.keeper = next(a for a in self.agents if a.address == keeper)
+        self.redemption_stats = RedemptionStats(xSD['decimals'])
+
+        # Decides for all the agents at once, if is_vector_decisions
+        self.population = Population.from_agents(self.agents, seed=seed) if vector_decisions else None
+
+        if resume is not None:
+            self.restore(resume)
+            return
+
+        if is_full_ledger:
+            # Every holder from the logs, instead of a balanceOf per agent
+            for token in [self.usdt_token, self.xsd_token, self.pangolin.pangolin_pair_token]:
+                token.rebuild()
+        if is_coupon_index:
+            self.dao.sync()
+
+        # need to mint USDT to the wallets for each agent, and approve everything they trade through
+        self.bootstrap()
+
         # Update caches to current chain state
         self.usdt_token.update(is_init_agents=self.agents)
         self.xsd_token.update(is_init_agents=self.agents)
@@ -1155,55 +1528,215 @@ class Model:
                 self.agent_coupons[self.agents[i].address] = self.agents[i].coupons
                 self.dao.get_coupon_expirirations(self.agents[i])
             logger.info(self.agents[i])
-
-        sys.exit()
         
-    def log(self, stream, seleted_advancer, current_timestamp, header=False):
+    def checkpoint_state(self):
         """
-        Log model statistics a TSV line.
-        If header is True, include a header.
+        Get everything needed to resume the model as JSON-able data, as of
+        the current chain head. Assumes no transactions are still in flight.
         """
-        
-        if header:
-            stream.write("#block\tepoch\tprice\tsupply\tcoupons\ttotal_redeemable\tlp_supply\tfaith\n")
+        # Bring the ledgers up to the block we tag the checkpoint with
+        self.usdt_token.update()
+        self.xsd_token.update()
+        self.pangolin.update()
+        self.dao.update()
+        head = w3.eth.get_block('latest')
+
+        return {
+            'block': head['number'],
+            'block_hash': head['hash'].hex(),
+            'step_count': self.step_count,
+            'has_prev_advanced': self.has_prev_advanced,
+            'rng': checkpoint.rng_state(),
+            'population_rng': self.population.rng_state() if self.population is not None else None,
+            'tokens': {
+                token.address: token.state()
+                for token in [self.usdt_token, self.xsd_token, self.pangolin.pangolin_pair_token]
+            },
+            'pangolin': self.pangolin.state(),
+            'coupons': self.dao.state(),
+            'agent_coupons': self.agent_coupons,
+            # In the current (shuffled) order
+            'agents': [[a.address, a.state()] for a in self.agents],
+            'nonces': {
+                a.address: max(nonce_table.peek(a) or 0, a.next_tx_count) for a in self.agents
+            },
+        }
 
-        (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
-        xsd_supply = self.dao.xsd_supply()
-        
-        stream.write('{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\n'.format(
-                w3.eth.get_block('latest')["number"],
-                self.dao.epoch(seleted_advancer.address),
-                self.pangolin.xsd_price(),
-                xsd_supply,
-                self.dao.total_coupons(seleted_advancer.address),
-                self.dao.total_redeemable(seleted_advancer.address),
-                float(xsd_b) / float(xsd_supply) * 100 if xsd_supply > 0 else 0.0,
-                self.get_overall_faith(current_timestamp)
-            )
-        )
-       
-    def get_overall_faith(self, current_timestamp):
+    def save_checkpoint(self, path):
+        ts = time.time()
+        checkpoint.save(path, self.checkpoint_state())
+        logger.info("Checkpoint at step {} written in {} (s)".format(self.step_count, time.time() - ts))
+
+    def restore(self, state):
+        """
+        Resume from a checkpoint_state() that load_checkpoint() has checked
+        against the chain.
+        """
+        for token in [self.usdt_token, self.xsd_token, self.pangolin.pangolin_pair_token]:
+            token.restore(state['tokens'][token.address], state['block'])
+        self.pangolin.restore(state['pangolin'])
+        self.pangolin.update()
+        if is_coupon_index:
+            self.dao.restore(state.get('coupons'), state['block'])
+
+        by_address = {a.address: a for a in self.agents}
+        self.agents = []
+        for (address, agent_state) in state['agents']:
+            by_address[address].restore(agent_state)
+            self.agents.append(by_address.pop(address))
+        # Anyone not in the checkpoint goes last
+        self.agents.extend(by_address.values())
+
+        for a in self.agents:
+            nonce_table.set(a, a.next_tx_count)
+
+        self.agent_coupons.update(state['agent_coupons'])
+        self.has_prev_advanced = state['has_prev_advanced']
+        self.step_count = state['step_count']
+        checkpoint.set_rng_state(state['rng'])
+        if self.population is not None and state.get('population_rng') is not None:
+            self.population.set_rng_state(state['population_rng'])
+        logger.info("Resumed at step {} from block {}".format(self.step_count, state['block']))
+
+    def bootstrap(self):
+        """
+        Fund and approve every agent up front: mint each agent's starting
+        USDT, and approve the router for USDT, xSD and PGL and the DAO for
+        xSD. Everything is sent before anything is waited on, with gas limits
+        sized from estimates, so blocks fit as many of them as possible.
+        """
+        approvals = [
+            (self.usdt_token, PGLRouter["addr"]),
+            (self.xsd_token, PGLRouter["addr"]),
+            (self.pangolin.pangolin_pair_token, PGLRouter["addr"]),
+            (self.xsd_token, self.dao.contract.address),
+        ]
+        phase_times = collections.OrderedDict()
+        # This maps from (contract address, function name) to gas limit
+        gas_limits = {}
+
+        def gas_for(agent, prepared):
+            # Every agent's mint (or approval) costs the same, so estimate once
+            key = (prepared.address, prepared.fn_name)
+            if key not in gas_limits:
+                gas_limits[key] = int(prepared.estimateGas({'from': agent.address}) * 1.25)
+            return gas_limits[key]
+
+        if transaction_submitter is not None:
+            transaction_submitter.start()
+
+        tx_hashes = []
+        ts = time.time()
+        for a in self.agents:
+            mint = self.usdt_token.contract.functions.mint(a.address, a.starting_usdt.to_wei())
+            tx_hashes.append(transaction_helper(a, mint, gas_for(a, mint)))
+        phase_times['mint'] = time.time() - ts
+
+        ts = time.time()
+        approved = []
+        for a in self.agents:
+            for (token, spender) in approvals:
+                if token.is_approved(a, spender):
+                    continue
+                tx_hash = token.approve(a, spender, gas_for(a, token.contract.functions.approve(spender, UINT256_MAX)))
+                tx_hashes.append(tx_hash)
+                approved.append((token, a, spender))
+        phase_times['approve'] = time.time() - ts
+
+        ts = time.time()
+        if transaction_submitter is not None:
+            transaction_submitter.stop()
+        tx_hashes = [send_pending(tx_hash) for tx_hash in tx_hashes]
+        phase_times['send'] = time.time() - ts
+
+        ts = time.time()
+        (receipts, blocks) = mine_all(tx_hashes)
+        phase_times['mine'] = time.time() - ts
+
+        for (token, a, spender) in approved:
+            token.mark_approved(a, spender, save=False)
+        for token in set(token for (token, _) in approvals):
+            token.save_approvals()
+
+        logger.info("Bootstrap: {} tx ({} failed) in {} blocks, times (s): {}".format(
+            len(tx_hashes), len([r for r in receipts if r["status"] == 0]), blocks, json.dumps(phase_times)
+        ))
+
+    def snapshot(self, address, with_agents=True):
         """
-        What target should the system be trying to hit in xSD market cap?
+        Read the DAO, pair, oracle and (optionally) every agent's coupons in
+        one batch. Agents' token balances come from the TokenProxy ledgers
+        instead. With a Multicall deployed these all come from
+        the same block.
+
+        Returns a dict of values, decoded as the DAO/PangolinPool getters
+        would return them.
         """
-        return self.agents[0].get_faith(current_timestamp, self.pangolin.xsd_price(), self.dao.xsd_supply())
+        agents = self.agents if with_agents else []
+
+        reads = new_reads()
+        dao_reads = self.dao.queue_reads(reads, address, agents)
+        (reserve_read, token0_read) = self.pangolin.queue_reads(reads)
+        supply_read = reads.add(self.xsd_token.plans.totalSupply(), None, self.xsd_token.from_wei)
+        oracle_caller = {'from' : address, 'gas': 100000}
+        latest_price_read = reads.add(self.oracle_plans.latestPrice(), oracle_caller, lambda v: Balance(v[0], xSD['decimals']))
+        latest_valid_read = reads.add(self.oracle_plans.latestValid(), oracle_caller)
+        reads.execute()
+
+        reserves = reserve_read.result()
+        token0 = token0_read.result()
+        (usdt_b, xsd_b) = self.pangolin.getTokenBalance(reserves, token0)
+
+        return {
+            'block': reads.block_number,
+            'epoch': dao_reads['epoch'].result(),
+            'total_coupons': dao_reads['total_coupons'].result(),
+            'total_redeemable': dao_reads['total_redeemable'].result(),
+            'earliest_active_auction': dao_reads['earliest_active_auction'].result(),
+            'agent_coupons': (
+                {a.address: self.dao.total_coupons_for_agent(a) for a in agents}
+                if self.dao.coupon_ledger is not None
+                else {a: r.result() for a, r in dao_reads['agent_coupons'].items()}
+            ),
+            'reserves': reserves,
+            'token0': token0,
+            'usdt_b': usdt_b,
+            'xsd_b': xsd_b,
+            'price': self.pangolin.xsd_price(reserves, token0),
+            'xsd_supply': supply_read.result(),
+            'latest_price': latest_price_read.result(),
+            'latest_valid': latest_valid_read.result(),
+        }
        
+    def mine(self):
+        issue_block()
+
+    def mine_alone(self, tx_hash):
+        tx_hash = send_pending(tx_hash)
+        issue_block()
+        return tx_hash, receipt_collector.wait(tx_hash)
+
     def step(self):
         """
         Step the model Let all the agents act.
         
         Returns True if anyone could act.
         """
+        self.step_count += 1
+        step_start = time.time()
         # Update caches to current chain state
+        rpc_tracer.phase('update')
         self.usdt_token.update()
         self.xsd_token.update()
         self.pangolin.update()
 
         #randomly have an agent advance the epoch
-        seleted_advancer = self.agents[int(random.random() * (len(self.agents) - 1))]
+        seleted_advancer = self.pick_advancer()
 
+        rpc_tracer.phase('advance')
         if self.has_prev_advanced:
             provider.make_request("debug_increaseTime", [7200])
+            view_cache.mark_dirty()
 
 
         current_block = w3.eth.get_block('latest')
@@ -1212,7 +1745,7 @@ class Model:
         ts = time.time()
         epoch_before = self.dao.epoch(seleted_advancer.address)
         incentivized_adv_tx = self.dao.advance(seleted_advancer)
-        adv_recp = w3.eth.waitForTransactionReceipt(incentivized_adv_tx, poll_latency=tx_pool_latency)
+        adv_recp = receipt_collector.wait(incentivized_adv_tx)
         is_advance_fail = False
 
         te = time.time()
@@ -1223,28 +1756,56 @@ class Model:
         else:
             self.has_prev_advanced = True
 
-        logger.info("Earliest Active Auction: {}".format(self.dao.contract.caller({'from' : seleted_advancer.address, 'gas': 100000}).getEarliestActiveAuctionEpoch()))
+        # The advance settles auctions and expires coupons
+        self.dao.update()
+
+        # Read the whole economy at once, as of one block
+        rpc_tracer.phase('snapshot')
+        snapshot = self.snapshot(seleted_advancer.address)
+
+        logger.info("Earliest Active Auction: {}".format(snapshot['earliest_active_auction']))
         logger.info("Prospective Advance from {}, is_advance_fail: {}".format(seleted_advancer.address, is_advance_fail))
 
-        (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
-        revs = self.pangolin.getReserves()
+        (usdt_b, xsd_b) = (snapshot['usdt_b'], snapshot['xsd_b'])
 
-        current_epoch = self.dao.epoch(seleted_advancer.address)
+        current_epoch = snapshot['epoch']
 
-        epoch_start_price = self.pangolin.xsd_price()
-        dao_xsd_supply = self.dao.xsd_supply()
-        total_coupons = self.dao.total_coupons(seleted_advancer.address)
+        epoch_start_price = snapshot['price']
+        dao_xsd_supply = snapshot['xsd_supply']
+        total_coupons = snapshot['total_coupons']
+        self.agent_coupons.update(snapshot['agent_coupons'])
         
         logger.info("Block {}, epoch {}, price {:.2f}, supply {:.2f}, faith: {:.2f}, bonded {:2.1f}%, coupons: {:.2f}, liquidity {:.2f} xSD / {:.2f} USDT".format(
-            current_block["number"], current_epoch, epoch_start_price, dao_xsd_supply,
-            self.get_overall_faith(current_timestamp), 0, total_coupons,
+            snapshot['block'], current_epoch, epoch_start_price, dao_xsd_supply,
+            self.get_overall_faith(current_timestamp, epoch_start_price), 0, total_coupons,
             xsd_b, usdt_b)
         )
         
-        latest_price = Balance(self.oracle.caller({'from' : seleted_advancer.address, 'gas': 100000}).latestPrice()[0], xSD['decimals'])
-        latest_valid = self.oracle.caller({'from' : seleted_advancer.address, 'gas': 100000}).latestValid()
-        tr = self.dao.total_redeemable(seleted_advancer.address)
+        latest_price = snapshot['latest_price']
+        latest_valid = snapshot['latest_valid']
+        tr = snapshot['total_redeemable']
         logger.info("latest_price: {}, latest_valid: {}, totalRedeemable: {}".format(latest_price, latest_valid, tr))
+
+        # What the run log records for this step, all from what we already read
+        self.metrics = {
+            'block': snapshot['block'],
+            'epoch': current_epoch,
+            'timestamp': current_timestamp,
+            'price': epoch_start_price,
+            'oracle_price': float(latest_price),
+            'oracle_valid': latest_valid,
+            'supply': float(dao_xsd_supply),
+            'coupons': float(total_coupons),
+            'total_redeemable': float(tr),
+            'lp_supply': float(xsd_b) / float(dao_xsd_supply) * 100 if dao_xsd_supply > 0 else 0.0,
+            'faith': self.get_overall_faith(current_timestamp, epoch_start_price),
+            'liquidity_xsd': float(xsd_b),
+            'liquidity_usdt': float(usdt_b),
+            'earliest_active_auction': snapshot['earliest_active_auction'],
+            'advance_ok': not is_advance_fail,
+            'advance_seconds': te - ts,
+            'step_seconds': time.time() - step_start,
+        }
         
         anyone_acted = False
         if current_epoch < self.bootstrap_epoch:
@@ -1252,262 +1813,38 @@ class Model:
             return anyone_acted, seleted_advancer
 
 
-        total_tx_submitted = 0
         total_redeem_submitted = 0
-        total_coupoun_bidders = 0
-        random.shuffle(self.agents)
+        self.rng.shuffle(self.agents)
 
         tx_hashes = []
 
-        is_pgl_op = self.pangolin.operational()
-
         # try to redeem any outstanding coupons here first to better
         if tr > 0 and total_coupons > 0:
-            for agent_num, a in enumerate(self.agents):
-                tr = self.dao.contract.caller({'from' : a.address, 'gas': 100000}).totalRedeemable()
-                if tr == 0:
-                    break
-                
-                if self.agent_coupons[a.address] > 0 and tr >= self.agent_coupons[a.address]:
-                    self.dao.get_coupon_expirirations(a)
-                    if len(a.coupon_expirys) == 0:
-                        #logger.info("ERROR WITH EXIPRIATION LIST")
-                        continue
-                    else:
-                        # if agent has coupons                    
-                        logger.info("COUPON EXP: Agent {}, exp_epochs: {}".format(a.address, json.dumps(a.coupon_expirys)))
-
-                        a.redeem_count += 1
-                        tried_idx = []
-                        for c_idx, c_exp in enumerate(a.coupon_expirys):
-                            try:
-                                redeem_tx_hash = self.dao.redeem(a, c_exp)
-                                total_redeem_submitted += 1
-                                providerAvax.make_request("avax.issueBlock", {})
-                                tx_hashes.append({'type': 'redeem', 'hash': redeem_tx_hash})
-                            except Exception as inst:
-                                logger.info({"agent": a.address, "error": inst, "action": "redeem", "exact_expiry": c_exp})
-
-        for agent_num, a in enumerate(self.agents):            
-            # TODO: real strategy
-            options = []
-
-            start_tx_count = a.next_tx_count
-            commitment = random.random() * 0.1
-
-            if portion_dedusted(a.usdt, commitment) > 0 and is_pgl_op:
-                options.append("buy")
-            if portion_dedusted(a.xsd, commitment) > 0 and is_pgl_op:
-                options.append("sell")
-            '''
-            TODO: CURRENTLY NO INCENTIVE TO BOND INTO LP OR DAO (EXCEPT FOR VOTING, MAY USE THIS TO DISTRUBTION EXPANSIONARY PROFITS)
-            if a.xsd > 0:
-                options.append("bond")
-            if a.xsds > 0:
-                options.append("unbond")
-            if a.coupons > 0 and epoch_start_price > 1.0:
-                options.append("redeem")
-            '''
-            if usdt_b >= self.min_usdt_balance and portion_dedusted(a.xsd, commitment) >= Balance.from_tokens(1, xSD['decimals']) and self.dao.has_coupon_bid():
-                options.append("coupon_bid")
-            if portion_dedusted(a.usdt, commitment) > 0 and portion_dedusted(a.xsd, commitment) > 0:
-                options.append("provide_liquidity")
-            if a.lp > 0:
-                options.append("remove_liquidity")
-                                
-            if len(options) > 0:
-                # We can act
-
-                '''
-                    TODO:
-                        bond, unbond
-                        
-                    TOTEST:
-                        bond, unbond
-                    WORKS:
-                        advance, provide_liquidity, remove_liquidity, buy, sell, coupon_bid, redeem, 
-                '''
-        
-                strategy = a.get_strategy(current_timestamp, self.pangolin.xsd_price(), dao_xsd_supply, total_coupons, self.agent_coupons[a.address])
-                
-                weights = [strategy[o] for o in options]
-                
-                action = random.choices(options, weights=weights)[0]
-                
-                # What fraction of the total possible amount of doing this
-                # action will the agent do?
-                
-                if action == "buy":
-                    # this will limit the size of orders avaialble
-                    (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
-                    if xsd_b > 0 and usdt_b > 0:
-                        usdt_in = portion_dedusted(
-                            min(a.usdt, xsd_b.to_decimals(USDT['decimals'])),
-                            commitment
-                        )
-                    else:
-                        continue
-
-                    try:
-                        (max_amount, _) = self.pangolin_router.caller({'from' : a.address, 'gas': 100000}).getAmountsIn(
-                            usdt_in.to_wei(), 
-                            [self.usdt_token.address, self.xsd_token.address]
-                        )
-
-                        if max_amount == 1:
-                            normed_max_out =  (usdt_in * epoch_start_price)
-                            max_amount = normed_max_out.to_decimals(xSD['decimals'])
-
-                    except Exception as inst:
-                        # not enough on market to fill bid
-                        logger.info({"agent": a.address, "error": inst, "action": "buy", "amount_in": usdt_in})
-                        continue
-                    
-                    try:
-                        price = epoch_start_price
-                        #logger.info("Buy init {:.2f} xSD @ {:.2f} for {:.2f} USDT".format(usdt_in, price, max_amount))
-                        buy_tx = self.pangolin.buy(a, usdt_in, max_amount, current_timestamp)
-                        tx_hashes.append({'type': 'buy', 'hash': buy_tx})
-                        #logger.debug("Buy end {:.2f} xSD @ {:.2f} for {:.2f} USDT".format(max_amount, price, usdt_in))
-                        
-                    except Exception as inst:
-                        logger.info({"agent": a.address, "error": inst, "action": "buy", "usdt_in": usdt_in, "max_amount": max_amount})
-                        continue
-                elif action == "sell":
-                    # this will limit the size of orders avaialble
-                    (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
-                    if xsd_b > 0 and usdt_b > 0:
-                        xsd_out = min(
-                            portion_dedusted(
-                                a.xsd,
-                                commitment
-                            ),
-                            usdt_b.to_decimals(xSD['decimals'])
-                        )
-                    else:
-                        continue
-                    
-                    try:
-                        (_, max_amount) = self.pangolin_router.caller({'from' : a.address, 'gas': 100000}).getAmountsOut(
-                            xsd_out.to_wei(), 
-                            [self.xsd_token.address, self.usdt_token.address]
-                        )
-
-                        max_amount = reg_int(max_amount, USDT['decimals'])
-                    except Exception as inst:
-                        logger.info({"agent": a.address, "error": inst, "action": "sell", "amount_out": xsd_out})
-
-                    try:
-                        price = epoch_start_price
-                        #logger.info("Sell init {:.2f} xSD @ {:.2f} for {:.2f} USDT".format(xsd_out, price, max_amount))
-                        sell_tx = self.pangolin.sell(a, xsd_out, max_amount, seleted_advancer, usdt_b.to_decimals(xSD['decimals']), current_timestamp)
-                        tx_hashes.append({'type': 'sell', 'hash': sell_tx})
-                        #logger.debug("Sell end {:.2f} xSD @ {:.2f} for {:.2f} USDT".format(xsd_out, price, usdt))
-                    except Exception as inst:
-                        logger.info({"agent": a.address, "error": inst, "action": "sell", "xsd_out": xsd_out, "max_amount": max_amount, "account_xsd": a.xsd})
-                elif action == "coupon_bid":
-                    '''
-                        TODO: NEED TO FIGURE OUT BETTER WAY TO TRACK THIS?
-                    '''
-                    xsd_at_risk = max(Balance.from_tokens(1, 18), portion_dedusted(a.xsd, commitment))
-                    rand_epoch_expiry = int(random.random() * self.max_coupon_exp)
-                    rand_max_coupons =  round(max(1.01, min(random.random() * self.max_coupon_premium, self.max_coupon_premium)) * xsd_at_risk)
-
-                    #rand_max_coupons =  round(max(1.01, min(random.random() + 1.0, self.max_coupon_premium)) * xsd_at_risk)
-                    #rand_max_coupons =  round(max(1.01, int(math.floor(self.max_coupon_premium))) * xsd_at_risk)
-
-
-                    if rand_max_coupons < xsd_at_risk:
-                        xsd_at_risk = rand_max_coupons
-                    try:
-                        exact_expiry = rand_epoch_expiry + current_epoch
-                        #logger.info("Addr {} Bid to burn init {:.2f} xSD for {:.2f} coupons with expiry at epoch {}".format(a.address, xsd_at_risk, rand_max_coupons, exact_expiry))
-                        coupon_bid_tx_hash = self.dao.coupon_bid(a, rand_epoch_expiry, xsd_at_risk, rand_max_coupons)
-                
-                        #if (latest_valid == True):
-                        if (self.has_prev_advanced == False):
-                            providerAvax.make_request("avax.issueBlock", {})
-                            coup_adv_recp = w3.eth.waitForTransactionReceipt(coupon_bid_tx_hash, poll_latency=tx_pool_latency)
-                            is_advance_fail = False
-                            if coup_adv_recp["status"] == 0:
-                                is_advance_fail = True
-                                self.has_prev_advanced = False
-                            else:
-                                latest_price = Balance(self.oracle.caller({'from' : a.address, 'gas': 100000}).latestPrice()[0], xSD['decimals'])
-                                self.has_prev_advanced = True
-                            
-                            logger.info("Coupon Advance from {}, is_advance_fail: {}".format(a.address, is_advance_fail))
-
-                        
-                        tx_hashes.append({'type': 'coupon_bid', 'hash': coupon_bid_tx_hash})
-                        self.agent_coupons[a.address] = a.coupons
-                        #logger.info("Addr {} Bid to burn end {:.2f} xSD for {:.2f} coupons with expiry at epoch {}".format(a.address, xsd_at_risk, rand_max_coupons, exact_expiry))
-                        total_coupoun_bidders += 1
-                    except Exception as inst:
-                        logger.info({"agent": a.address, "error": inst, "action": "coupon_bid", "exact_expiry": exact_expiry, "xsd_at_risk": xsd_at_risk})
-                elif action == "provide_liquidity":
-                    min_xsd_needed = Balance(0, xSD['decimals'])
-                    usdt = Balance(0, USDT['decimals'])
-                    if float(a.xsd) < float(a.usdt):
-                        usdt = portion_dedusted(a.xsd.to_decimals(USDT['decimals']), commitment)
-                    else:
-                        usdt = portion_dedusted(a.usdt, commitment)
-                    
-                    try: 
-                        if revs[1] > 0:
-                            min_xsd_needed = reg_int(
-                                self.pangolin_router.caller(
-                                    {'from' : a.address, 'gas': 100000}
-                                ).quote(
-                                    usdt.to_wei(), revs[0], revs[1]
-                                ),
-                                xSD['decimals']
-                            )
-                            if min_xsd_needed == 0:
-                                price = epoch_start_price
-                                min_xsd_needed = (usdt / float(price)).to_decimals(xSD['decimals'])
-                        else:
-                            min_xsd_needed = usdt.to_decimals(xSD['decimals'])
-                            
-                        if min_xsd_needed == 0:
-                            continue
-                    
-                        #logger.info("Provide {:.2f} xSD (of {:.2f} xSD) and {:.2f} USDT".format(min_xsd_needed, a.xsd, usdt))
-                        plp_hash = self.pangolin.provide_liquidity(a, min_xsd_needed, usdt, current_timestamp)
-                        tx_hashes.append({'type': 'provide_liquidity', 'hash': plp_hash})
-                    except Exception as inst:
-                        # SLENCE TRANSFER_FROM_FAILED ISSUES
-                        #logger.info({"agent": a.address, "error": inst, "action": "provide_liquidity", "min_xsd_needed": min_xsd_needed, "usdt": usdt})
-                        continue
-                elif action == "remove_liquidity":
-                    (usdt_b, xsd_b) = self.pangolin.getTokenBalance()
-                    lp = portion_dedusted(a.lp, commitment)
-                    total_lp = self.pangolin.total_lp(a)
-                    min_xsd_amount = max(Balance(0, xSD['decimals']), Balance(float(xsd_b) * float(lp / float(total_lp)), xSD['decimals']))
-                    min_usdt_amount = max(Balance(0, USDT['decimals']), Balance(float(usdt_b) * float(lp / float(total_lp)), USDT['decimals']))
-
-                    if not (min_xsd_amount > 0 and min_usdt_amount > 0):
-                        continue
-
-                    try:
-                        #logger.info("Stop providing {:.2f} xSD and {:.2f} USDT".format(min_xsd_amount, min_usdt_amount))
-                        rlp_hash = self.pangolin.remove_liquidity(a, lp, min_xsd_amount, min_usdt_amount, current_timestamp)
-                        tx_hashes.append({'type': 'remove_liquidity', 'hash': rlp_hash})
-                    except Exception as inst:
-                        logger.info({"agent": a.address, "error": inst, "action": "remove_liquidity", "min_xsd_needed": min_xsd_amount, "usdt": min_usdt_amount})
-                else:
-                    raise RuntimeError("Bad action: " + action)
-                    
-                anyone_acted = True
-            else:
-                # It's normal for agents other then the first to advance to not be able to act on block 0.
-                pass
-
-            end_tx_count = a.next_tx_count
-
-            total_tx_submitted += (end_tx_count - start_tx_count)
-
-        if is_try_model_mine:
+            rpc_tracer.phase('redeem')
+            redemptions = self.redeem(tr.to_wei())
+            total_redeem_submitted = len(redemptions)
+            tx_hashes.extend({'type': 'redeem', 'hash': tx_hash, 'coupons': coupons} for (tx_hash, coupons) in redemptions)
+
+        rpc_tracer.phase('act')
+        if transaction_submitter is not None:
+            # Queue agent transactions and send them all together below
+            transaction_submitter.start()
+
+        (anyone_acted, txs) = self.act(snapshot, current_timestamp, seleted_advancer)
+        tx_hashes.extend({'type': tx_type, 'hash': tx_hash} for (tx_type, tx_hash) in txs)
+        total_tx_submitted = len(txs)
+        total_coupoun_bidders = len([tx_type for (tx_type, _) in txs if tx_type == 'coupon_bid'])
+
+        rpc_tracer.phase('submit')
+        if transaction_submitter is not None:
+            ts = time.time()
+            sent = transaction_submitter.flush()
+            transaction_submitter.stop()
+            view_cache.mark_dirty()
+            te = time.time()
+            logger.info("Sent {} agent tx concurrently in {} (s)".format(len(sent), te - ts))
+
+        if self.is_try_model_mine:
             # mine a block after every iteration for every tx sumbitted during round
             logger.info("{} sumbitted, mining blocks for them now, {} coupon bidders".format(
                 total_tx_submitted, total_coupoun_bidders)
@@ -1517,29 +1854,79 @@ class Model:
                 total_coupoun_bidders)
             )
 
-        providerAvax.make_request("avax.issueBlock", {})
+        issue_block()
         tx_hashes_good = 0
         tx_fails = []
-        #'''
+        sent_tx_hashes = []
         for tmp_tx_hash in tx_hashes:
-            receipt = w3.eth.waitForTransactionReceipt(tmp_tx_hash['hash'], poll_latency=tx_pool_latency)
+            try:
+                tx_hash = send_pending(tmp_tx_hash['hash'])
+            except Exception:
+                tx_hash = None
+            if tx_hash is None:
+                # Never made it to the node
+                tx_fails.append(tmp_tx_hash['type'])
+                pending_ledger.landed(tmp_tx_hash['hash'], 0)
+                if tmp_tx_hash['type'] == 'redeem':
+                    self.redemption_stats.landed(tmp_tx_hash['coupons'], 0)
+                continue
+            sent_tx_hashes.append((tmp_tx_hash, tx_hash))
+
+        # Wait for everything at once, a batch of receipt lookups per block
+        rpc_tracer.phase('receipts')
+        receipts = receipt_collector.wait_all([tx_hash for (_, tx_hash) in sent_tx_hashes])
+        for (submitted, _), receipt in zip(sent_tx_hashes, receipts):
             tx_hashes_good += receipt["status"]
+            pending_ledger.landed(submitted['hash'], receipt["status"])
+            if submitted['type'] == 'redeem':
+                self.redemption_stats.landed(submitted['coupons'], receipt["status"])
             if receipt["status"] == 0:
-                tx_fails.append(tmp_tx_hash['type'])
-        #'''
+                tx_fails.append(submitted['type'])
 
         logger.info("total tx: {}, successful tx: {}, tx fails: {}".format(
                 len(tx_hashes), tx_hashes_good, json.dumps(tx_fails)
             )
         )
+        logger.info("view cache: {}".format(json.dumps(view_cache.stats())))
+        logger.info("pending ledger: {}".format(json.dumps(pending_ledger.stats())))
+        logger.info("redemptions: {}".format(json.dumps(self.redemption_stats.summary())))
+
+        self.metrics.update({
+            'step_seconds': time.time() - step_start,
+            'tx': len(tx_hashes),
+            'tx_ok': tx_hashes_good,
+            'tx_unsent': len(tx_hashes) - len(sent_tx_hashes),
+            'coupon_bidders': total_coupoun_bidders,
+            'redemptions': total_redeem_submitted,
+        })
+        for tx_type in TX_TYPES:
+            self.metrics['fail_' + tx_type] = tx_fails.count(tx_type)
 
         return anyone_acted, seleted_advancer
 
-def main():
+# Calls made from these classes' methods are counted against them
+for site in (TokenProxy, PangolinPool, DAO, Model):
+    rpc_tracer.add_site(site)
+# Including what Model inherits
+rpc_tracer.add_site(Economy, 'Model')
+
+def main(argv=None):
     """
     Main function: run the simulation.
     """
-    global avax_cchain_nonces
+    global nonce_table
+    global transaction_submitter
+    global max_accounts
+    parser = argparse.ArgumentParser(description="Run the model against the chain.")
+    parser.add_argument('--agents', type=int, default=max_accounts, help="how many of the node's accounts to run as agents")
+    parser.add_argument('--steps', type=int, default=50000, help="stop once this many steps have been taken")
+    parser.add_argument('--seed', type=int, default=None, help="seed the agents' random choices, for a repeatable run")
+    parser.add_argument('--run-log', default=RUN_LOG_FILE, help="where to write the run log")
+    parser.add_argument('--report', default=None, help="write a JSON summary of the run here at the end")
+    args = parser.parse_args(argv)
+    max_accounts = args.agents
+    if args.seed is not None:
+        random.seed(args.seed)
     logging.basicConfig(level=logging.INFO)
 
 
@@ -1559,15 +1946,7 @@ def main():
     sys.exit()
     '''
 
-    #'''
-    AGENT_NONCES['locked'] = '0'
     for acc in w3.eth.accounts[:max_accounts]:
-
-        AGENT_NONCES[acc] = {
-            "next_tx_count": base64.b64encode(encode_single('uint256', 0)).decode('ascii'),
-            "seen_block": base64.b64encode(encode_single('uint256', 0)).decode('ascii')
-        }
-
         max_index = dao.caller({'from' : acc, 'gas': 100000}).getCouponsCurrentAssignedIndex(acc)
         logger.info("how many times assigned coupons for {}: {}".format(acc, max_index))
         '''
@@ -1579,11 +1958,15 @@ def main():
     '''
         LOAD NONCES INTO MMAP
     '''
-    mmap_data = json.dumps(AGENT_NONCES)
-    with open(MMAP_FILE, "wb") as f:
-        f.write(bytes(mmap_data, 'utf8'))
+    nonce_table = NonceTable(MMAP_FILE, w3.eth.accounts[:max_accounts], create=True)
 
-    avax_cchain_nonces = open(MMAP_FILE, "r+b")
+    if transaction_signer is not None:
+        logger.info('Signing locally for {} agents'.format(
+            len([a for a in w3.eth.accounts[:max_accounts] if a in transaction_signer]))
+        )
+
+    if is_async_step:
+        transaction_submitter = AsyncSubmitter(ASYNC_RPC_URI, nonce_table, signer=transaction_signer)
 
     '''
     avg_auction_yields = []
@@ -1646,19 +2029,36 @@ def main():
     # Make a model of the economy
     start_init = time.time()
     logger.info('INIT STARTED')
-    model = Model(dao, pangolin, usdt, pangolin_router, pangolin_token, xsd, oracle, w3.eth.accounts[:max_accounts], min_faith=0.5E6, max_faith=1E6, use_faith=True)
+    resume = load_checkpoint(CHECKPOINT_FILE, w3.eth.accounts[:max_accounts])
+    model = Model(dao, pangolin, usdt, pangolin_router, pangolin_token, xsd, oracle, w3.eth.accounts[:max_accounts], min_faith=0.5E6, max_faith=1E6, use_faith=True, checkpoint=resume, decision_seed=args.seed if args.seed is not None else decision_seed)
     end_init = time.time()
     logger.info('INIT FINISHED {} (s)'.format(end_init - start_init))
 
     # Make a log file for system parameters, for analysis
-    stream = open("log.tsv", "a+")
+    if is_run_log:
+        run_log = RunLogWriter(args.run_log, RUN_LOG_COLUMNS)
+    else:
+        stream = open("log.tsv", "a+")
     
-    for i in range(50000):
+    first_step = model.step_count
+    start_run = time.time()
+    for i in range(model.step_count, args.steps):
         # Every block
         # Try and tick the model
         start_iter = time.time()
 
         (anyone_acted, seleted_advancer) = model.step()
+        if is_rpc_trace:
+            rpc_step = rpc_tracer.end_step()
+            logger.info("rpc: {}".format(json.dumps(rpc_step)))
+            if rpc_step['over_budget']:
+                logger.warning("Step {} went over its RPC call budget: {}".format(model.step_count, json.dumps(rpc_step['over_budget'])))
+            model.metrics.update({
+                'rpc_calls': rpc_step['calls'],
+                'rpc_requests': rpc_step['requests'],
+                'rpc_bytes': rpc_step['sent'] + rpc_step['received'],
+                'rpc_seconds': rpc_step['seconds'],
+            })
         if not anyone_acted:
             # Nobody could act
             logger.info("Nobody could act")
@@ -1666,8 +2066,37 @@ def main():
         end_iter = time.time()
         logger.info('iter: %s, sys time %s' % (i, end_iter-start_iter))
         # Log system state
-        current_timestamp = w3.eth.get_block('latest')['timestamp']
-        model.log(stream, seleted_advancer, current_timestamp, header=(i == 0))
+        if is_run_log:
+            run_log.append(model.metrics)
+        else:
+            current_timestamp = w3.eth.get_block('latest')['timestamp']
+            model.log(stream, seleted_advancer, current_timestamp, header=(i == 0))
+
+        if checkpoint_interval > 0 and model.step_count % checkpoint_interval == 0:
+            if is_run_log:
+                # Everything up to the checkpoint is on disk with it
+                run_log.flush()
+            model.save_checkpoint(CHECKPOINT_FILE)
+
+    if is_run_log:
+        run_log.close()
+    if is_rpc_trace:
+        logger.info("rpc totals: {}".format(json.dumps(rpc_tracer.summary())))
+
+    if args.report:
+        report = json.dumps({
+            'agents': len(model.agents),
+            'seed': args.seed,
+            'first_step': first_step,
+            'steps': model.step_count - first_step,
+            'init_seconds': end_init - start_init,
+            'run_seconds': time.time() - start_run,
+            # Linux counts this in KiB
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'rpc': rpc_tracer.summary() if is_rpc_trace else None,
+        }, indent=2)
+        with open(args.report, 'w') as f:
+            f.write(report)
         
 if __name__ == "__main__":
     main()
@@ -0,0 +1,67 @@
+"""
+multicall.py: client for the Multicall aggregator contract.
+
+Packs many contract view calls into a single eth_call against the Multicall
+contract, so every value comes from the same block. It has the same add() /
+execute() interface as rpc_batch.RPCBatch, so anything that can queue reads
+into a batch can queue them into a Multicall instead.
+"""
+
+from rpc_batch import BatchCall, decode_call_result
+
+class Multicall:
+    """
+    Queues contract view calls and reads them all in one call to the
+    Multicall contract's tryAggregate(), as an atomic snapshot of one block.
+    """
+
+    def __init__(self, w3, contract, block_identifier='latest'):
+        """
+        Wrap a Web3py contract object for the deployed Multicall contract.
+        """
+        self.w3 = w3
+        self.contract = contract
+        self.block_identifier = block_identifier
+        # Block number and timestamp the last execute() read at
+        self.block_number = None
+        self.block_timestamp = None
+        self.__calls = []
+
+    def __len__(self):
+        return len(self.__calls)
+
+    def add(self, prepared, transaction=None, transform=None):
+        """
+        Queue a prepared contract function call, like
+        contract.functions.totalCoupons(). transaction is accepted for
+        compatibility with RPCBatch but ignored: every call is made by the
+        Multicall contract. Returns a BatchCall to read after execute().
+        """
+        call = BatchCall(prepared, transaction or {}, transform)
+        self.__calls.append(call)
+        return call
+
+    def execute(self):
+        """
+        Read every queued call in one eth_call and resolve them all.
+
+        Calls that revert resolve to an error instead of failing the whole
+        snapshot.
+        """
+        calls, self.__calls = self.__calls, []
+        if len(calls) == 0:
+            return calls
+
+        packed = [(call.prepared.address, call.prepared._encode_transaction_data()) for call in calls]
+        (block_number, block_timestamp, results) = self.contract.functions.tryAggregate(False, packed).call(
+            block_identifier=self.block_identifier
+        )
+        self.block_number = block_number
+        self.block_timestamp = block_timestamp
+
+        for call, (success, return_data) in zip(calls, results):
+            if success:
+                call.resolve(result=decode_call_result(self.w3, call, return_data))
+            else:
+                call.resolve(error={"message": "execution reverted", "data": return_data.hex()})
+        return calls
@@ -0,0 +1,138 @@
+"""
+nonces.py: fixed-layout binary nonce table, shared between processes through
+an mmap'd file.
+
+The file is a small header followed by one fixed-size slot per agent address.
+Each slot holds the next unused nonce for that address, and is locked on its
+own (fcntl byte-range lock for other processes, threading.Lock for other
+threads in this process), so agents never wait on each other and nobody has to
+parse the whole table to reserve a nonce.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+
+# magic, version, slot size, capacity, slots in use
+HEADER = struct.Struct('<4sHHII')
+# address (20 raw bytes), flags, next unused nonce, block the slot was seeded at
+SLOT = struct.Struct('<20sIQQ')
+
+MAGIC = b'AXNT'
+VERSION = 1
+
+# Slot has been seeded with a starting nonce
+FLAG_INITIALIZED = 1
+
+def address_to_bytes(address):
+    """
+    Turn a hex address string (checksummed or not) into its 20 raw bytes.
+    """
+    return bytes.fromhex(address[2:] if address.startswith('0x') else address)
+
+class NonceTable:
+    """
+    A table of next nonces, one slot per address, backed by a shared file.
+    """
+
+    def __init__(self, path, addresses=None, create=False):
+        """
+        Open the table at path. If create is True, (re)write the file with an
+        empty slot for each of the given addresses first.
+        """
+        self.path = path
+
+        if create:
+            addresses = list(addresses or [])
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, SLOT.size, len(addresses), len(addresses)))
+                for address in addresses:
+                    f.write(SLOT.pack(address_to_bytes(address), 0, 0, 0))
+
+        self.__file = open(path, 'r+b')
+        self.__mm = mmap.mmap(self.__file.fileno(), 0)
+
+        magic, version, slot_size, capacity, count = HEADER.unpack_from(self.__mm, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT.size:
+            raise ValueError("Not a nonce table: {}".format(path))
+
+        # Addresses never move once written, so the index is built once.
+        # This maps from lowercase hex address to slot offset.
+        self.__offsets = {}
+        for i in range(count):
+            offset = HEADER.size + i * SLOT.size
+            raw_address = SLOT.unpack_from(self.__mm, offset)[0]
+            self.__offsets['0x' + raw_address.hex()] = offset
+
+        self.__thread_locks = {offset: threading.Lock() for offset in self.__offsets.values()}
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __contains__(self, address):
+        return getattr(address, 'address', address).lower() in self.__offsets
+
+    def __offset(self, address):
+        address = getattr(address, 'address', address)
+        try:
+            return self.__offsets[address.lower()]
+        except KeyError:
+            raise KeyError("No nonce slot for {}".format(address))
+
+    def __lock(self, offset):
+        self.__thread_locks[offset].acquire()
+        fcntl.lockf(self.__file.fileno(), fcntl.LOCK_EX, SLOT.size, offset, os.SEEK_SET)
+
+    def __unlock(self, offset):
+        fcntl.lockf(self.__file.fileno(), fcntl.LOCK_UN, SLOT.size, offset, os.SEEK_SET)
+        self.__thread_locks[offset].release()
+
+    def reserve(self, address, floor=0, seen_block=0):
+        """
+        Hand out the next nonce for the given address (or thing with an
+        .address), and move the slot past it.
+
+        floor is the chain's transaction count for the address. It seeds a
+        fresh slot, and a slot that has fallen behind the chain is moved up to
+        it.
+        """
+        offset = self.__offset(address)
+        self.__lock(offset)
+        try:
+            raw_address, flags, next_nonce, slot_block = SLOT.unpack_from(self.__mm, offset)
+            if not (flags & FLAG_INITIALIZED):
+                flags |= FLAG_INITIALIZED
+                slot_block = seen_block
+            nonce = max(next_nonce, floor)
+            SLOT.pack_into(self.__mm, offset, raw_address, flags, nonce + 1, slot_block)
+            return nonce
+        finally:
+            self.__unlock(offset)
+
+    def peek(self, address):
+        """
+        Get the next nonce that would be handed out for the address, or None
+        if the slot was never seeded.
+        """
+        offset = self.__offset(address)
+        _, flags, next_nonce, _ = SLOT.unpack_from(self.__mm, offset)
+        return next_nonce if flags & FLAG_INITIALIZED else None
+
+    def set(self, address, next_nonce, seen_block=0):
+        """
+        Force the next nonce for the address, e.g. after re-reading the
+        transaction count from the chain.
+        """
+        offset = self.__offset(address)
+        self.__lock(offset)
+        try:
+            raw_address = SLOT.unpack_from(self.__mm, offset)[0]
+            SLOT.pack_into(self.__mm, offset, raw_address, FLAG_INITIALIZED, next_nonce, seen_block)
+        finally:
+            self.__unlock(offset)
+
+    def close(self):
+        self.__mm.close()
+        self.__file.close()
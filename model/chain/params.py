@@ -0,0 +1,29 @@
+"""
+params.py: what can change from one model run to the next.
+
+Model and SimModel take these as keyword arguments, so a parameter sweep
+(sweep.py) can vary them per run instead of by editing constants.
+"""
+
+# Model-level parameters and their defaults
+MODEL_DEFAULTS = {
+    # Furthest out a coupon bid may expire, in epochs
+    'max_coupon_exp': 131400,
+    # Most coupons bid for per xSD burned
+    'max_coupon_premium': 10.0,
+    # Epoch agents start acting at
+    'bootstrap_epoch': 2,
+    # Most USDT an agent starts with, in tokens
+    'max_usdt': 100000000,
+    # Most AVAX an agent starts with, in tokens
+    'max_avax': 1000000,
+    # Least USDT the pool must hold for anyone to coupon bid, in tokens
+    'min_usdt_balance': 1,
+}
+
+def model_params(kwargs):
+    """
+    Take the model-level parameters out of a kwargs dict, filling in
+    defaults. What is left is for the agents.
+    """
+    return {name: kwargs.pop(name, default) for name, default in MODEL_DEFAULTS.items()}
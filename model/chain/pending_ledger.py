@@ -0,0 +1,132 @@
+"""
+pending_ledger.py: what agents' own transactions are expected to do to their
+balances, before the token ledgers have seen them.
+
+A TokenProxy only moves when update() reads the Transfer events, at the start
+of a step. Until then an agent that has already bought, sold, bid or
+redeemed in the step still sees its old balances, and sizes its next
+transaction on tokens it has spent. A PendingLedger holds the expected
+effect of each submitted transaction, per token and holder, and the token
+proxies add it to the balances they hand out. What a transaction spends is
+taken at its full amount, and what it pays out at the least it can pay
+without reverting, so the balances agents see never run ahead of what they
+will have.
+
+An effect goes away when its token's ledger has the transaction's real
+Transfer events, or as soon as the transaction is known to have failed.
+"""
+
+def _address(thing):
+    return getattr(thing, 'address', thing)
+
+def _hash(tx):
+    # A transaction hash, or an async_submit.PendingTx that may have one by now
+    tx_hash = getattr(tx, 'hash', tx)
+    return bytes(tx_hash) if isinstance(tx_hash, (bytes, bytearray)) else None
+
+class PendingLedger:
+    """
+    Expected balance changes from transactions in flight.
+    """
+
+    def __init__(self):
+        # This maps from the transaction (as submitted) to a list of
+        # (token address, holder address, change in atomic units)
+        self.__effects = {}
+        # This maps from (token address, holder address) to the summed change
+        self.__totals = {}
+        # Transactions mined successfully, whose effects stay until each
+        # token's next update
+        self.__landed = set()
+
+        # Counters
+        self.expected = 0
+        self.reconciled = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.__effects)
+
+    def expect(self, tx, effects):
+        """
+        Record what a submitted transaction should do: effects is a list of
+        (token, holder, Balance change), where token and holder are
+        addresses or things with addresses. tx is the transaction hash, or
+        anything else hashable that identifies it. Does nothing for a
+        transaction that was never made (None).
+        """
+        if tx is None:
+            return
+        recorded = self.__effects.setdefault(tx, [])
+        for (token, holder, change) in effects:
+            key = (_address(token), _address(holder))
+            wei = change.to_wei()
+            recorded.append((key[0], key[1], wei))
+            self.__totals[key] = self.__totals.get(key, 0) + wei
+        self.expected += 1
+
+    def change(self, token, holder):
+        """
+        Get the expected change to holder's balance of token, in atomic
+        units.
+        """
+        return self.__totals.get((_address(token), _address(holder)), 0)
+
+    def landed(self, tx, status):
+        """
+        Note a transaction's receipt status. A failed one changes nothing, so
+        its effects go now. A successful one keeps them until the tokens'
+        ledgers catch up with its block.
+        """
+        if tx not in self.__effects:
+            return
+        if status:
+            self.__landed.add(tx)
+        else:
+            self.__drop(tx, None)
+            self.dropped += 1
+
+    def reconcile(self, token, tx_hashes=()):
+        """
+        Drop the expected effects on token of the given transactions, whose
+        Transfer events its ledger has just applied, and of every
+        transaction that has landed, since the ledger is now up to date
+        with them.
+        """
+        token = _address(token)
+        tx_hashes = set(bytes(tx_hash) for tx_hash in tx_hashes)
+        for tx in list(self.__effects):
+            if tx in self.__landed or _hash(tx) in tx_hashes:
+                if self.__drop(tx, token):
+                    self.reconciled += 1
+
+    def __drop(self, tx, token):
+        """
+        Take out a transaction's effects on token, or on every token if
+        token is None. Returns True if that left it with none.
+        """
+        kept = []
+        for (effect_token, holder, wei) in self.__effects[tx]:
+            if token is not None and effect_token != token:
+                kept.append((effect_token, holder, wei))
+                continue
+            key = (effect_token, holder)
+            total = self.__totals[key] - wei
+            if total == 0:
+                del self.__totals[key]
+            else:
+                self.__totals[key] = total
+        if kept:
+            self.__effects[tx] = kept
+            return False
+        del self.__effects[tx]
+        self.__landed.discard(tx)
+        return True
+
+    def stats(self):
+        return {
+            'in_flight': len(self.__effects),
+            'expected': self.expected,
+            'reconciled': self.reconciled,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,203 @@
+"""
+population.py: decide what every agent does in a step, all at once.
+
+Going agent by agent, Model.step builds a strategy dict, takes a sine for the
+agent's faith, does several Balance operations to see which actions the
+agent can take, and calls random.choices() with its own weight list. A
+Population keeps the agents' balances, coupons and faith bounds in NumPy
+arrays instead, and makes the same decisions for everyone in one vectorized
+pass, drawing from its own seeded Generator. The weights and the rules for
+what an agent can do are the same as Strategy.get_strategy() and Model.step.
+
+The result is an action table: one row per agent, in the order the agents
+act, with the action picked and the random draws the action needs.
+"""
+
+import math
+
+import numpy as np
+
+# In the order Model.step lists options
+ACTIONS = ('buy', 'sell', 'coupon_bid', 'provide_liquidity', 'remove_liquidity')
+(BUY, SELL, COUPON_BID, PROVIDE_LIQUIDITY, REMOVE_LIQUIDITY) = range(len(ACTIONS))
+NO_ACTION = -1
+
+ACTION_DTYPE = np.dtype([
+    # Index into Population.addresses
+    ('agent', np.int32),
+    # Index into ACTIONS, or NO_ACTION
+    ('action', np.int8),
+    # Fraction of what it could do that the agent does
+    ('commitment', np.float64),
+    # Uniform draws for the coupon bid expiry and premium
+    ('expiry_draw', np.float64),
+    ('premium_draw', np.float64),
+])
+
+def portion_dedusted(wei, fraction, scale):
+    """
+    balance.portion_dedusted() over arrays of atomic units, for tokens with
+    the given 10**decimals scale.
+    """
+    part = np.floor(wei * fraction)
+    return np.where((wei - part) / scale <= 1, wei, part)
+
+def _wei(value):
+    return value.to_wei() if hasattr(value, 'to_wei') else value
+
+class Population:
+    """
+    Every agent's state that goes into its decisions, as arrays.
+    """
+
+    def __init__(self, addresses, max_faith, min_faith, use_faith=True, usdt_decimals=6, xsd_decimals=18, seed=None,
+                 provide_liquidity_weight=0.1, remove_liquidity_weight=0.1):
+        """
+        Faith bounds, use_faith and the liquidity weights can be one value
+        for everyone or one per agent.
+        """
+        self.addresses = list(addresses)
+        # This maps from address to row
+        self.index = {address: i for i, address in enumerate(self.addresses)}
+        n = len(self.addresses)
+
+        self.max_faith = np.broadcast_to(np.asarray(max_faith, dtype=np.float64), (n,)).copy()
+        self.min_faith = np.broadcast_to(np.asarray(min_faith, dtype=np.float64), (n,)).copy()
+        self.use_faith = np.broadcast_to(np.asarray(use_faith, dtype=bool), (n,)).copy()
+        self.provide_liquidity_weight = np.broadcast_to(np.asarray(provide_liquidity_weight, dtype=np.float64), (n,)).copy()
+        self.remove_liquidity_weight = np.broadcast_to(np.asarray(remove_liquidity_weight, dtype=np.float64), (n,)).copy()
+        self.usdt_scale = 10.0**usdt_decimals
+        self.xsd_scale = 10.0**xsd_decimals
+
+        # Balances in atomic units, as of the last load()
+        self.usdt = np.zeros(n)
+        self.xsd = np.zeros(n)
+        self.lp = np.zeros(n)
+        self.coupons = np.zeros(n)
+
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_agents(cls, agents, seed=None):
+        """
+        Make a Population for Agents (or SimAgents), with their faith bounds
+        and liquidity weights.
+        """
+        return cls(
+            [a.address for a in agents],
+            [a.max_faith for a in agents],
+            [a.min_faith for a in agents],
+            [a.use_faith for a in agents],
+            usdt_decimals=agents[0].usdt_token.decimals,
+            xsd_decimals=agents[0].xsd_token.decimals,
+            seed=seed,
+            provide_liquidity_weight=[a.provide_liquidity_weight for a in agents],
+            remove_liquidity_weight=[a.remove_liquidity_weight for a in agents]
+        )
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def load(self, usdt, xsd, lp, coupons):
+        """
+        Set everyone's balances from dicts of address to Balance (or atomic
+        units), like the agents' ledger balances and the 'agent_coupons' of
+        Model.snapshot().
+        Anyone missing has none.
+        """
+        n = len(self.addresses)
+        for (array, values) in [(self.usdt, usdt), (self.xsd, xsd), (self.lp, lp), (self.coupons, coupons)]:
+            array[:] = np.fromiter((float(_wei(values.get(a, 0))) for a in self.addresses), np.float64, n)
+
+    def faith(self, current_timestamp):
+        """
+        Strategy.get_faith() for everyone, in USDT.
+        """
+        center_faith = (self.max_faith + self.min_faith) / 2
+        swing_faith = (self.max_faith - self.min_faith) / 2
+        return center_faith + swing_faith * math.sin(current_timestamp * (2 * math.pi / 5000000))
+
+    def weights(self, current_timestamp, price, total_supply):
+        """
+        Strategy.get_strategy() for everyone, as a row of ACTIONS weights per
+        agent.
+        """
+        weights = np.empty((len(self.addresses), len(ACTIONS)))
+        weights[:, BUY] = 1.0
+        weights[:, SELL] = 1.0
+        weights[:, COUPON_BID] = 2.0
+        weights[:, PROVIDE_LIQUIDITY] = self.provide_liquidity_weight
+        if price >= 1.0:
+            weights[:, REMOVE_LIQUIDITY] = self.remove_liquidity_weight
+        else:
+            weights[:, REMOVE_LIQUIDITY] = np.where(self.coupons > 0, 4.0, 1.0)
+
+        # Sell if there is more xSD than we think ought to exist
+        over_valued = price * float(total_supply) > self.faith(current_timestamp)
+        weights[self.use_faith & over_valued, SELL] = 2.0
+        return weights
+
+    def eligible(self, commitment, is_pgl_op, can_coupon_bid):
+        """
+        Which ACTIONS each agent can take, as Model.step decides it, given
+        everyone's commitment. can_coupon_bid is whether the pool and DAO
+        allow coupon bids at all.
+        """
+        usdt = portion_dedusted(self.usdt, commitment, self.usdt_scale)
+        xsd = portion_dedusted(self.xsd, commitment, self.xsd_scale)
+
+        mask = np.empty((len(self.addresses), len(ACTIONS)), dtype=bool)
+        mask[:, BUY] = (usdt > 0) & is_pgl_op
+        mask[:, SELL] = (xsd > 0) & is_pgl_op
+        mask[:, COUPON_BID] = (xsd >= self.xsd_scale) & can_coupon_bid
+        mask[:, PROVIDE_LIQUIDITY] = (usdt > 0) & (xsd > 0)
+        mask[:, REMOVE_LIQUIDITY] = self.lp > 0
+        return mask
+
+    def decide(self, order, current_timestamp, price, total_supply, is_pgl_op, can_coupon_bid):
+        """
+        Pick everyone's action for the step. order is the addresses in the
+        order the agents act.
+
+        Returns an ACTION_DTYPE table with a row per agent, in that order.
+        """
+        rows = np.fromiter((self.index[address] for address in order), np.int32, len(order))
+        n = len(self.addresses)
+
+        commitment = self.rng.random(n) * 0.1
+        weights = self.weights(current_timestamp, price, total_supply)
+        weights *= self.eligible(commitment, is_pgl_op, can_coupon_bid)
+
+        # Like random.choices(): the first action whose cumulative weight
+        # passes a uniform draw over the total, skipping zero weights
+        cumulative = np.cumsum(weights, axis=1)
+        total = cumulative[:, -1]
+        draw = self.rng.random(n) * total
+        picked = np.minimum((cumulative <= draw[:, None]).sum(axis=1), len(ACTIONS) - 1)
+
+        table = np.empty(len(rows), dtype=ACTION_DTYPE)
+        table['agent'] = rows
+        table['action'] = np.where(total > 0, picked, NO_ACTION)[rows]
+        table['commitment'] = commitment[rows]
+        table['expiry_draw'] = self.rng.random(n)[rows]
+        table['premium_draw'] = self.rng.random(n)[rows]
+        return table
+
+    def actions(self, table):
+        """
+        Turn an action table into a list of (action name or None, commitment,
+        expiry draw, premium draw), in table order, as plain Python values.
+        """
+        return [
+            (ACTIONS[action] if action != NO_ACTION else None, commitment, expiry_draw, premium_draw)
+            for (_, action, commitment, expiry_draw, premium_draw) in table.tolist()
+        ]
+
+    def rng_state(self):
+        """
+        Get the Generator's state as JSON-able data, for checkpoints.
+        """
+        return self.rng.bit_generator.state
+
+    def set_rng_state(self, state):
+        self.rng.bit_generator.state = state
@@ -0,0 +1,195 @@
+"""
+receipts.py: wait for many transaction receipts at once.
+
+waitForTransactionReceipt polls one hash at a time, so waiting on a step's
+worth of transactions costs a round trip per hash, every poll. A
+ReceiptCollector subscribes to newHeads on its own websocket connection, and
+every time the head moves it asks for the receipts of everything still being
+waited on in one JSON-RPC batch.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+
+import websockets
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from web3.exceptions import TimeExhausted
+from web3._utils.method_formatters import receipt_formatter
+
+from rpc_batch import make_batch_request
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC ids for our requests
+_request_ids = itertools.count()
+
+# Longest to wait for a new head while subscribed, in case one goes missing (seconds)
+SUBSCRIBED_WAIT = 1.0
+
+class ReceiptCollector:
+    """
+    Resolves transaction hashes to receipts in bulk, once per new block.
+    """
+
+    def __init__(self, provider, ws_uri, poll_interval=0.01):
+        """
+        provider is the web3 provider to fetch receipts with. ws_uri is the
+        websocket endpoint to subscribe to newHeads on. Until the
+        subscription is made, or once it drops, waits fall back to checking
+        every poll_interval seconds.
+        """
+        self.provider = provider
+        self.ws_uri = ws_uri
+        self.poll_interval = poll_interval
+
+        # Counters
+        self.heads_seen = 0
+        self.fetches = 0
+
+        self.__head = None
+        self.__subscribed = False
+        self.__head_changed = threading.Condition()
+        self.__thread = None
+        self.__closed = False
+        # This maps from tx hash hex to receipt, for receipts fetched but not yet handed out
+        self.__receipts = {}
+
+    def start(self):
+        """
+        Start listening for new heads, if we aren't already.
+        """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__listen, name='newHeads', daemon=True)
+            self.__thread.start()
+
+    def close(self):
+        self.__closed = True
+
+    def __listen(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.__subscribe())
+        except Exception as inst:
+            logger.info({"error": inst, "action": "newHeads subscription"})
+        finally:
+            # Back to polling
+            self.__subscribed = False
+
+    async def __subscribe(self):
+        async with websockets.connect(self.ws_uri, max_size=None) as conn:
+            await conn.send(json.dumps({
+                'jsonrpc': '2.0',
+                'id': next(_request_ids),
+                'method': 'eth_subscribe',
+                'params': ['newHeads'],
+            }))
+            reply = json.loads(await conn.recv())
+            if 'error' in reply:
+                raise ValueError(reply['error'])
+            self.__subscribed = True
+
+            while not self.__closed:
+                message = json.loads(await conn.recv())
+                head = message.get('params', {}).get('result', {}).get('number')
+                if head is None:
+                    continue
+                with self.__head_changed:
+                    self.__head = int(head, 16)
+                    self.heads_seen += 1
+                    self.__head_changed.notify_all()
+
+    def __wait_for_head(self, seen_head, timeout):
+        """
+        Block until the head moves past seen_head, or timeout seconds pass.
+        Returns the head we know of.
+        """
+        with self.__head_changed:
+            if self.__head == seen_head:
+                interval = SUBSCRIBED_WAIT if self.__subscribed else self.poll_interval
+                self.__head_changed.wait(min(timeout, interval))
+            return self.__head
+
+    def __fetch(self, keys):
+        """
+        Ask for the receipts of all the given tx hashes in one batch, and
+        remember the ones that have been mined.
+        """
+        requests = [{
+            'jsonrpc': '2.0',
+            'id': next(_request_ids),
+            'method': 'eth_getTransactionReceipt',
+            'params': [key],
+        } for key in keys]
+        responses = make_batch_request(self.provider, requests)
+        self.fetches += 1
+
+        for key, response in zip(keys, responses):
+            if 'error' in response:
+                raise ValueError(response['error'])
+            if response.get('result') is not None:
+                self.__receipts[key] = AttributeDict.recursive(receipt_formatter(response['result']))
+
+    def __collect(self, tx_hashes, timeout, need):
+        """
+        Wait until need(resolved keys) is true, fetching receipts once per
+        new head. Returns the keys for tx_hashes.
+        """
+        self.start()
+        keys = [HexBytes(tx_hash).hex() for tx_hash in tx_hashes]
+        deadline = time.monotonic() + timeout
+        head = self.__head
+
+        while True:
+            waiting = [key for key in dict.fromkeys(keys) if key not in self.__receipts]
+            if len(waiting) > 0:
+                self.__fetch(waiting)
+            if need([key for key in keys if key in self.__receipts]):
+                return keys
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeExhausted(
+                    "Transactions {} are not in the chain after {} seconds".format(
+                        [key for key in keys if key not in self.__receipts], timeout
+                    )
+                )
+            head = self.__wait_for_head(head, remaining)
+
+    def wait_all(self, tx_hashes, timeout=120):
+        """
+        Wait for every one of the given transactions to be mined. Returns
+        their receipts, in the same order. Raises TimeExhausted if they aren't
+        all in after timeout seconds.
+        """
+        tx_hashes = list(tx_hashes)
+        keys = self.__collect(tx_hashes, timeout, lambda done: len(done) == len(tx_hashes))
+        receipts = [self.__receipts[key] for key in keys]
+        for key in keys:
+            self.__receipts.pop(key, None)
+        return receipts
+
+    def wait_some(self, tx_hashes, timeout=120):
+        """
+        Wait for at least one of the given transactions to be mined. Returns
+        a receipt, or None if it isn't mined yet, for each of them, from the
+        same lookups that found the first. Raises TimeExhausted if none are
+        in after timeout seconds.
+        """
+        tx_hashes = list(tx_hashes)
+        keys = self.__collect(tx_hashes, timeout, lambda done: len(done) > 0)
+        receipts = [self.__receipts.get(key) for key in keys]
+        for key in keys:
+            self.__receipts.pop(key, None)
+        return receipts
+
+    def wait(self, tx_hash, timeout=120):
+        """
+        Wait for one transaction, like waitForTransactionReceipt.
+        """
+        return self.wait_all([tx_hash], timeout)[0]
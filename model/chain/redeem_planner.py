@@ -0,0 +1,104 @@
+"""
+redeem_planner.py: redeem everyone's coupons as one planned batch.
+
+The step used to walk the agents in shuffled order, read totalRedeemable
+again for each, and send each agent's redeemCoupons one expiry at a time,
+issuing a block after every one. redeemCoupons only takes an account's whole
+balance for an expiry, and only if all of it fits in what is redeemable, so
+whoever came first in the shuffle could leave the rest unpaid.
+
+plan_redemptions() works out the whole fill from one totalRedeemable and the
+coupon ledger instead: earliest expiry first, across every account, so the
+coupons closest to expiring get paid first, with the last one filled in part
+(Market.redeemCouponsForAccount takes any amount). One keeper account then
+sends the plan through redeemCouponsForAccount on consecutive nonces, without
+waiting on receipts, and a block is issued for each block's worth.
+
+RedemptionStats counts what redeeming costs (transactions, blocks and wall
+time per coupon redeemed) either way, so the two can be compared from the
+logs.
+"""
+
+# Gas limit for one redeemCouponsForAccount, and for a block
+REDEEM_FOR_ACCOUNT_GAS = 300000
+BLOCK_GAS_LIMIT = 8000000
+
+def plan_redemptions(ledger, total_redeemable, accounts=None):
+    """
+    Work out what total_redeemable (in atomic units) pays out from a
+    coupon_ledger.CouponLedger. Returns a list of (expiry epoch, address,
+    coupons), earliest expiry first, where the last may be only part of
+    the account's balance. If accounts is given, only addresses in it are
+    paid.
+    """
+    plan = []
+    left = total_redeemable
+    for (epoch, address, coupons) in ledger.by_expiry():
+        if left <= 0:
+            break
+        if accounts is not None and address not in accounts:
+            continue
+        amount = min(coupons, left)
+        plan.append((epoch, address, amount))
+        left -= amount
+    return plan
+
+def per_block(gas=REDEEM_FOR_ACCOUNT_GAS, block_gas_limit=BLOCK_GAS_LIMIT):
+    """
+    Get how many transactions of the given gas limit fit in a block.
+    """
+    return max(1, block_gas_limit // gas)
+
+class RedemptionStats:
+    """
+    Running totals of what redemptions cost.
+    """
+
+    def __init__(self, decimals=18):
+        self.decimals = decimals
+        self.steps = 0
+        self.transactions = 0
+        self.blocks = 0
+        self.seconds = 0.0
+        # Coupons paid out by transactions that went through, in atomic units
+        self.redeemed = 0
+        self.reverted = 0
+
+    def record(self, transactions, blocks, seconds):
+        """
+        Count one step's redemptions: how many transactions were sent, how
+        many blocks were issued for them and how long it all took.
+        """
+        if transactions == 0:
+            return
+        self.steps += 1
+        self.transactions += transactions
+        self.blocks += blocks
+        self.seconds += seconds
+
+    def landed(self, coupons, status):
+        """
+        Count a redemption's outcome, once its receipt is in.
+        """
+        if status:
+            self.redeemed += coupons
+        else:
+            self.reverted += 1
+
+    def summary(self):
+        """
+        Get the totals, and the costs per coupon redeemed, as a JSON-able
+        dict.
+        """
+        coupons = self.redeemed / 10**self.decimals
+        return {
+            'steps': self.steps,
+            'transactions': self.transactions,
+            'reverted': self.reverted,
+            'blocks': self.blocks,
+            'seconds': round(self.seconds, 3),
+            'coupons': coupons,
+            'tx_per_coupon': self.transactions / coupons if coupons > 0 else None,
+            'blocks_per_coupon': self.blocks / coupons if coupons > 0 else None,
+            'seconds_per_coupon': self.seconds / coupons if coupons > 0 else None,
+        }
@@ -0,0 +1,191 @@
+"""
+rpc_batch.py: collect contract view calls into a single JSON-RPC batch request.
+
+Web3py sends one request per eth_call. Over the websocket provider every one of
+those is a full round trip, so a step that needs a dozen values waits a dozen
+times. An RPCBatch queues prepared contract function calls, sends them all as
+one JSON-RPC array against the same block, and decodes each result exactly like
+ContractFunction.call() would.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3._utils.request import make_post_request
+from hexbytes import HexBytes
+
+# JSON-RPC ids for batch entries, unique across batches in this process
+_request_ids = itertools.count()
+
+def make_batch_request(provider, requests):
+    """
+    Send a list of JSON-RPC request dicts as one batch over the given web3
+    provider, and return the list of response dicts in the same order.
+    If an rpc_trace.RPCTracer is installed on the provider, it counts the
+    batch.
+    """
+    request_data = json.dumps(requests).encode('utf8')
+    start = time.perf_counter()
+
+    raw_response = None
+    if isinstance(provider, Web3.WebsocketProvider):
+        future = asyncio.run_coroutine_threadsafe(
+            provider.coro_make_request(request_data),
+            Web3.WebsocketProvider._loop
+        )
+        responses = future.result()
+    else:
+        raw_response = make_post_request(
+            provider.endpoint_uri,
+            request_data,
+            **provider.get_request_kwargs()
+        )
+        responses = json.loads(raw_response)
+
+    tracer = getattr(provider, 'rpc_tracer', None)
+    if tracer is not None:
+        tracer.record_batch(
+            requests, responses, len(request_data),
+            None if raw_response is None else len(raw_response),
+            time.perf_counter() - start
+        )
+
+    if isinstance(responses, dict):
+        # The node rejected the batch as a whole
+        raise ValueError(responses.get('error', responses))
+
+    # Batch responses may come back in any order
+    by_id = {response['id']: response for response in responses}
+    return [by_id[request['id']] for request in requests]
+
+def decode_call_result(w3, call, raw_result):
+    """
+    Decode the raw return data of a BatchCall the same way
+    ContractFunction.call() would, then apply the call's transform.
+    """
+    if hasattr(call.prepared, 'decode'):
+        # A call_plans.PlannedCall knows its own output types
+        value = call.prepared.decode(raw_result)
+        return call.transform(value) if call.transform else value
+    output_types = get_abi_output_types(call.prepared.abi)
+    decoded = w3.codec.decode_abi(output_types, HexBytes(raw_result))
+    normalized = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+    value = normalized[0] if len(normalized) == 1 else list(normalized)
+    return call.transform(value) if call.transform else value
+
+class BatchCall:
+    """
+    A contract view call queued in an RPCBatch. Holds its decoded result once
+    the batch has executed.
+    """
+
+    def __init__(self, prepared, transaction, transform):
+        self.prepared = prepared
+        self.transaction = transaction
+        self.transform = transform
+        self.executed = False
+        self.__result = None
+        self.__error = None
+
+    def resolve(self, result=None, error=None):
+        self.__result = result
+        self.__error = error
+        self.executed = True
+
+    def result(self):
+        """
+        Get the decoded (and transformed) return value of the call.
+        Raises ValueError if the node returned an error for it.
+        """
+        if not self.executed:
+            raise RuntimeError("Batch has not been executed yet")
+        if self.__error is not None:
+            raise ValueError(self.__error)
+        return self.__result
+
+class RPCBatch:
+    """
+    Queues eth_calls for contract view functions and runs them all in one
+    JSON-RPC batch request against a single block.
+    """
+
+    def __init__(self, w3, provider, block_identifier='latest'):
+        self.w3 = w3
+        self.provider = provider
+        self.block_identifier = block_identifier
+        # Block the last execute() read from, when known
+        self.block_number = None
+        self.__calls = []
+
+    def __len__(self):
+        return len(self.__calls)
+
+    def add(self, prepared, transaction=None, transform=None):
+        """
+        Queue a prepared contract function call, like
+        contract.functions.totalCoupons(). transaction can carry 'from' and
+        'gas' like contract.caller(...). transform, if set, is applied to the
+        decoded value. Returns a BatchCall to read the result from after
+        execute().
+        """
+        call = BatchCall(prepared, transaction or {}, transform)
+        self.__calls.append(call)
+        return call
+
+    def __block_param(self):
+        if isinstance(self.block_identifier, int):
+            return hex(self.block_identifier)
+        return self.block_identifier
+
+    def __request(self, call):
+        params = {
+            'to': call.prepared.address,
+            'data': call.prepared._encode_transaction_data(),
+        }
+        if 'from' in call.transaction:
+            params['from'] = call.transaction['from']
+        if 'gas' in call.transaction:
+            params['gas'] = hex(call.transaction['gas'])
+
+        return {
+            'jsonrpc': '2.0',
+            'id': next(_request_ids),
+            'method': 'eth_call',
+            'params': [params, self.__block_param()],
+        }
+
+    def execute(self):
+        """
+        Send every queued call in one batch request and resolve them all.
+        """
+        calls, self.__calls = self.__calls, []
+        if len(calls) == 0:
+            return calls
+
+        requests = [self.__request(call) for call in calls]
+        if isinstance(self.block_identifier, int):
+            self.block_number = self.block_identifier
+        else:
+            # Ride along a head lookup so callers know (roughly) which block
+            # they read. A JSON-RPC batch is not atomic across blocks.
+            requests.append({
+                'jsonrpc': '2.0',
+                'id': next(_request_ids),
+                'method': 'eth_blockNumber',
+                'params': [],
+            })
+        responses = make_batch_request(self.provider, requests)
+        if not isinstance(self.block_identifier, int):
+            self.block_number = int(responses.pop()['result'], 16)
+
+        for call, response in zip(calls, responses):
+            if 'error' in response:
+                call.resolve(error=response['error'])
+            else:
+                call.resolve(result=decode_call_result(self.w3, call, response['result']))
+        return calls
@@ -0,0 +1,325 @@
+"""
+rpc_trace.py: count and time every JSON-RPC call the model makes.
+
+A step's time goes to eth_call, eth_sendTransaction, receipt and block
+lookups, debug_increaseTime and avax.issueBlock, over two providers and the
+batches in rpc_batch.py, and nothing said which. An RPCTracer sits under
+each provider's make_request (install()), and under make_batch_request, and
+keeps, per JSON-RPC method, per calling site and per Model.step phase: calls,
+JSON-RPC requests carried (more than one for a batch), bytes sent and
+received, time spent, and a histogram of latencies. Bytes received are
+counted off the raw response; calls whose raw response we don't get to see
+are counted as unmeasured instead.
+
+The calling site is the innermost frame that belongs to a class registered
+with add_site() (TokenProxy, PangolinPool, DAO, Model), found by walking up
+the stack and looking frames' code objects up in a dict. The phase is
+whatever Model.step last said it was doing; the wall time spent in each
+phase, RPC or not, is kept too.
+
+Each step's counts are kept apart as well; end_step() hands them back and
+flags any the step's call budgets were exceeded for. Everything is a few
+dict lookups and additions per call, against calls that take at least a
+round trip, so it can stay on.
+"""
+
+import bisect
+import json
+import sys
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets (seconds): 0.1 ms, doubling
+# up to about 3.5 minutes, then everything slower
+LATENCY_BOUNDS = [0.0001 * 2**k for k in range(22)]
+
+# Site and phase for calls made from nowhere registered, or outside a step
+OTHER = 'other'
+
+class CallStats:
+    """
+    Totals for one method, site or phase.
+    """
+
+    __slots__ = ('calls', 'requests', 'sent', 'received', 'unmeasured', 'seconds', 'slowest', 'histogram')
+
+    def __init__(self, histogram=True):
+        self.calls = 0
+        self.requests = 0
+        self.sent = 0
+        self.received = 0
+        # Calls we don't know the received size of
+        self.unmeasured = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        # Counts per LATENCY_BOUNDS bucket, and one for slower than all of them
+        self.histogram = [0] * (len(LATENCY_BOUNDS) + 1) if histogram else None
+
+    def add(self, requests, sent, received, seconds):
+        """
+        Count a call. received may be None if its size is unknown.
+        """
+        self.calls += 1
+        self.requests += requests
+        self.sent += sent
+        if received is None:
+            self.unmeasured += 1
+        else:
+            self.received += received
+        self.seconds += seconds
+        if seconds > self.slowest:
+            self.slowest = seconds
+        if self.histogram is not None:
+            self.histogram[bisect.bisect_left(LATENCY_BOUNDS, seconds)] += 1
+
+    def percentile(self, fraction):
+        """
+        Get the latency (seconds) that fraction of calls took no longer than,
+        to within a histogram bucket: the bucket's upper bound, or the
+        slowest call if that is sooner.
+        """
+        if not self.histogram or self.calls == 0:
+            return None
+        wanted = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= wanted and count > 0:
+                if bucket == len(LATENCY_BOUNDS):
+                    return self.slowest
+                return min(LATENCY_BOUNDS[bucket], self.slowest)
+        return self.slowest
+
+    def summary(self):
+        """
+        Get the totals as a JSON-able dict, with latency percentiles and the
+        nonzero histogram buckets (keyed by upper bound in ms) if we have
+        them.
+        """
+        summary = {
+            'calls': self.calls,
+            'requests': self.requests,
+            'sent': self.sent,
+            'received': self.received,
+            'unmeasured': self.unmeasured,
+            'seconds': round(self.seconds, 6),
+            'slowest': round(self.slowest, 6),
+        }
+        if self.histogram is not None:
+            summary['mean'] = round(self.seconds / self.calls, 6) if self.calls else None
+            summary['p50'] = self.percentile(0.5)
+            summary['p99'] = self.percentile(0.99)
+            summary['histogram'] = {
+                ('%g' % (bound * 1000) if bucket < len(LATENCY_BOUNDS) else 'inf'): count
+                for bucket, (bound, count) in enumerate(zip(LATENCY_BOUNDS + [None], self.histogram))
+                if count > 0
+            }
+        return summary
+
+class RPCTracer:
+    """
+    Counts and times JSON-RPC calls by method, calling site and step phase,
+    in total and for the current step.
+    """
+
+    def __init__(self, budgets=None):
+        """
+        budgets maps a method, site or phase name, or '*' for every call, to
+        the most calls a step should make to it. end_step() flags the ones
+        a step goes over.
+        """
+        self.budgets = dict(budgets or {})
+        # This maps from code object to the site name it belongs to
+        self.__sites = {}
+        self.__phase = OTHER
+        self.__phase_start = time.perf_counter()
+        self.__lock = threading.Lock()
+        # Byte counts of the message being sent or received, per thread, when
+        # the provider lets us see them
+        self.__wire = threading.local()
+
+        # This maps from 'method', 'site' and 'phase' to name to CallStats,
+        # over the whole run and for this step
+        self.totals = {'method': {}, 'site': {}, 'phase': {}}
+        self.__step = {'method': {}, 'site': {}, 'phase': {}}
+        # This maps from phase to wall time spent in it (seconds), over the
+        # whole run and for this step
+        self.phase_seconds = {}
+        self.__step_phase_seconds = {}
+
+        # Counters
+        self.steps = 0
+        self.steps_over_budget = 0
+
+    def add_site(self, cls, name=None):
+        """
+        Attribute calls made from within cls's methods (and properties) to
+        name, or to the class's name.
+        """
+        name = name or cls.__name__
+        for value in vars(cls).values():
+            if isinstance(value, property):
+                value = value.fget
+            value = getattr(value, '__func__', value)
+            code = getattr(value, '__code__', None)
+            if code is not None:
+                self.__sites[code] = name
+
+    def phase(self, name):
+        """
+        Say what the step is doing now. Calls, and time, are counted against
+        it until the next phase() or end_step().
+        """
+        now = time.perf_counter()
+        seconds = now - self.__phase_start
+        for table in (self.phase_seconds, self.__step_phase_seconds):
+            table[self.__phase] = table.get(self.__phase, 0.0) + seconds
+        (self.__phase, self.__phase_start) = (name, now)
+
+    def __site(self):
+        frame = sys._getframe(2)
+        while frame is not None:
+            site = self.__sites.get(frame.f_code)
+            if site is not None:
+                return site
+            frame = frame.f_back
+        return OTHER
+
+    def record(self, method, requests, sent, received, seconds):
+        """
+        Count one call: a single request, or a batch of them sent together.
+        received is None if we don't know how big the response was.
+        """
+        keys = (('method', method), ('site', self.__site()), ('phase', self.__phase))
+        with self.__lock:
+            for (kind, name) in keys:
+                stats = self.totals[kind].get(name)
+                if stats is None:
+                    stats = self.totals[kind][name] = CallStats()
+                stats.add(requests, sent, received, seconds)
+                stats = self.__step[kind].get(name)
+                if stats is None:
+                    stats = self.__step[kind][name] = CallStats(histogram=False)
+                stats.add(requests, sent, received, seconds)
+
+    def record_batch(self, requests, responses, sent, received, seconds):
+        """
+        Count a JSON-RPC batch, as a call to '<method> (batch)' for the
+        method of its first request. sent and received are its sizes in
+        bytes; received may be None if the provider didn't show us the raw
+        response.
+        """
+        if not requests:
+            return
+        self.record(requests[0]['method'] + ' (batch)', len(requests), sent, received, seconds)
+
+    def sent(self, data):
+        """
+        Note the encoded request a provider is about to send, and pass it on.
+        """
+        self.__wire.sent = len(data)
+        return data
+
+    def received(self, data):
+        """
+        Note the raw response a provider is about to decode, and pass it on.
+        """
+        self.__wire.received = len(data)
+        return data
+
+    def middleware(self, make_request, w3=None):
+        """
+        Make a web3 middleware that records every request passing through it.
+        Works in a Web3's middleware onion too, but install() puts it where
+        it also sees calls made on a provider directly.
+        """
+        wire = self.__wire
+
+        def middleware(method, params):
+            wire.sent = wire.received = None
+            start = time.perf_counter()
+            response = make_request(method, params)
+            seconds = time.perf_counter() - start
+            sent = wire.sent
+            if sent is None:
+                sent = len(json.dumps(params, default=str))
+            # None, and counted as unmeasured, if the provider decoded the
+            # response itself, as WebsocketProvider does
+            self.record(method, 1, sent, wire.received, seconds)
+            return response
+        return middleware
+
+    def end_step(self):
+        """
+        Finish counting a step. Returns its totals, by method, site and
+        phase, as a JSON-able dict, with 'phase_seconds' holding the wall
+        time of each phase and 'over_budget' mapping each budget it went
+        over to [calls, budget].
+        """
+        self.phase(OTHER)
+        with self.__lock:
+            (step, self.__step) = (self.__step, {'method': {}, 'site': {}, 'phase': {}})
+        (phase_seconds, self.__step_phase_seconds) = (self.__step_phase_seconds, {})
+        self.steps += 1
+        everything = CallStats(histogram=False)
+        for stats in step['method'].values():
+            everything.calls += stats.calls
+            everything.requests += stats.requests
+            everything.sent += stats.sent
+            everything.received += stats.received
+            everything.unmeasured += stats.unmeasured
+            everything.seconds += stats.seconds
+            everything.slowest = max(everything.slowest, stats.slowest)
+        over_budget = {}
+        for name, budget in self.budgets.items():
+            if name == '*':
+                calls = everything.calls
+            else:
+                calls = sum(step[kind][name].calls for kind in step if name in step[kind])
+            if calls > budget:
+                over_budget[name] = [calls, budget]
+        if over_budget:
+            self.steps_over_budget += 1
+        summary = everything.summary()
+        for kind in ('method', 'site', 'phase'):
+            summary[kind] = {name: stats.summary() for name, stats in sorted(step[kind].items())}
+        summary['phase_seconds'] = {name: round(seconds, 6) for name, seconds in sorted(phase_seconds.items())}
+        summary['over_budget'] = over_budget
+        return summary
+
+    def summary(self):
+        """
+        Get the totals over the whole run, by method, site and phase, as a
+        JSON-able dict.
+        """
+        with self.__lock:
+            summary = {
+                kind: {name: stats.summary() for name, stats in sorted(table.items())}
+                for kind, table in self.totals.items()
+            }
+        summary['phase_seconds'] = {name: round(seconds, 6) for name, seconds in sorted(self.phase_seconds.items())}
+        summary['steps'] = self.steps
+        summary['steps_over_budget'] = self.steps_over_budget
+        return summary
+
+def install(provider, tracer):
+    """
+    Trace every request made through a web3 provider, whether it comes from
+    a Web3 or from provider.make_request() directly, and every batch
+    rpc_batch.make_batch_request() sends over it. Byte counts are exact
+    where the provider encodes the message, or decodes the response, through
+    the hooks we wrap. Otherwise sent is guessed and received left unknown.
+    """
+    if getattr(provider, 'rpc_tracer', None) is not None:
+        return
+    provider.rpc_tracer = tracer
+    provider.make_request = tracer.middleware(provider.make_request)
+    if hasattr(provider, 'encode_rpc_request'):
+        encode = provider.encode_rpc_request
+        provider.encode_rpc_request = lambda method, params: tracer.sent(encode(method, params))
+    if hasattr(provider, 'decode_rpc_response'):
+        decode = provider.decode_rpc_response
+        provider.decode_rpc_response = lambda raw_response: decode(tracer.received(raw_response))
+    # A Web3 may have already built its request function around the old
+    # make_request
+    provider._request_func_cache = (None, None)
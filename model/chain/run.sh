@@ -31,6 +31,7 @@ function cleanup {
         time rsync -a --delete ./empty_db/ ./db/
         rm -Rf db coreth-keystore* plugin*
         rm *-approvals.json
+        rm -f checkpoint.json
     fi
 }
 
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+"""
+run_log.py: an append-only, typed, columnar log of a run.
+
+log.tsv costs a fresh read of the chain and a line of string formatting per
+step. A run log instead takes the numbers the step already has, as one row
+of fixed-type columns, buffers the rows in a numpy structured array, and
+writes them out a chunk at a time with each column's values stored
+together, so a reader can map the file and look at a column as an array
+without parsing anything.
+
+The file is an 8-byte magic number followed by records. Each record has a
+16-byte header (kind, body length, row count, CRC32 of the body) and a body
+padded to 8 bytes:
+
+    SCHM    the column names and dtypes, as JSON, for the rows that follow
+    ROWS    a chunk of rows: each column's values in turn, in schema order,
+            each padded to 8 bytes
+
+A record is only read once it is all there and its CRC matches, so a reader
+can follow a log while it is being written, and a crash mid-write loses at
+most the rows still buffered. Reopening a log for writing cuts off any torn
+record at the end, and writes a new schema if the columns have changed.
+
+    ./run_log.py log.bin                  # dump as TSV
+    ./run_log.py log.bin price supply     # just some columns
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b'XSDRLOG1'
+# kind, body length, rows, CRC32 of the body
+RECORD = struct.Struct('<4sIII')
+SCHEMA = b'SCHM'
+ROWS = b'ROWS'
+ALIGN = 8
+
+def _padding(length):
+    return (-length) % ALIGN
+
+class RunLogWriter:
+    """
+    Appends rows of fixed-type columns to a run log.
+    """
+
+    def __init__(self, path, columns, chunk_rows=256, flush_seconds=5.0, fsync=False):
+        """
+        Open the log at path for appending, making it if needed. columns is
+        a list of (name, numpy dtype string).
+
+        Rows are written a chunk at a time, when chunk_rows are buffered or
+        the oldest buffered row is flush_seconds old (checked on append()).
+        With fsync set, every chunk is synced to disk.
+        """
+        self.path = path
+        self.columns = [(name, np.dtype(dtype).str) for (name, dtype) in columns]
+        self.names = [name for (name, _) in self.columns]
+        self.chunk_rows = chunk_rows
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.__rows = np.zeros(chunk_rows, dtype=self.columns)
+        self.__count = 0
+        self.__oldest = None
+
+        # Counters
+        self.rows_written = 0
+        self.chunks_written = 0
+
+        self.__file = open(path, 'a+b')
+        self.__file.seek(0)
+        schema = None
+        if os.fstat(self.__file.fileno()).st_size == 0:
+            self.__file.write(MAGIC)
+        else:
+            (end, schema) = self.__recover()
+            self.__file.truncate(end)
+        self.__file.seek(0, os.SEEK_END)
+        if schema != self.columns:
+            self.__write_record(SCHEMA, 0, json.dumps({'columns': self.columns}).encode('utf-8'))
+
+    def __recover(self):
+        """
+        Find the end of the last whole record, and the schema in force there.
+        """
+        with mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                raise ValueError("{} is not a run log".format(self.path))
+            end = len(MAGIC)
+            schema = None
+            for (kind, rows, body, end) in iter_records(mm, end):
+                if kind == SCHEMA:
+                    schema = _schema(body)
+                del body
+            return end, schema
+
+    def __len__(self):
+        """
+        Get the number of rows buffered and not yet written.
+        """
+        return self.__count
+
+    def append(self, row):
+        """
+        Add a row, as a dict from column name to value (missing columns are
+        0), or as a tuple in column order.
+        """
+        if isinstance(row, dict):
+            row = tuple(row.get(name, 0) for name in self.names)
+        self.__rows[self.__count] = row
+        self.__count += 1
+        now = time.monotonic()
+        if self.__oldest is None:
+            self.__oldest = now
+        if self.__count == self.chunk_rows or now - self.__oldest >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """
+        Write out the buffered rows as one chunk.
+        """
+        if self.__count == 0:
+            return
+        parts = []
+        for name in self.names:
+            data = np.ascontiguousarray(self.__rows[name][:self.__count]).tobytes()
+            parts.append(data)
+            parts.append(b'\0' * _padding(len(data)))
+        self.__write_record(ROWS, self.__count, b''.join(parts))
+        self.rows_written += self.__count
+        self.chunks_written += 1
+        self.__count = 0
+        self.__oldest = None
+
+    def __write_record(self, kind, rows, body):
+        body += b'\0' * _padding(len(body))
+        # One write, so a reader never sees a header without its body for long
+        self.__file.write(RECORD.pack(kind, len(body), rows, zlib.crc32(body)) + body)
+        self.__file.flush()
+        if self.fsync:
+            os.fsync(self.__file.fileno())
+
+    def close(self):
+        self.flush()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _schema(body):
+    return [(name, dtype) for (name, dtype) in json.loads(bytes(body).rstrip(b'\0').decode('utf-8'))['columns']]
+
+def iter_records(buffer, offset):
+    """
+    Yield (kind, rows, body memoryview, end offset) for each whole record in
+    buffer from offset on, stopping at the first one that is cut short or
+    fails its CRC.
+    """
+    view = memoryview(buffer)
+    while offset + RECORD.size <= len(view):
+        (kind, length, rows, crc) = RECORD.unpack_from(view, offset)
+        start = offset + RECORD.size
+        if kind not in (SCHEMA, ROWS) or start + length > len(view):
+            break
+        body = view[start:start + length]
+        if zlib.crc32(body) != crc:
+            break
+        offset = start + length
+        yield (kind, rows, body, offset)
+
+def _columns(body, schema, rows, wanted):
+    """
+    Get the wanted columns of a ROWS record's body as arrays viewing it.
+    """
+    arrays = {}
+    offset = 0
+    for (name, dtype) in schema:
+        dtype = np.dtype(dtype)
+        if name in wanted:
+            arrays[name] = np.frombuffer(body, dtype=dtype, count=rows, offset=offset)
+        offset += rows * dtype.itemsize
+        offset += _padding(rows * dtype.itemsize)
+    return arrays
+
+class RunLogReader:
+    """
+    Reads a run log, all at once or as it grows.
+    """
+
+    def __init__(self, path, columns=None):
+        """
+        Read the given columns (all of them, if None) of the log at path.
+        """
+        self.path = path
+        self.wanted = None if columns is None else list(columns)
+        # Where the next unread record starts
+        self.offset = 0
+        # Columns and dtypes as of the last schema read
+        self.schema = None
+
+    def poll(self):
+        """
+        Read the whole records written since the last poll(). Returns a dict
+        from column name to array of the new rows (empty if none), copied
+        out of the file. A column the schema in force doesn't have comes
+        back as NaN, or 0 if it is an integer column elsewhere.
+
+        A schema record changes the columns from there on; the dict then
+        has every column seen by the end of the read.
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= max(self.offset, len(MAGIC)):
+            return {}
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if self.offset == 0:
+                if mm[:len(MAGIC)] != MAGIC:
+                    raise ValueError("{} is not a run log".format(self.path))
+                self.offset = len(MAGIC)
+            chunks = []
+            for (kind, rows, body, end) in iter_records(mm, self.offset):
+                if kind == SCHEMA:
+                    self.schema = _schema(body)
+                elif rows > 0 and self.schema is not None:
+                    names = [name for (name, _) in self.schema]
+                    wanted = set(names if self.wanted is None else self.wanted)
+                    chunks.append((rows, {
+                        name: array.copy() for (name, array) in _columns(body, self.schema, rows, wanted).items()
+                    }))
+                del body
+                self.offset = end
+        return _concatenate(chunks, self.wanted)
+
+    def read(self):
+        """
+        Read the whole log from the start.
+        """
+        self.offset = 0
+        self.schema = None
+        return self.poll()
+
+def _concatenate(chunks, wanted):
+    if not chunks:
+        return {}
+    dtypes = {}
+    for (_, arrays) in chunks:
+        for name, array in arrays.items():
+            dtypes.setdefault(name, array.dtype)
+    names = list(dtypes) if wanted is None else [name for name in wanted if name in dtypes]
+    result = {}
+    for name in names:
+        dtype = dtypes[name]
+        fill = 0 if dtype.kind in 'iub' else np.nan
+        result[name] = np.concatenate([
+            arrays[name] if name in arrays else np.full(rows, fill, dtype=dtype)
+            for (rows, arrays) in chunks
+        ])
+    return result
+
+def read_run_log(path, columns=None):
+    """
+    Read the given columns (all of them, if None) of the run log at path,
+    as a dict from column name to array.
+    """
+    return RunLogReader(path, columns).read()
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump a run log as TSV.")
+    parser.add_argument('path')
+    parser.add_argument('columns', nargs='*', help="columns to dump (default all)")
+    args = parser.parse_args()
+
+    data = read_run_log(args.path, args.columns or None)
+    names = list(data)
+    sys.stdout.write('#' + '\t'.join(names) + '\n')
+    if names:
+        np.savetxt(sys.stdout, np.column_stack([data[name].astype(float) for name in names]), fmt='%.10g', delimiter='\t')
+
+if __name__ == "__main__":
+    main()
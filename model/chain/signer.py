@@ -0,0 +1,119 @@
+"""
+signer.py: sign agent transactions locally, across a pool of processes.
+
+Normally every transaction goes out with eth_sendTransaction and the node
+signs it with its unlocked account. With the agent keys loaded here, we sign
+transactions ourselves and send them with eth_sendRawTransaction, so the node
+only has to check signatures. When a step's transactions are queued up
+together (async_submit.py), they're signed on all our cores at once.
+
+Keys can come from a JSON file mapping addresses to hex private keys, or from
+a directory of keystore files (like the ones personal_newAccount writes).
+"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from eth_account import Account
+from web3 import Web3
+
+# Keys the signing workers use, set by _init_worker()
+_worker_keys = None
+
+def _init_worker(keys):
+    global _worker_keys
+    _worker_keys = keys
+
+def _ready():
+    pass
+
+def _sign(transaction):
+    """
+    Sign one transaction dict with the key for its 'from' address, in a worker.
+    """
+    return bytes(Account.sign_transaction(transaction, _worker_keys[transaction['from']]).rawTransaction)
+
+def _decrypt(args):
+    (keyfile_json, password) = args
+    return Account.decrypt(keyfile_json, password).hex()
+
+def _pool_context():
+    # Fork, so workers don't re-run the model script (which connects to the
+    # chain at import) the way spawned workers would. model.py makes its pool
+    # before it starts any threads, so nothing holds a lock when it forks.
+    return multiprocessing.get_context('fork')
+
+def load_keys(path, password='', processes=None):
+    """
+    Load agent private keys. Returns a dict from checksummed address to hex
+    private key.
+
+    path may be a JSON file of {address: private key}, or a directory of
+    keystore files encrypted with the given password. Keystores are
+    decrypted in parallel, since each one is a deliberately slow scrypt.
+    """
+    if not os.path.isdir(path):
+        with open(path, 'r') as f:
+            return {Web3.toChecksumAddress(address): key for address, key in json.load(f).items()}
+
+    keyfiles = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'r') as f:
+            keyfiles.append(json.load(f))
+    with ProcessPoolExecutor(max_workers=processes, mp_context=_pool_context()) as pool:
+        keys = list(pool.map(_decrypt, [(keyfile, password) for keyfile in keyfiles]))
+    return {Account.from_key(key).address: key for key in keys}
+
+class SignerPool:
+    """
+    Signs transaction dicts with locally held keys.
+
+    Only sign_all(), which AsyncSubmitter.flush() uses, signs across the
+    pool. transaction_helper()'s synchronous path signs one transaction at a
+    time with sign(), in this process.
+    """
+
+    def __init__(self, keys, processes=None):
+        """
+        keys maps checksummed addresses to hex private keys. processes
+        defaults to the number of cores.
+
+        The workers are forked here and now, not on first use, so make the
+        pool before starting threads that might hold locks when it forks.
+        """
+        self.keys = dict(keys)
+        self.__pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=_pool_context(),
+            initializer=_init_worker,
+            initargs=(self.keys,)
+        )
+        # The executor only forks a worker when a job finds none idle, so
+        # hand every worker a job at once
+        wait([self.__pool.submit(_ready) for _ in range(self.__pool._max_workers)])
+
+    def __contains__(self, address):
+        return getattr(address, 'address', address) in self.keys
+
+    def sign(self, transaction):
+        """
+        Sign one transaction right here. A trip through the pool would cost
+        more than the signature.
+        """
+        return bytes(Account.sign_transaction(transaction, self.keys[transaction['from']]).rawTransaction)
+
+    def sign_all(self, transactions):
+        """
+        Sign a list of transactions across the pool. Returns raw signed
+        transactions in the same order.
+        """
+        transactions = list(transactions)
+        if len(transactions) < 2:
+            return [self.sign(transaction) for transaction in transactions]
+        chunksize = max(1, len(transactions) // (4 * (self.__pool._max_workers or 1)))
+        return list(self.__pool.map(_sign, transactions, chunksize=chunksize))
+
+    def close(self):
+        self.__pool.shutdown()
@@ -0,0 +1,1834 @@
+#!/usr/bin/env python3
+
+"""
+sim.py: agent-based model of xSD system behavior, in memory
+
+Reimplements the contracts the agents touch, in the same integer math as the
+Solidity: the xSD and USDT tokens, the Pangolin pair and router, the oracle,
+and the DAO's epoch advance, coupon auction, supply growth and redemption.
+A transaction that reverts raises SimRevert inside, and everything it changed
+is rolled back, as on chain.
+
+SimToken, SimPangolinPool and SimDAO answer the same calls as TokenProxy,
+PangolinPool and DAO in model.py, and SimModel steps the same agents over
+them, through the same Economy code (economy.py) as Model, so a long run
+takes minutes instead of days. sim_diff.py replays a
+SimModel run against a chain and reports where the two disagree.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+
+import amm
+from balance import Balance, reg_int
+from coupon_ledger import CouponLedger
+from economy import Economy
+from params import model_params
+from pending_ledger import PendingLedger
+from population import Population
+from redeem_planner import RedemptionStats
+from strategy import Strategy
+
+logger = logging.getLogger(__name__)
+
+UINT256 = 2**256
+UINT256_MAX = UINT256 - 1
+UINT112_MAX = 2**112 - 1
+UINT32 = 2**32
+Q112 = 2**112
+
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+
+# Decimal.D256 fixed point
+BASE = 10**18
+ONE = BASE
+
+# From Constants.sol
+EPOCH_START = 1619900000
+EPOCH_DEFAULT_PERIOD = 7200
+EPOCH_PERIOD_LOOKBACK = 24
+ADVANCE_INCENTIVE = 150 * 10**18
+ORACLE_RESERVE_MINIMUM = 10 * 10**6
+MAX_COUPON_YIELD_MULT = 10
+MAX_COUPON_EXPIRATION_TIME = 946080000
+MAX_COUPON_AUCTION_EPOCHS_BEST_BIDDER_SELECTION = 200
+# Decimal.ratio(100 - REJECT_COUPON_BID_PERCENTILE, 100)
+COUPON_REJECT_BID_PTILE = 10 * BASE // 100
+
+# From PangolinPair.sol
+MINIMUM_LIQUIDITY = 10**3
+
+# Same as model.py
+DEADLINE_FROM_NOW = 60 * 60 * 24 * 7 * 52
+USDT_DECIMALS = 6
+XSD_DECIMALS = 18
+PGL_DECIMALS = 18
+
+class SimRevert(Exception):
+    """
+    A simulated transaction reverted. The message is the revert reason.
+    """
+
+def _mul(a, b):
+    c = a * b
+    if c > UINT256_MAX:
+        raise SimRevert("SafeMath: multiplication overflow")
+    return c
+
+def _sub(a, b, reason="SafeMath: subtraction overflow"):
+    if b > a:
+        raise SimRevert(reason)
+    return a - b
+
+def _div(a, b):
+    if b == 0:
+        raise SimRevert("SafeMath: division by zero")
+    return a // b
+
+def d_ratio(a, b):
+    """
+    Decimal.ratio(a, b), as the raw D256 value.
+    """
+    return _div(_mul(a, BASE), b)
+
+def d_sqrt(x):
+    """
+    Market.sqrt() on a raw D256 value. This is not quite Newton's method, but
+    it is what the contract does, so it is what we do.
+    """
+    z = (x + BASE) // 2
+    y = x
+    while z < y:
+        y = z
+        z = _div(_mul(x, BASE), z + z) // 2
+    return y
+
+def sim_address(label):
+    """
+    Make up a stable address for a simulated account or contract.
+    """
+    return '0x' + hashlib.sha256(label.encode('utf-8')).hexdigest()[:40]
+
+class Journal:
+    """
+    Undo log for simulated state, so a reverted transaction leaves no trace.
+    Every change to contract state goes through set() or set_item().
+    """
+
+    __MISSING = object()
+
+    def __init__(self):
+        self.__entries = []
+
+    def set(self, target, name, value):
+        self.__entries.append((target, name, getattr(target, name), False))
+        setattr(target, name, value)
+
+    def set_item(self, mapping, key, value):
+        self.__entries.append((mapping, key, mapping.get(key, self.__MISSING), True))
+        mapping[key] = value
+
+    def commit(self):
+        self.__entries.clear()
+
+    def rollback(self):
+        while len(self.__entries) > 0:
+            (target, key, old, is_item) = self.__entries.pop()
+            if not is_item:
+                setattr(target, key, old)
+            elif old is self.__MISSING:
+                del target[key]
+            else:
+                target[key] = old
+
+class SimChain:
+    """
+    The block clock and transaction boundary the simulated contracts share.
+    """
+
+    def __init__(self, timestamp, block_interval=2):
+        """
+        Start at the given block timestamp. Each mined block moves the clock
+        on by block_interval seconds.
+        """
+        self.timestamp = timestamp
+        self.block_number = 0
+        self.block_interval = block_interval
+        self.journal = Journal()
+        # Expected effects of transactions the token ledgers haven't seen
+        self.pending = PendingLedger()
+        # Events emitted by committed transactions. This maps from log index
+        # to (contract address, event name, args), so a revert can take its
+        # events back out.
+        self.logs = {}
+
+        # Counters
+        self.tx_count = 0
+        self.revert_count = 0
+
+    def mine(self):
+        """
+        Close the current block, like issue_block().
+        """
+        self.block_number += 1
+        self.timestamp += self.block_interval
+
+    def sleep(self, seconds):
+        """
+        Move the clock forward, like debug_increaseTime.
+        """
+        self.timestamp += seconds
+
+    def emit(self, address, name, args):
+        """
+        Log an event from the contract at address, in the current transaction.
+        """
+        self.journal.set_item(self.logs, len(self.logs), (address, name, args))
+
+    def logs_since(self, cursor, address):
+        """
+        Get the (name, args) events address emitted from log index cursor on,
+        and the cursor to pass next time.
+        """
+        end = len(self.logs)
+        return [
+            (name, args) for (emitter, name, args) in (self.logs[i] for i in range(cursor, end))
+            if emitter == address
+        ], end
+
+    def transact(self, sender, to, fn_name, args, fn):
+        """
+        Run fn(sender, *args) as one transaction from sender to the contract
+        at address to, calling fn_name. Returns a receipt-like dict, with
+        status 0 and the revert reason if it reverted.
+        """
+        self.tx_count += 1
+        sender = getattr(sender, 'address', sender)
+        receipt = {
+            'status': 1,
+            # Unique per transaction, standing in for its hash
+            'id': self.tx_count,
+            'from': sender,
+            'to': to,
+            'function': fn_name,
+            'blockNumber': self.block_number,
+        }
+        try:
+            fn(sender, *args)
+        except SimRevert as inst:
+            self.journal.rollback()
+            self.revert_count += 1
+            receipt['status'] = 0
+            receipt['error'] = str(inst)
+        else:
+            self.journal.commit()
+        return receipt
+
+class SimToken:
+    """
+    An ERC20 ledger, answering the same calls as TokenProxy.
+
+    Like TokenProxy, balances read through token[address] are as of the last
+    update(), so agents decide on what was mined before the step.
+    """
+
+    def __init__(self, chain, address, symbol, decimals, infinite_allowance=False,
+                 balance_error="ERC20: transfer amount exceeds balance",
+                 allowance_error="ERC20: transfer amount exceeds allowance",
+                 burn_error="ERC20: burn amount exceeds balance"):
+        """
+        infinite_allowance is True for tokens that never spend down a
+        uint256(-1) allowance (Dollar, the pair). The error strings are the
+        token's revert reasons.
+        """
+        self.chain = chain
+        self.__address = address
+        self.__symbol = symbol
+        self.__decimals = decimals
+        self.infinite_allowance = infinite_allowance
+        self.balance_error = balance_error
+        self.allowance_error = allowance_error
+        self.burn_error = burn_error
+
+        # This maps from address to wei balance
+        self.balances = {}
+        # This maps from (owner, spender) to wei allowance
+        self.allowances = {}
+        self.supply = 0
+
+        # Balances and supply as of the last update()
+        self.__seen = {}
+        self.__seen_supply = 0
+
+    # ERC20, in wei. These run inside a SimChain transaction.
+
+    def balance_of(self, address):
+        return self.balances.get(address, 0)
+
+    def allowance(self, owner, spender):
+        return self.allowances.get((owner, spender), 0)
+
+    def _mint(self, account, amount):
+        journal = self.chain.journal
+        journal.set_item(self.balances, account, self.balances.get(account, 0) + amount)
+        journal.set(self, 'supply', self.supply + amount)
+
+    def _burn(self, account, amount):
+        journal = self.chain.journal
+        journal.set_item(self.balances, account, _sub(self.balances.get(account, 0), amount, self.burn_error))
+        journal.set(self, 'supply', self.supply - amount)
+
+    def _transfer(self, sender, recipient, amount):
+        journal = self.chain.journal
+        journal.set_item(self.balances, sender, _sub(self.balances.get(sender, 0), amount, self.balance_error))
+        journal.set_item(self.balances, recipient, self.balances.get(recipient, 0) + amount)
+
+    def _transfer_from(self, spender, sender, recipient, amount):
+        allowance = self.allowance(sender, spender)
+        if not (self.infinite_allowance and allowance == UINT256_MAX):
+            self.chain.journal.set_item(self.allowances, (sender, spender), _sub(allowance, amount, self.allowance_error))
+        self._transfer(sender, recipient, amount)
+
+    def _approve(self, owner, spender, amount):
+        self.chain.journal.set_item(self.allowances, (owner, spender), amount)
+
+    # External functions, for SimChain.transact()
+
+    def _tx_approve(self, sender, spender, amount):
+        self._approve(sender, spender, amount)
+
+    def _tx_mint(self, sender, account, amount):
+        # Only the testnet USDT lets anyone mint
+        self._mint(account, amount)
+
+    # TokenProxy interface
+
+    @property
+    def decimals(self):
+        return self.__decimals
+
+    @property
+    def symbol(self):
+        return self.__symbol
+
+    @property
+    def totalSupply(self):
+        return Balance(self.__seen_supply, self.__decimals)
+
+    @property
+    def address(self):
+        return self.__address
+
+    @property
+    def contract(self):
+        return self
+
+    def update(self, is_init_agents=[]):
+        """
+        Catch up the balances agents see with everything transacted so far.
+        """
+        self.__seen = dict(self.balances)
+        self.__seen_supply = self.supply
+        self.chain.pending.reconcile(self)
+
+    def __getitem__(self, address):
+        address = getattr(address, 'address', address)
+        return Balance(self.__seen.get(address, 0) + self.chain.pending.change(self.__address, address), self.__decimals)
+
+    def is_approved(self, owner, spender):
+        owner = getattr(owner, 'address', owner)
+        spender = getattr(spender, 'address', spender)
+        return self.allowance(owner, spender) > 0
+
+    def approve(self, owner, spender, gas=500000):
+        """
+        Approve the spender for all the owner's tokens. Returns the receipt,
+        or None if the spender is already approved.
+        """
+        if self.is_approved(owner, spender):
+            return None
+        spender = getattr(spender, 'address', spender)
+        return self.chain.transact(owner, self.address, 'approve', (spender, UINT256_MAX), self._tx_approve)
+
+    def mark_approved(self, owner, spender, save=True):
+        # The allowance itself is the record
+        pass
+
+    def save_approvals(self):
+        pass
+
+    def ensure_approved(self, owner, spender):
+        self.approve(owner, spender)
+
+    def mint(self, account, amount):
+        """
+        Mint testnet tokens to an account. Returns the receipt.
+        """
+        account = getattr(account, 'address', account)
+        return self.chain.transact(account, self.address, 'mint', (account, amount), self._tx_mint)
+
+    def from_wei(self, wei):
+        return Balance(wei, self.__decimals)
+
+    def from_tokens(self, tokens):
+        return Balance.from_tokens(tokens, self.__decimals)
+
+class SimPair:
+    """
+    A Pangolin pair: reserves, price accumulators and LP token, following
+    PangolinPair.sol. Protocol fees are off, as in the test deployment.
+    """
+
+    def __init__(self, chain, address, token_a, token_b):
+        """
+        Pair two SimTokens. The LP token lives at the pair's address.
+        """
+        self.chain = chain
+        self.address = address
+        (self.token0, self.token1) = sorted([token_a, token_b], key=lambda t: int(t.address, 16))
+        self.lp = SimToken(
+            chain, address, 'PGL', PGL_DECIMALS,
+            infinite_allowance=True,
+            balance_error='ds-math-sub-underflow',
+            allowance_error='ds-math-sub-underflow',
+            burn_error='ds-math-sub-underflow'
+        )
+
+        self.reserve0 = 0
+        self.reserve1 = 0
+        self.block_timestamp_last = 0
+        self.price0_cumulative_last = 0
+        self.price1_cumulative_last = 0
+
+    def get_reserves(self):
+        return (self.reserve0, self.reserve1, self.block_timestamp_last)
+
+    def __update(self, balance0, balance1):
+        if balance0 > UINT112_MAX or balance1 > UINT112_MAX:
+            raise SimRevert('Pangolin: OVERFLOW')
+        journal = self.chain.journal
+        block_timestamp = self.chain.timestamp % UINT32
+        time_elapsed = (block_timestamp - self.block_timestamp_last) % UINT32
+        if time_elapsed > 0 and self.reserve0 != 0 and self.reserve1 != 0:
+            # Overflow is desired
+            journal.set(self, 'price0_cumulative_last',
+                (self.price0_cumulative_last + (self.reserve1 * Q112 // self.reserve0) * time_elapsed) % UINT256)
+            journal.set(self, 'price1_cumulative_last',
+                (self.price1_cumulative_last + (self.reserve0 * Q112 // self.reserve1) * time_elapsed) % UINT256)
+        journal.set(self, 'reserve0', balance0)
+        journal.set(self, 'reserve1', balance1)
+        journal.set(self, 'block_timestamp_last', block_timestamp)
+
+    def current_cumulative_prices(self):
+        """
+        PangolinOracleLibrary.currentCumulativePrices(): the accumulators as
+        they would be if the pair were updated right now.
+        """
+        block_timestamp = self.chain.timestamp % UINT32
+        price0_cumulative = self.price0_cumulative_last
+        price1_cumulative = self.price1_cumulative_last
+        if self.block_timestamp_last != block_timestamp:
+            if self.reserve0 == 0 or self.reserve1 == 0:
+                raise SimRevert('FixedPoint: DIV_BY_ZERO')
+            time_elapsed = (block_timestamp - self.block_timestamp_last) % UINT32
+            price0_cumulative = (price0_cumulative + (self.reserve1 * Q112 // self.reserve0) * time_elapsed) % UINT256
+            price1_cumulative = (price1_cumulative + (self.reserve0 * Q112 // self.reserve1) * time_elapsed) % UINT256
+        return (price0_cumulative, price1_cumulative, block_timestamp)
+
+    def mint(self, to):
+        balance0 = self.token0.balance_of(self.address)
+        balance1 = self.token1.balance_of(self.address)
+        amount0 = _sub(balance0, self.reserve0, 'ds-math-sub-underflow')
+        amount1 = _sub(balance1, self.reserve1, 'ds-math-sub-underflow')
+
+        total_supply = self.lp.supply
+        if total_supply == 0:
+            liquidity = _sub(math.isqrt(_mul(amount0, amount1)), MINIMUM_LIQUIDITY, 'ds-math-sub-underflow')
+            # Permanently lock the first MINIMUM_LIQUIDITY tokens
+            self.lp._mint(ZERO_ADDRESS, MINIMUM_LIQUIDITY)
+        else:
+            liquidity = min(_mul(amount0, total_supply) // self.reserve0, _mul(amount1, total_supply) // self.reserve1)
+        if liquidity <= 0:
+            raise SimRevert('Pangolin: INSUFFICIENT_LIQUIDITY_MINTED')
+        self.lp._mint(to, liquidity)
+        self.__update(balance0, balance1)
+        return liquidity
+
+    def burn(self, to):
+        balance0 = self.token0.balance_of(self.address)
+        balance1 = self.token1.balance_of(self.address)
+        liquidity = self.lp.balance_of(self.address)
+
+        total_supply = self.lp.supply
+        amount0 = _mul(liquidity, balance0) // total_supply
+        amount1 = _mul(liquidity, balance1) // total_supply
+        if amount0 <= 0 or amount1 <= 0:
+            raise SimRevert('Pangolin: INSUFFICIENT_LIQUIDITY_BURNED')
+        self.lp._burn(self.address, liquidity)
+        self.__safe_transfer(self.token0, to, amount0)
+        self.__safe_transfer(self.token1, to, amount1)
+        self.__update(self.token0.balance_of(self.address), self.token1.balance_of(self.address))
+        return (amount0, amount1)
+
+    def swap(self, amount0_out, amount1_out, to):
+        if amount0_out <= 0 and amount1_out <= 0:
+            raise SimRevert('Pangolin: INSUFFICIENT_OUTPUT_AMOUNT')
+        if amount0_out >= self.reserve0 or amount1_out >= self.reserve1:
+            raise SimRevert('Pangolin: INSUFFICIENT_LIQUIDITY')
+        if to == self.token0.address or to == self.token1.address:
+            raise SimRevert('Pangolin: INVALID_TO')
+        if amount0_out > 0:
+            self.__safe_transfer(self.token0, to, amount0_out)
+        if amount1_out > 0:
+            self.__safe_transfer(self.token1, to, amount1_out)
+        balance0 = self.token0.balance_of(self.address)
+        balance1 = self.token1.balance_of(self.address)
+
+        amount0_in = balance0 - (self.reserve0 - amount0_out) if balance0 > self.reserve0 - amount0_out else 0
+        amount1_in = balance1 - (self.reserve1 - amount1_out) if balance1 > self.reserve1 - amount1_out else 0
+        if amount0_in <= 0 and amount1_in <= 0:
+            raise SimRevert('Pangolin: INSUFFICIENT_INPUT_AMOUNT')
+        balance0_adjusted = _sub(_mul(balance0, 1000), _mul(amount0_in, 3), 'ds-math-sub-underflow')
+        balance1_adjusted = _sub(_mul(balance1, 1000), _mul(amount1_in, 3), 'ds-math-sub-underflow')
+        if _mul(balance0_adjusted, balance1_adjusted) < _mul(_mul(self.reserve0, self.reserve1), 1000**2):
+            raise SimRevert('Pangolin: K')
+        self.__update(balance0, balance1)
+
+    def __safe_transfer(self, token, to, amount):
+        try:
+            token._transfer(self.address, to, amount)
+        except SimRevert:
+            raise SimRevert('Pangolin: TRANSFER_FAILED')
+
+class SimOracle:
+    """
+    The DAO's oracle (MockOracle over Oracle.sol): a TWAP of the pair's xSD
+    price between captures.
+    """
+
+    def __init__(self, chain, pair, dollar_address, dao_address):
+        self.chain = chain
+        self.pair = pair
+        self.dao = dao_address
+        # Which side of the pair the dollar is
+        self.index = 0 if pair.token0.address == dollar_address else 1
+
+        self.initialized = False
+        self.cumulative = 0
+        self.timestamp = 0
+        self.reserve = 0
+        self.latest_price = 0
+        self.latest_valid = False
+
+    def capture(self):
+        """
+        Oracle.capture(). Returns (price as a D256 value, valid).
+        """
+        journal = self.chain.journal
+        if self.initialized:
+            (price, valid) = self.__update_oracle()
+        else:
+            self.__initialize_oracle()
+            (price, valid) = (ONE, False)
+        # MockOracle keeps its own copy
+        journal.set(self, 'latest_price', price)
+        journal.set(self, 'latest_valid', valid)
+        return (price, valid)
+
+    def live_reserve(self):
+        """
+        The pair's USDT reserve right now.
+        """
+        return self.pair.reserve1 if self.index == 0 else self.pair.reserve0
+
+    def __initialize_oracle(self):
+        journal = self.chain.journal
+        pair = self.pair
+        price_cumulative = pair.price0_cumulative_last if self.index == 0 else pair.price1_cumulative_last
+        (reserve0, reserve1, block_timestamp_last) = pair.get_reserves()
+        if reserve0 != 0 and reserve1 != 0 and block_timestamp_last != 0:
+            journal.set(self, 'cumulative', price_cumulative)
+            journal.set(self, 'timestamp', block_timestamp_last)
+            journal.set(self, 'initialized', True)
+            journal.set(self, 'reserve', reserve1 if self.index == 0 else reserve0)
+
+    def __update_oracle(self):
+        price = self.__update_price()
+        last_reserve = self.__update_reserve()
+        valid = last_reserve >= ORACLE_RESERVE_MINIMUM and self.reserve >= ORACLE_RESERVE_MINIMUM
+        # The testnet USDT never blacklists the pair
+        return (price, valid)
+
+    def __update_price(self):
+        journal = self.chain.journal
+        (price0_cumulative, price1_cumulative, block_timestamp) = self.pair.current_cumulative_prices()
+        time_elapsed = (block_timestamp - self.timestamp) % UINT32
+        if time_elapsed == 0:
+            raise SimRevert('division by zero')
+        price_cumulative = price0_cumulative if self.index == 0 else price1_cumulative
+        price = d_ratio(((price_cumulative - self.cumulative) % UINT256) // time_elapsed, Q112)
+        journal.set(self, 'timestamp', block_timestamp)
+        journal.set(self, 'cumulative', price_cumulative)
+        return _mul(price, 10**12)
+
+    def __update_reserve(self):
+        last_reserve = self.reserve
+        self.chain.journal.set(self, 'reserve', self.live_reserve())
+        return last_reserve
+
+class SimPangolinPool:
+    """
+    The Pangolin pair and router, answering the same calls as PangolinPool.
+    Router functions follow PangolinRouter.sol.
+    """
+
+    def __init__(self, chain, pair, router_address, usdt_token, xsd_token):
+        self.chain = chain
+        self.pair = pair
+        self.router_address = router_address
+        self.pangolin_pair_token = pair.lp
+        self.usdt_token = usdt_token
+        self.xsd_token = xsd_token
+        # This maps from token address to SimToken, for router paths
+        self.__tokens = {pair.token0.address: pair.token0, pair.token1.address: pair.token1}
+
+        # Reserves as of the last update()
+        self.__reserves = list(pair.get_reserves())
+
+    # Router functions, in wei. These run inside a SimChain transaction.
+
+    def __ensure(self, deadline):
+        if deadline < self.chain.timestamp:
+            raise SimRevert('PangolinRouter: EXPIRED')
+
+    def __token(self, address):
+        if address not in self.__tokens:
+            # No pair for these tokens, so the router's call goes nowhere
+            raise SimRevert('PangolinRouter: NO_PAIR')
+        return self.__tokens[address]
+
+    def __safe_transfer_from(self, token, sender, amount):
+        try:
+            token._transfer_from(self.router_address, sender, self.pair.address, amount)
+        except SimRevert:
+            raise SimRevert('TransferHelper: TRANSFER_FROM_FAILED')
+
+    def __library(self, fn, *args):
+        # amm raises the library's reasons as ValueError
+        try:
+            return fn(*args)
+        except ValueError as inst:
+            raise SimRevert(str(inst))
+
+    def _tx_add_liquidity(self, sender, token_a, token_b, amount_a_desired, amount_b_desired, amount_a_min, amount_b_min, to, deadline):
+        self.__ensure(deadline)
+        (reserve_a, reserve_b) = self.__reserves_for(token_a, token_b)
+        if reserve_a == 0 and reserve_b == 0:
+            (amount_a, amount_b) = (amount_a_desired, amount_b_desired)
+        else:
+            amount_b_optimal = self.__library(amm.quote, amount_a_desired, reserve_a, reserve_b)
+            if amount_b_optimal <= amount_b_desired:
+                if amount_b_optimal < amount_b_min:
+                    raise SimRevert('PangolinRouter: INSUFFICIENT_B_AMOUNT')
+                (amount_a, amount_b) = (amount_a_desired, amount_b_optimal)
+            else:
+                amount_a_optimal = self.__library(amm.quote, amount_b_desired, reserve_b, reserve_a)
+                if amount_a_optimal > amount_a_desired:
+                    # An assert() in the router
+                    raise SimRevert('invalid opcode')
+                if amount_a_optimal < amount_a_min:
+                    raise SimRevert('PangolinRouter: INSUFFICIENT_A_AMOUNT')
+                (amount_a, amount_b) = (amount_a_optimal, amount_b_desired)
+        self.__safe_transfer_from(self.__token(token_a), sender, amount_a)
+        self.__safe_transfer_from(self.__token(token_b), sender, amount_b)
+        self.pair.mint(to)
+
+    def _tx_remove_liquidity(self, sender, token_a, token_b, liquidity, amount_a_min, amount_b_min, to, deadline):
+        self.__ensure(deadline)
+        self.__token(token_a)
+        self.__token(token_b)
+        self.pair.lp._transfer_from(self.router_address, sender, self.pair.address, liquidity)
+        (amount0, amount1) = self.pair.burn(to)
+        (amount_a, amount_b) = (amount0, amount1) if token_a == self.pair.token0.address else (amount1, amount0)
+        if amount_a < amount_a_min:
+            raise SimRevert('PangolinRouter: INSUFFICIENT_A_AMOUNT')
+        if amount_b < amount_b_min:
+            raise SimRevert('PangolinRouter: INSUFFICIENT_B_AMOUNT')
+
+    def _tx_swap_exact_tokens_for_tokens(self, sender, amount_in, amount_out_min, path, to, deadline):
+        self.__ensure(deadline)
+        for address in path:
+            self.__token(address)
+        amounts = self.__library(amm.get_amounts_out, amount_in, path, self.__live_reserves_for)
+        if amounts[-1] < amount_out_min:
+            raise SimRevert('PangolinRouter: INSUFFICIENT_OUTPUT_AMOUNT')
+        self.__safe_transfer_from(self.__token(path[0]), sender, amounts[0])
+        # There is only the one pair, so the path is one hop
+        amount_out = amounts[1]
+        if path[0] == self.pair.token0.address:
+            self.pair.swap(0, amount_out, to)
+        else:
+            self.pair.swap(amount_out, 0, to)
+
+    def __live_reserves_for(self, token_a, token_b):
+        if token_a == self.pair.token0.address:
+            return self.pair.reserve0, self.pair.reserve1
+        return self.pair.reserve1, self.pair.reserve0
+
+    def __reserves_for(self, token_a, token_b):
+        if {token_a, token_b} != set(self.__tokens):
+            raise SimRevert('PangolinRouter: NO_PAIR')
+        return self.__live_reserves_for(token_a, token_b)
+
+    # PangolinPool interface
+
+    def update(self, is_init_agents=[]):
+        """
+        Catch up the reserves and LP balances agents see.
+        """
+        self.pangolin_pair_token.update(is_init_agents=is_init_agents)
+        self.__reserves = list(self.pair.get_reserves())
+
+    def operational(self, reserve=None):
+        if reserve is None:
+            reserve = self.getReserves()
+        return reserve[0] > 0 and reserve[1] > 0
+
+    def getToken0(self):
+        return self.pair.token0.address
+
+    def getReserves(self):
+        return list(self.__reserves)
+
+    def reservesFor(self, token_a, token_b):
+        if {token_a.lower(), token_b.lower()} != {self.xsd_token.address.lower(), self.usdt_token.address.lower()}:
+            raise KeyError("No simulated pair for {} and {}".format(token_a, token_b))
+        reserve = self.getReserves()
+        if token_a.lower() == self.getToken0().lower():
+            return reserve[0], reserve[1]
+        return reserve[1], reserve[0]
+
+    def getAmountsIn(self, agent, amount_out, path):
+        return amm.get_amounts_in(amount_out, path, self.reservesFor)
+
+    def getAmountsOut(self, agent, amount_in, path):
+        return amm.get_amounts_out(amount_in, path, self.reservesFor)
+
+    def getTokenBalance(self, reserve=None, token0=None):
+        if reserve is None:
+            reserve = self.getReserves()
+        if token0 is None:
+            token0 = self.getToken0()
+        if token0.lower() == self.usdt_token.address.lower():
+            return reg_int(reserve[0], self.usdt_token.decimals), reg_int(reserve[1], self.xsd_token.decimals)
+        return reg_int(reserve[1], self.usdt_token.decimals), reg_int(reserve[0], self.xsd_token.decimals)
+
+    def getInstantaneousPrice(self, reserve=None, token0=None):
+        if reserve is None:
+            reserve = self.getReserves()
+        if token0 is None:
+            token0 = self.getToken0()
+        scale = 10**(self.xsd_token.decimals - self.usdt_token.decimals)
+        if token0.lower() == self.usdt_token.address.lower():
+            return reserve[0] * scale / float(reserve[1]) if reserve[1] != 0 else 0
+        return reserve[1] * scale / float(reserve[0]) if reserve[0] != 0 else 0
+
+    def xsd_price(self, reserve=None, token0=None):
+        if self.operational(reserve):
+            return self.getInstantaneousPrice(reserve, token0)
+        return 1.0
+
+    def total_lp(self, agent):
+        return reg_int(self.pangolin_pair_token.totalSupply.to_wei(), PGL_DECIMALS)
+
+    def provide_liquidity(self, agent, xsd, usdt, current_timestamp):
+        self.usdt_token.ensure_approved(agent, self.router_address)
+        self.xsd_token.ensure_approved(agent, self.router_address)
+
+        slippage = 0.01
+        min_xsd_amount = (xsd * (1 - slippage))
+        min_usdt_amount = (usdt * (1 - slippage))
+
+        receipt = self.chain.transact(agent, self.router_address, 'addLiquidity', (
+            self.xsd_token.address,
+            self.usdt_token.address,
+            xsd.to_wei(),
+            usdt.to_wei(),
+            min_xsd_amount.to_wei(),
+            min_usdt_amount.to_wei(),
+            agent.address,
+            int(current_timestamp) + DEADLINE_FROM_NOW
+        ), self._tx_add_liquidity)
+        self.chain.pending.expect(receipt['id'], [(self.xsd_token, agent, 0 - xsd), (self.usdt_token, agent, 0 - usdt)])
+        return receipt
+
+    def remove_liquidity(self, agent, shares, min_xsd_amount, min_usdt_amount, current_timestamp):
+        self.pangolin_pair_token.ensure_approved(agent, self.router_address)
+
+        slippage = 0.01
+        min_xsd_amount = (min_xsd_amount * (1 - slippage))
+        min_usdt_amount = (min_usdt_amount * (1 - slippage))
+
+        receipt = self.chain.transact(agent, self.router_address, 'removeLiquidity', (
+            self.xsd_token.address,
+            self.usdt_token.address,
+            shares.to_wei(),
+            min_xsd_amount.to_wei(),
+            min_usdt_amount.to_wei(),
+            agent.address,
+            int(current_timestamp + DEADLINE_FROM_NOW)
+        ), self._tx_remove_liquidity)
+        self.chain.pending.expect(receipt['id'], [
+            (self.pangolin_pair_token, agent, 0 - shares),
+            (self.xsd_token, agent, min_xsd_amount),
+            (self.usdt_token, agent, min_usdt_amount),
+        ])
+        return receipt
+
+    def buy(self, agent, usdt, max_usdt_amount, current_timestamp):
+        self.usdt_token.ensure_approved(agent, self.router_address)
+        self.xsd_token.ensure_approved(agent, self.router_address)
+
+        slippage = 0.01
+        max_usdt_amount = (max_usdt_amount * (1 + slippage))
+
+        receipt = self.chain.transact(agent, self.router_address, 'swapExactTokensForTokens', (
+            usdt.to_wei(),
+            max_usdt_amount.to_wei(),
+            [self.usdt_token.address, self.xsd_token.address],
+            agent.address,
+            int(current_timestamp + DEADLINE_FROM_NOW)
+        ), self._tx_swap_exact_tokens_for_tokens)
+        self.chain.pending.expect(receipt['id'], [(self.usdt_token, agent, 0 - usdt), (self.xsd_token, agent, max_usdt_amount)])
+        return receipt
+
+    def sell(self, agent, xsd, min_usdt_amount, advancer, pangolin_usdt_supply, current_timestamp):
+        self.usdt_token.ensure_approved(agent, self.router_address)
+        self.xsd_token.ensure_approved(agent, self.router_address)
+
+        slippage = 0.99 if (advancer.address == agent.address) or ((agent.redeem_count > 0) and agent.xsd > pangolin_usdt_supply) else 0.01
+        min_usdt_amount = (min_usdt_amount * (1 - slippage))
+
+        receipt = self.chain.transact(agent, self.router_address, 'swapExactTokensForTokens', (
+            xsd.to_wei(),
+            min_usdt_amount.to_wei(),
+            [self.xsd_token.address, self.usdt_token.address],
+            agent.address,
+            int(current_timestamp + DEADLINE_FROM_NOW)
+        ), self._tx_swap_exact_tokens_for_tokens)
+        self.chain.pending.expect(receipt['id'], [(self.xsd_token, agent, 0 - xsd), (self.usdt_token, agent, min_usdt_amount)])
+        return receipt
+
+class SimEpoch:
+    """
+    Epoch.State and its Epoch.AuctionState, from State.sol.
+    """
+
+    __slots__ = (
+        'start', 'period', 'bonded', 'action_count', 'outstanding',
+        'is_init', 'finished', 'min_yield', 'max_yield', 'min_expiry', 'max_expiry',
+        'min_dollar_amount', 'max_dollar_amount', 'init_bidder', 'total_bids', 'init_price',
+        'total_filled', 'total_burned', 'total_auctioned', 'min_expiry_filled', 'max_expiry_filled',
+        'avg_expiry_filled', 'min_yield_filled', 'max_yield_filled', 'avg_yield_filled', 'bid_to_cover',
+        'latest_redeemed_selected_bidder_index',
+        # This maps from bid index to bidder address
+        'bidder_at',
+        # This maps from selected bid index to bidder address
+        'selected_at',
+        # This maps from bidder address to SimBid
+        'bids',
+    )
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+        self.is_init = False
+        self.finished = False
+        self.init_bidder = ZERO_ADDRESS
+        self.bidder_at = {}
+        self.selected_at = {}
+        self.bids = {}
+
+class SimBid:
+    """
+    Epoch.CouponBidderState, from State.sol.
+    """
+
+    __slots__ = ('selected', 'redeemed', 'bidder', 'left', 'right', 'dollar_amount', 'coupon_amount', 'expiry', 'distance')
+
+    def __init__(self):
+        self.selected = False
+        self.redeemed = False
+        self.bidder = ZERO_ADDRESS
+        self.left = ZERO_ADDRESS
+        self.right = ZERO_ADDRESS
+        self.dollar_amount = 0
+        self.coupon_amount = 0
+        self.expiry = 0
+        self.distance = 0
+
+# Storage never written to reads as zeroes
+_EMPTY_EPOCH = SimEpoch()
+_EMPTY_BID = SimBid()
+
+class SimDAO:
+    """
+    The xSD DAO (Implementation.sol and what it inherits), answering the same
+    calls as DAO.
+    """
+
+    def __init__(self, chain, address, dollar, oracle, epoch_period=None, advance_incentive=ADVANCE_INCENTIVE):
+        """
+        Run the DAO at address over a dollar SimToken and a SimOracle,
+        paying advance_incentive xSD (in wei) to whoever advances the epoch.
+
+        If epoch_period is given, every epoch lasts that many seconds.
+        Otherwise the period adapts to activity as in Getters.epochPeriod(),
+        which as deployed reverts for epochs 1 through 24, when its look back
+        runs off the front of the epoch list.
+        """
+        self.chain = chain
+        self.address = address
+        self.dollar = dollar
+        self.xsd_token = dollar
+        self.oracle = oracle
+        self.fixed_epoch_period = epoch_period
+        self.advance_incentive = advance_incentive
+
+        # Storage.Balance
+        self.balance_supply = 0
+        self.balance_bonded = 0
+        self.balance_staged = 0
+        self.balance_coupons = 0
+        self.balance_redeemable = 0
+
+        # Epoch.Global
+        self.current_epoch = 0
+        self.earliest_active_auction = 0
+
+        # Account.State balances: DAO shares. This maps from address to shares.
+        self.balances = {}
+
+        # This maps from epoch number to SimEpoch
+        self.epochs = {}
+        # Account.State, flattened. This maps from (address, epoch) to coupons.
+        self.coupons = {}
+        # This maps from (address, assigned index) to coupon expiry epoch
+        self.coupon_assigned_at = {}
+        # This maps from address to the next assigned index
+        self.coupon_assigned_index = {}
+        # This maps from address to coupons ever assigned and not redeemed
+        self.outstanding_coupons_for = {}
+        self.has_incentivized = {}
+
+        # Everyone's coupons as of the last update(), from our events, as
+        # DAO keeps them
+        self.coupon_ledger = CouponLedger()
+        self.__log_cursor = 0
+
+    # Storage access
+
+    def _epoch(self, epoch):
+        return self.epochs.get(epoch, _EMPTY_EPOCH)
+
+    def __epoch_for_write(self, epoch):
+        state = self.epochs.get(epoch)
+        if state is None:
+            state = SimEpoch()
+            self.chain.journal.set_item(self.epochs, epoch, state)
+        return state
+
+    def __bid_for_write(self, epoch, bidder):
+        auction = self.__epoch_for_write(epoch)
+        bid = auction.bids.get(bidder)
+        if bid is None:
+            bid = SimBid()
+            self.chain.journal.set_item(auction.bids, bidder, bid)
+        return bid
+
+    # Getters.sol
+
+    def balance_of(self, account):
+        return self.balances.get(account, 0)
+
+    def total_supply(self):
+        return self.balance_supply
+
+    def total_bonded(self):
+        return self.balance_bonded
+
+    def balance_of_bonded(self, account):
+        total_supply = self.total_supply()
+        if total_supply == 0:
+            return 0
+        return _div(_mul(self.total_bonded(), self.balance_of(account)), total_supply)
+
+    def balance_of_coupons(self, account, epoch):
+        if self._epoch(epoch).outstanding == 0:
+            return 0
+        return self.coupons.get((account, epoch), 0)
+
+    def outstanding_coupons(self, epoch):
+        return self._epoch(epoch).outstanding
+
+    def epoch_period(self):
+        if self.fixed_epoch_period is not None:
+            return self.fixed_epoch_period
+        current = self.current_epoch
+        if current == 0:
+            return EPOCH_DEFAULT_PERIOD
+        max_look_back = min(current, EPOCH_PERIOD_LOOKBACK)
+        action_count_sum = 0
+        for i in range(max_look_back + 1):
+            action_count_sum += self._epoch(_sub(current - 1, i)).action_count
+        period = self._epoch(current - 1).period
+        if d_ratio(action_count_sum, max_look_back) > ONE:
+            # Busy, so shorten epochs
+            return min(period // 2, EPOCH_DEFAULT_PERIOD)
+        return min(_mul(period, 2), EPOCH_DEFAULT_PERIOD)
+
+    def epoch_strategy(self):
+        """
+        Returns (offset, start, period), as in getEpochStrategy().
+        """
+        current = self.current_epoch
+        if current == 0:
+            return (0, EPOCH_START, EPOCH_DEFAULT_PERIOD)
+        return (current, self._epoch(current).start, self.epoch_period())
+
+    def epoch_time(self):
+        (offset, start, period) = self.epoch_strategy()
+        return _div(_sub(self.chain.timestamp, start), period) + offset
+
+    def __is_spent(self, epoch, bid):
+        # A selected bid no longer counts once redeemed, expired or spent down
+        return (
+            bid.redeemed or
+            epoch > bid.expiry or
+            self.balance_of_coupons(bid.bidder, bid.expiry) < bid.coupon_amount
+        )
+
+    def __best_bid_window(self):
+        earliest = self.earliest_active_auction
+        current = self.current_epoch
+        if _sub(current, earliest) > MAX_COUPON_AUCTION_EPOCHS_BEST_BIDDER_SELECTION:
+            return range(earliest, earliest + MAX_COUPON_AUCTION_EPOCHS_BEST_BIDDER_SELECTION)
+        return range(earliest, current)
+
+    def get_sum_of_best_bids_across_coupon_auctions(self):
+        total = 0
+        for epoch in self.__best_bid_window():
+            auction = self._epoch(epoch)
+            if not auction.finished:
+                continue
+            for index in range(auction.total_filled):
+                bid = auction.bids.get(auction.selected_at.get(index, ZERO_ADDRESS), _EMPTY_BID)
+                if self.__is_spent(epoch, bid):
+                    continue
+                total += bid.coupon_amount
+                break
+        return total
+
+    def find_earliest_active_auction_epoch(self):
+        earliest = 1
+        for epoch in self.__best_bid_window():
+            auction = self._epoch(epoch)
+            earliest = epoch
+            if not auction.finished:
+                continue
+            total = 0
+            for index in range(auction.total_filled):
+                bid = auction.bids.get(auction.selected_at.get(index, ZERO_ADDRESS), _EMPTY_BID)
+                if self.__is_spent(epoch, bid):
+                    continue
+                total += self.balance_of_coupons(bid.bidder, bid.expiry)
+                break
+            if total > 0:
+                return earliest
+        return earliest
+
+    def find_earliest_active_auction_primary_bidder_epoch(self):
+        window = self.__best_bid_window()
+        # Past the most bids any auction filled there is nothing left to find,
+        # and the contract's loop runs until it is out of gas
+        max_filled = max([self._epoch(epoch).total_filled for epoch in window] + [0])
+        earliest = 1
+        index = 0
+        while True:
+            total = 0
+            for epoch in window:
+                auction = self._epoch(epoch)
+                earliest = epoch
+                if not auction.finished or index >= auction.total_filled:
+                    continue
+                bid = auction.bids.get(auction.selected_at.get(index, ZERO_ADDRESS), _EMPTY_BID)
+                if self.__is_spent(epoch, bid):
+                    continue
+                total += self.balance_of_coupons(bid.bidder, bid.expiry)
+                break
+            if total > 0:
+                return earliest
+            index += 1
+            if index >= max_filled:
+                raise SimRevert('out of gas')
+
+    def get_best_bidder_from_earliest_active_auction_epoch(self, epoch):
+        auction = self._epoch(epoch)
+        if auction.finished:
+            for index in range(auction.total_filled):
+                bid = auction.bids.get(auction.selected_at.get(index, ZERO_ADDRESS), _EMPTY_BID)
+                if self.__is_spent(epoch, bid):
+                    continue
+                return auction.selected_at.get(index, ZERO_ADDRESS)
+        return ZERO_ADDRESS
+
+    # Setters.sol
+
+    def __increment_balance_of_coupons(self, account, epoch, amount):
+        journal = self.chain.journal
+        journal.set_item(self.coupons, (account, epoch), self.coupons.get((account, epoch), 0) + amount)
+        state = self.__epoch_for_write(epoch)
+        journal.set(state, 'outstanding', state.outstanding + amount)
+        journal.set(self, 'balance_coupons', self.balance_coupons + amount)
+        journal.set_item(self.outstanding_coupons_for, account, self.outstanding_coupons_for.get(account, 0) + amount)
+        # setCouponsAssignedAtEpoch
+        index = self.coupon_assigned_index.get(account, 0)
+        journal.set_item(self.coupon_assigned_at, (account, index), epoch)
+        journal.set_item(self.coupon_assigned_index, account, index + 1)
+
+    def __decrement_balance_of_coupons(self, account, epoch, amount, reason):
+        journal = self.chain.journal
+        journal.set_item(self.coupons, (account, epoch), _sub(self.coupons.get((account, epoch), 0), amount, reason))
+        state = self.__epoch_for_write(epoch)
+        journal.set(state, 'outstanding', _sub(state.outstanding, amount, reason))
+        journal.set(self, 'balance_coupons', _sub(self.balance_coupons, amount, reason))
+        journal.set_item(self.outstanding_coupons_for, account, _sub(self.outstanding_coupons_for.get(account, 0), amount))
+
+    def __eliminate_outstanding_coupons(self, epoch):
+        outstanding = self.outstanding_coupons(epoch)
+        if outstanding == 0:
+            return
+        journal = self.chain.journal
+        journal.set(self, 'balance_coupons', _sub(self.balance_coupons, outstanding))
+        journal.set(self.__epoch_for_write(epoch), 'outstanding', 0)
+
+    def __init_coupon_auction(self, init_price):
+        auction = self.__epoch_for_write(self.current_epoch)
+        if auction.is_init:
+            return
+        journal = self.chain.journal
+        journal.set(auction, 'total_bids', 0)
+        journal.set(auction, 'init_price', init_price)
+        journal.set(auction, 'min_expiry', UINT256_MAX)
+        journal.set(auction, 'max_expiry', 0)
+        journal.set(auction, 'min_yield', UINT256_MAX)
+        journal.set(auction, 'max_yield', 0)
+        journal.set(auction, 'min_dollar_amount', UINT256_MAX)
+        journal.set(auction, 'max_dollar_amount', 0)
+        journal.set(auction, 'is_init', True)
+        journal.set(auction, 'latest_redeemed_selected_bidder_index', 0)
+
+    def __set_coupon_auction_rel(self, bid_yield, expiry, dollar_amount):
+        journal = self.chain.journal
+        auction = self.__epoch_for_write(self.current_epoch)
+        if bid_yield > auction.max_yield:
+            journal.set(auction, 'max_yield', bid_yield)
+        if auction.min_yield > bid_yield:
+            journal.set(auction, 'min_yield', bid_yield)
+        if expiry > auction.max_expiry:
+            journal.set(auction, 'max_expiry', expiry)
+        if expiry < auction.min_expiry:
+            journal.set(auction, 'min_expiry', expiry)
+        if dollar_amount > auction.max_dollar_amount:
+            journal.set(auction, 'max_dollar_amount', dollar_amount)
+        if dollar_amount < auction.min_dollar_amount:
+            journal.set(auction, 'min_dollar_amount', dollar_amount)
+
+    def __set_coupon_bidder_state(self, epoch, index, bidder, expiry, dollar_amount, coupon_amount):
+        journal = self.chain.journal
+        bid = self.__bid_for_write(epoch, bidder)
+        journal.set(bid, 'expiry', expiry)
+        journal.set(bid, 'dollar_amount', dollar_amount)
+        journal.set(bid, 'coupon_amount', coupon_amount)
+        journal.set(bid, 'bidder', bidder)
+        journal.set_item(self.__epoch_for_write(epoch).bidder_at, index, bidder)
+
+    def __set_coupon_bidder_state_selected(self, epoch, bidder, index):
+        self.chain.journal.set(self.__bid_for_write(epoch, bidder), 'selected', True)
+        self.chain.journal.set_item(self.__epoch_for_write(epoch).selected_at, index, bidder)
+
+    def __set_coupon_bidder_state_redeemed(self, epoch, bidder):
+        self.chain.journal.set(self.__bid_for_write(epoch, bidder), 'redeemed', True)
+
+    # Comptroller.sol
+
+    def __mint_to_account(self, account, amount):
+        self.dollar._mint(account, amount)
+        self.__balance_check()
+
+    def __burn_from_account(self, account, amount):
+        self.dollar._transfer_from(self.address, account, self.address, amount)
+        self.dollar._burn(self.address, amount)
+        self.__balance_check()
+
+    def __redeem_to_account(self, account, amount):
+        self.dollar._transfer(self.address, account, amount)
+        if amount != 0:
+            self.chain.journal.set(self, 'balance_redeemable',
+                _sub(self.balance_redeemable, amount, "Comptroller: not enough redeemable balance"))
+        self.__balance_check()
+
+    def __burn_redeemable(self, amount):
+        self.dollar._burn(self.address, amount)
+        self.chain.journal.set(self, 'balance_redeemable',
+            _sub(self.balance_redeemable, amount, "Comptroller: not enough redeemable balance"))
+        self.__balance_check()
+
+    def __increase_supply(self, new_supply):
+        new_redeemable = 0
+        total_redeemable = self.balance_redeemable
+        total_best_coupons = self.get_sum_of_best_bids_across_coupon_auctions()
+        if total_redeemable < total_best_coupons:
+            new_redeemable = min(total_best_coupons - total_redeemable, new_supply)
+            self.__mint_to_redeemable(new_redeemable)
+        self.__balance_check()
+        return (new_redeemable, 0)
+
+    def __acceptable_bid_check(self, account, dollar_amount):
+        return self.dollar.balance_of(account) >= self.balance_of_bonded(account) + dollar_amount
+
+    def __balance_check(self):
+        if self.dollar.balance_of(self.address) < self.balance_bonded + self.balance_staged + self.balance_redeemable:
+            raise SimRevert("Comptroller: Inconsistent balances")
+
+    def __mint_to_redeemable(self, amount):
+        self.dollar._mint(self.address, amount)
+        self.chain.journal.set(self, 'balance_redeemable', self.balance_redeemable + amount)
+        self.__balance_check()
+
+    # Bonding.sol, Regulator.sol and Market.sol steps
+
+    def __bonding_step(self):
+        if not self.epoch_time() > self.current_epoch:
+            raise SimRevert("Bonding: Still current epoch")
+        journal = self.chain.journal
+        # snapshotTotalBonded
+        journal.set(self.__epoch_for_write(self.current_epoch), 'bonded', self.balance_supply)
+        # incrementEpoch
+        journal.set(self, 'current_epoch', self.current_epoch + 1)
+        state = self.__epoch_for_write(self.current_epoch)
+        journal.set(state, 'start', self.chain.timestamp)
+        journal.set(state, 'period', self.epoch_period())
+
+    def __regulator_step(self):
+        (price, valid) = self.oracle.capture()
+        if not valid:
+            price = ONE
+
+        # Bonding.step() has already moved the epoch on
+        prev_epoch = self.current_epoch - 1 if self.current_epoch > 0 else 0
+        auction = self._epoch(prev_epoch)
+        if auction.is_init:
+            # Only settle auctions that did not cross the peg
+            if (price > ONE and auction.init_price > ONE) or (price < ONE and auction.init_price < ONE):
+                self.__settle_coupon_auction(prev_epoch)
+                self.chain.journal.set(self.__epoch_for_write(prev_epoch), 'finished', True)
+
+        self.__init_coupon_auction(price)
+
+        if price > ONE:
+            # growSupply
+            new_supply = self.get_sum_of_best_bids_across_coupon_auctions()
+            self.chain.journal.set(self, 'earliest_active_auction', self.find_earliest_active_auction_epoch())
+            self.__increase_supply(new_supply)
+            self.__auto_redeem_earliest_best_bidder()
+
+    def __settle_coupon_auction(self, epoch):
+        auction = self._epoch(epoch)
+        if auction.finished:
+            return False
+        max_bid_len = auction.total_bids
+        # Regulator's auctionInternals: filled, burned, index, auctioned,
+        # max expiry, expiry sum, min expiry
+        internals = [0, 0, 0, 0, 0, 0, UINT256_MAX]
+        # auctionYieldInternals: max yield, yield sum, min yield
+        yields = [0, 0, UINT256_MAX]
+        visits = [0]
+        root = auction.bids.get(auction.init_bidder, _EMPTY_BID)
+        self.__settle_coupon_auction_bids_in_order(epoch, root.left, max_bid_len, internals, yields, visits)
+
+        filled = internals[0]
+        if filled > 0:
+            journal = self.chain.journal
+            auction = self.__epoch_for_write(epoch)
+            journal.set(auction, 'min_expiry_filled', internals[6])
+            journal.set(auction, 'max_expiry_filled', internals[4])
+            journal.set(auction, 'avg_expiry_filled', d_ratio(internals[5], filled))
+            journal.set(auction, 'min_yield_filled', yields[2])
+            journal.set(auction, 'max_yield_filled', yields[0])
+            journal.set(auction, 'avg_yield_filled', yields[1] // filled)
+            journal.set(auction, 'bid_to_cover', _mul(d_ratio(max_bid_len, filled), 100))
+            journal.set(auction, 'total_filled', filled)
+            journal.set(auction, 'total_auctioned', internals[3])
+            journal.set(auction, 'total_burned', internals[1])
+        return True
+
+    def __settle_coupon_auction_bids_in_order(self, epoch, bidder, max_bid_len, internals, yields, visits):
+        if bidder == ZERO_ADDRESS:
+            return
+        visits[0] += 1
+        if visits[0] > max_bid_len:
+            # Only a loop in the bid tree gets here, and the contract recurses
+            # around it until it is out of gas
+            raise SimRevert('out of gas')
+        bid = self._epoch(epoch).bids.get(bidder, _EMPTY_BID)
+
+        self.__settle_coupon_auction_bids_in_order(epoch, bid.left, max_bid_len, internals, yields, visits)
+
+        # Reject bids past the percentile
+        if d_ratio(internals[2] + 1, max_bid_len) < COUPON_REJECT_BID_PTILE:
+            if not bid.selected and self.__acceptable_bid_check(bid.bidder, bid.dollar_amount):
+                bid_yield = d_ratio(bid.coupon_amount, bid.dollar_amount)
+                if bid_yield < yields[2]:
+                    yields[2] = bid_yield
+                elif bid_yield > yields[0]:
+                    yields[0] = bid_yield
+                if bid.expiry < internals[6]:
+                    internals[6] = bid.expiry
+                elif bid.expiry > internals[4]:
+                    internals[4] = bid.expiry
+                yields[1] += bid_yield
+                internals[5] += bid.expiry
+                internals[3] += bid.coupon_amount
+                internals[1] += bid.dollar_amount
+
+                self.__burn_from_account(bid.bidder, bid.dollar_amount)
+                self.__increment_balance_of_coupons(bid.bidder, bid.expiry, bid.coupon_amount)
+                self.chain.emit(self.address, 'CouponPurchase', (bid.bidder, bid.expiry, bid.dollar_amount, bid.coupon_amount))
+                self.__set_coupon_bidder_state_selected(epoch, bid.bidder, internals[2])
+                internals[0] += 1
+        internals[2] += 1
+
+        self.__settle_coupon_auction_bids_in_order(epoch, bid.right, max_bid_len, internals, yields, visits)
+
+    def __auto_redeem_earliest_best_bidder(self):
+        redeemable = self.balance_redeemable
+        if redeemable == 0:
+            return False
+        epoch = self.find_earliest_active_auction_primary_bidder_epoch()
+        bidder = self.get_best_bidder_from_earliest_active_auction_epoch(epoch)
+        for index in range(self.coupon_assigned_index.get(bidder, 0)):
+            expiry = self.coupon_assigned_at.get((bidder, index), 0)
+            coupons = self.balance_of_coupons(bidder, expiry)
+            if coupons == 0:
+                continue
+            coupons = min(coupons, redeemable)
+            self.__redeem_to_account(bidder, coupons)
+            self.__decrement_balance_of_coupons(bidder, expiry, coupons, "Regulator: Insufficient coupon balance")
+            self.__set_coupon_bidder_state_redeemed(expiry, bidder)
+            self.chain.emit(self.address, 'CouponAutoRedemption', (bidder, expiry, coupons))
+            return True
+        return False
+
+    def __market_step(self):
+        # Expire prior epoch coupons
+        epoch = _sub(self.current_epoch, 1)
+        coupons_for_epoch = self.outstanding_coupons(epoch)
+        (less_redeemable, new_bonded) = (0, 0)
+        self.__eliminate_outstanding_coupons(epoch)
+        total_redeemable = self.balance_redeemable
+        total_coupons = self.balance_coupons
+        if total_redeemable > total_coupons:
+            less_redeemable = total_redeemable - total_coupons
+            self.__burn_redeemable(less_redeemable)
+            (_, new_bonded) = self.__increase_supply(less_redeemable)
+        self.chain.emit(self.address, 'CouponExpiration', (epoch, coupons_for_epoch, less_redeemable, 0, new_bonded))
+
+    def __sort_bid_bst(self, bidder, total_bids, epoch):
+        auction = self.__epoch_for_write(epoch)
+        bid = auction.bids[bidder]
+        if total_bids == 0:
+            # The first bid is the root
+            self.chain.journal.set(auction, 'init_bidder', bidder)
+            return True
+
+        yield_norm = (1 + auction.max_yield - auction.min_yield) % UINT256
+        expiry_norm = (1 + auction.max_expiry - auction.min_expiry) % UINT256
+        dollar_norm = (1 + auction.max_dollar_amount - auction.min_dollar_amount) % UINT256
+
+        root = auction.bids.get(auction.init_bidder, _EMPTY_BID)
+        distance = self.__bid_distance(bid, yield_norm, expiry_norm, dollar_norm)
+        # The contract never moves its parent pointer off the root
+        parent = root.bidder
+        node = root.left
+        steps = 0
+        while node != ZERO_ADDRESS:
+            steps += 1
+            if steps > total_bids:
+                raise SimRevert('out of gas')
+            node_bid = auction.bids.get(node, _EMPTY_BID)
+            node_distance = self.__bid_distance(node_bid, yield_norm, expiry_norm, dollar_norm)
+            if node_distance > distance:
+                node = node_bid.left
+            elif node_distance < distance:
+                node = node_bid.right
+            else:
+                # Duplicate, not sorted
+                return False
+
+        parent_bid = self.__bid_for_write(epoch, parent)
+        parent_distance = self.__bid_distance(parent_bid, yield_norm, expiry_norm, dollar_norm)
+        if parent_distance > distance:
+            self.chain.journal.set(parent_bid, 'left', bidder)
+        elif parent_distance < distance:
+            self.chain.journal.set(parent_bid, 'right', bidder)
+        else:
+            return False
+        return True
+
+    @staticmethod
+    def __bid_distance(bid, yield_norm, expiry_norm, dollar_norm):
+        """
+        Market.computeRelBidDistance(), as a raw D256 value.
+        """
+        yield_rel = d_ratio(d_ratio(bid.coupon_amount, bid.dollar_amount) // BASE, yield_norm)
+        expiry_rel = d_ratio(bid.expiry, expiry_norm)
+        dollar_rel = _sub(2 * ONE, d_ratio(bid.dollar_amount, dollar_norm))
+        sum_of_squares = (
+            _mul(yield_rel, yield_rel) // BASE +
+            _mul(expiry_rel, expiry_rel) // BASE +
+            _mul(dollar_rel, dollar_rel) // BASE
+        )
+        if sum_of_squares > 0:
+            return d_sqrt(sum_of_squares)
+        return 0
+
+    def __step(self):
+        self.__bonding_step()
+        self.__regulator_step()
+        self.__market_step()
+
+    # External functions, for SimChain.transact()
+
+    def _tx_advance(self, sender):
+        prev_epoch = self.current_epoch
+        if prev_epoch > 0 and self.oracle.live_reserve() > ORACLE_RESERVE_MINIMUM:
+            # Can only incentivize advance above or at ref price
+            if not self.oracle.latest_price >= ONE:
+                raise SimRevert("DAO: Must coupon bid")
+        self.__step()
+        self.__mint_to_account(sender, self.advance_incentive)
+        self.chain.journal.set_item(self.has_incentivized, sender, True)
+
+    def _tx_advance_non_incentivized(self, sender):
+        self.__step()
+
+    def _tx_place_coupon_auction_bid(self, sender, coupon_epoch_expiry, dollar_amount, max_coupon_amount):
+        if not coupon_epoch_expiry > 0:
+            raise SimRevert("Market: Must have non-zero expiry")
+        if not dollar_amount > 0:
+            raise SimRevert("Market: Must bid non-zero amount")
+        if not max_coupon_amount > 0:
+            raise SimRevert("Market: Must bid on non-zero amount")
+        if not self.__acceptable_bid_check(sender, dollar_amount):
+            raise SimRevert("Market: Must have enough in account")
+
+        bid_yield = max_coupon_amount // dollar_amount
+        max_expiry = _div(MAX_COUPON_EXPIRATION_TIME, self.epoch_strategy()[2])
+        if not MAX_COUPON_YIELD_MULT >= bid_yield:
+            raise SimRevert("Market: Must be under maxYield")
+        if not max_expiry >= coupon_epoch_expiry:
+            raise SimRevert("Market: Must be under maxExpiry")
+
+        if self.epoch_time() > self.current_epoch:
+            # If currently below reference price, make bidder advance epoch
+            if self.oracle.latest_price < ONE:
+                self._tx_advance_non_incentivized(self.oracle.dao)
+
+        current = self.current_epoch
+        total_bids = self._epoch(current).total_bids
+        expiry = current + coupon_epoch_expiry
+        self.__set_coupon_auction_rel(max_coupon_amount // dollar_amount, expiry, dollar_amount)
+        self.__set_coupon_bidder_state(current, total_bids, sender, expiry, dollar_amount, max_coupon_amount)
+        self.__sort_bid_bst(sender, total_bids, current)
+        # incrementCouponAuctionBids
+        auction = self.__epoch_for_write(current)
+        self.chain.journal.set(auction, 'total_bids', auction.total_bids + 1)
+        self.chain.journal.set(auction, 'action_count', auction.action_count + 1)
+
+    def _tx_redeem_coupons(self, sender, coupon_epoch, coupon_amount):
+        redeemable = self.balance_redeemable
+        coupons = self.balance_of_coupons(sender, coupon_epoch)
+        if not coupons > 0:
+            raise SimRevert("Market: Must be greater than 0")
+        if not coupon_amount <= coupons:
+            raise SimRevert("Market: Must be lte coupon balance")
+        if not coupons <= redeemable:
+            raise SimRevert("Market: Must be lte total redeemable")
+        # The whole balance is redeemed, whatever was asked for
+        self.__redeem_to_account(sender, coupons)
+        self.__decrement_balance_of_coupons(sender, coupon_epoch, coupons, "Market: Insufficient coupon balance")
+        self.__set_coupon_bidder_state_redeemed(coupon_epoch, sender)
+        self.chain.emit(self.address, 'CouponRedemption', (sender, coupon_epoch, coupons))
+
+    def _tx_redeem_coupons_for_account(self, sender, coupon_epoch, coupon_amount, bidder):
+        self.__redeem_to_account(bidder, coupon_amount)
+        self.__decrement_balance_of_coupons(bidder, coupon_epoch, coupon_amount, "Market: Insufficient coupon balance")
+        self.__set_coupon_bidder_state_redeemed(coupon_epoch, bidder)
+        self.chain.emit(self.address, 'CouponRedemption', (bidder, coupon_epoch, coupon_amount))
+
+    # DAO interface
+
+    def xsd_supply(self):
+        return self.xsd_token.totalSupply
+
+    def total_coupons_at_epoch(self, address, epoch):
+        return Balance.from_tokens(self.outstanding_coupons(epoch), XSD_DECIMALS)
+
+    def total_coupons(self, address):
+        return reg_int(self.balance_coupons, XSD_DECIMALS)
+
+    def total_redeemable(self, address):
+        return reg_int(self.balance_redeemable, XSD_DECIMALS)
+
+    def update(self):
+        """
+        Apply our coupon events since the last update() to the coupon ledger.
+        """
+        (events, self.__log_cursor) = self.chain.logs_since(self.__log_cursor, self.address)
+        for event in events:
+            self.coupon_ledger.apply(event)
+
+    def total_coupons_for_agent(self, agent):
+        return self.coupon_ledger.outstanding_for(agent)
+
+    def coupon_balance_at_epoch(self, address, epoch):
+        if epoch == 0:
+            return 0
+        return self.coupon_ledger.balance(address, epoch)
+
+    def get_coupon_expirirations(self, agent):
+        agent.coupon_expirys = self.coupon_ledger.expiries(agent)
+        return agent.coupon_expirys
+
+    def epoch(self, address):
+        return self.current_epoch
+
+    def has_coupon_bid(self):
+        return True
+
+    def coupon_bid(self, agent, coupon_expiry, xsd_amount, max_coupon_amount):
+        self.xsd_token.ensure_approved(agent, self.address)
+        receipt = self.chain.transact(agent, self.address, 'placeCouponAuctionBid', (
+            coupon_expiry,
+            xsd_amount.to_wei(),
+            max_coupon_amount.to_wei()
+        ), self._tx_place_coupon_auction_bid)
+        self.chain.pending.expect(receipt['id'], [(self.xsd_token, agent, 0 - xsd_amount)])
+        return receipt
+
+    def redeem(self, agent, epoch_expired):
+        total_coupons = self.coupon_balance_at_epoch(agent.address, epoch_expired)
+        if total_coupons == 0:
+            return
+        receipt = self.chain.transact(agent, self.address, 'redeemCoupons', (
+            epoch_expired,
+            total_coupons
+        ), self._tx_redeem_coupons)
+        self.chain.pending.expect(receipt['id'], [(self.xsd_token, agent, Balance(total_coupons, XSD_DECIMALS))])
+        return receipt
+
+    def redeem_for_account(self, keeper, address, epoch, amount):
+        receipt = self.chain.transact(keeper, self.address, 'redeemCouponsForAccount', (
+            epoch,
+            amount,
+            address
+        ), self._tx_redeem_coupons_for_account)
+        self.chain.pending.expect(receipt['id'], [(self.xsd_token, address, Balance(amount, XSD_DECIMALS))])
+        return receipt
+
+    def advance(self, agent):
+        receipt = self.chain.transact(agent, self.address, 'advance', (), self._tx_advance)
+        self.chain.mine()
+        return receipt
+
+class SimAgent(Strategy):
+    """
+    An agent in the simulation. Like Agent, but without a wallet on a chain.
+    """
+
+    def __init__(self, dao, pangolin_pair, xsd_token, usdt_token, **kwargs):
+        self.dao = dao
+        self.xsd_token = xsd_token
+        self.usdt_token = usdt_token
+        self.pangolin_pair_token = pangolin_pair
+        self.address = kwargs["wallet_address"]
+
+        self.max_faith = kwargs.get("max_faith", 0.0)
+        self.min_faith = kwargs.get("min_faith", 0.0)
+        self.use_faith = kwargs.get("use_faith", True)
+        self.provide_liquidity_weight = kwargs.get("provide_liquidity_weight", Strategy.provide_liquidity_weight)
+        self.remove_liquidity_weight = kwargs.get("remove_liquidity_weight", Strategy.remove_liquidity_weight)
+
+        self.coupon_expirys = []
+        self.redeem_count = 0
+        self.max_coupon_epoch_index = 0
+        self.starting_usdt = kwargs.get("starting_usdt", Balance(0, USDT_DECIMALS))
+
+    @property
+    def xsd(self):
+        return self.xsd_token[self]
+
+    @property
+    def usdt(self):
+        return self.usdt_token[self]
+
+    @property
+    def lp(self):
+        return self.pangolin_pair_token[self]
+
+    @property
+    def coupons(self):
+        return self.dao.total_coupons_for_agent(self)
+
+    def __str__(self):
+        return "SimAgent(xSD={:.2f}, usdt={:.2f}, lp={}, coupons={:.2f})".format(
+            self.xsd, self.usdt, self.lp, self.coupons)
+
+class SimModel(Economy):
+    """
+    Full model of the economy, in memory. The agents decide, trade and
+    redeem through the same Economy code as Model does on a chain.
+    """
+
+    def __init__(self, chain, dao, pangolin, usdt, xsd, oracle, agents, seed=None, vector_decisions=True, batched_redeem=True, **kwargs):
+        """
+        Set up agents at the given addresses over the simulated contracts.
+        All the model's random choices come from RNGs with the given seed.
+
+        If vector_decisions is set, agents pick their actions all at once
+        with a Population, like model.py's is_vector_decisions. If
+        batched_redeem is set, the first agent redeems everyone's coupons as
+        one plan, like model.py's is_batched_redeem. The other
+        model-level parameters are in params.MODEL_DEFAULTS, and the rest of
+        kwargs go to the agents.
+        """
+        params = model_params(kwargs)
+        self.chain = chain
+        self.dao = dao
+        self.pangolin = pangolin
+        self.oracle = oracle
+        self.usdt_token = usdt
+        self.xsd_token = xsd
+        self.rng = random.Random(seed)
+        self.agents = []
+        self.max_avax = Balance.from_tokens(params['max_avax'], 18)
+        self.max_usdt = self.usdt_token.from_tokens(params['max_usdt'])
+        self.bootstrap_epoch = params['bootstrap_epoch']
+        self.max_coupon_exp = params['max_coupon_exp']
+        self.max_coupon_premium = params['max_coupon_premium']
+        self.min_usdt_balance = self.usdt_token.from_tokens(params['min_usdt_balance'])
+        self.agent_coupons = {x: 0 for x in agents}
+        self.has_prev_advanced = True
+        self.step_count = 0
+
+        for address in agents:
+            # Same draws as Model, so a seed means the same agents
+            start_avax = self.rng.random() * self.max_avax
+            start_usdt = self.rng.random() * self.max_usdt
+            self.agents.append(SimAgent(self.dao, pangolin.pangolin_pair_token, xsd, usdt,
+                starting_usdt=start_usdt, wallet_address=address, **kwargs))
+
+        self.population = Population.from_agents(self.agents, seed=seed) if vector_decisions else None
+        self.is_batched_redeem = batched_redeem
+        self.keeper = self.agents[0]
+        self.redemption_stats = RedemptionStats(XSD_DECIMALS)
+
+    def bootstrap(self):
+        """
+        Mint each agent's starting USDT, and approve the router for USDT, xSD
+        and PGL and the DAO for xSD, like Model.bootstrap().
+        """
+        approvals = [
+            (self.usdt_token, self.pangolin.router_address),
+            (self.xsd_token, self.pangolin.router_address),
+            (self.pangolin.pangolin_pair_token, self.pangolin.router_address),
+            (self.xsd_token, self.dao.address),
+        ]
+        for a in self.agents:
+            self.usdt_token.mint(a, a.starting_usdt.to_wei())
+        for a in self.agents:
+            for (token, spender) in approvals:
+                token.approve(a, spender)
+        self.chain.mine()
+        self.update()
+
+    def update(self):
+        self.usdt_token.update()
+        self.xsd_token.update()
+        self.pangolin.update()
+        self.dao.update()
+
+    def mine(self):
+        self.chain.mine()
+
+    def mine_alone(self, receipt):
+        self.chain.mine()
+        return receipt, receipt
+
+    def snapshot(self, address=None, with_agents=True):
+        """
+        Read the DAO, pair and oracle, and (optionally) every agent's
+        coupons, with the same keys as Model.snapshot().
+        """
+        agents = self.agents if with_agents else []
+        reserves = self.pangolin.getReserves()
+        token0 = self.pangolin.getToken0()
+        (usdt_b, xsd_b) = self.pangolin.getTokenBalance(reserves, token0)
+        return {
+            'block': self.chain.block_number,
+            'epoch': self.dao.current_epoch,
+            'total_coupons': reg_int(self.dao.balance_coupons, XSD_DECIMALS),
+            'total_redeemable': reg_int(self.dao.balance_redeemable, XSD_DECIMALS),
+            'earliest_active_auction': self.dao.earliest_active_auction,
+            'agent_coupons': {a.address: self.dao.total_coupons_for_agent(a) for a in agents},
+            'reserves': reserves,
+            'token0': token0,
+            'usdt_b': usdt_b,
+            'xsd_b': xsd_b,
+            'price': self.pangolin.xsd_price(reserves, token0),
+            'xsd_supply': self.xsd_token.from_wei(self.xsd_token.supply),
+            'latest_price': Balance(self.oracle.latest_price, XSD_DECIMALS),
+            'latest_valid': self.oracle.latest_valid,
+        }
+
+    def step(self):
+        """
+        Step the model. Let all the agents act.
+
+        Returns (True if anyone could act, the agent picked to advance).
+        """
+        self.step_count += 1
+        self.update()
+
+        seleted_advancer = self.pick_advancer()
+
+        if self.has_prev_advanced:
+            self.chain.sleep(7200)
+
+        current_timestamp = self.chain.timestamp
+        adv_recp = self.dao.advance(seleted_advancer)
+        self.has_prev_advanced = adv_recp["status"] == 1
+        # The advance settles auctions and expires coupons
+        self.dao.update()
+
+        snapshot = self.snapshot()
+        current_epoch = snapshot['epoch']
+        total_coupons = snapshot['total_coupons']
+        self.agent_coupons.update(snapshot['agent_coupons'])
+        tr = snapshot['total_redeemable']
+
+        logger.debug("Block {}, epoch {}, price {:.2f}, supply {:.2f}, coupons: {:.2f}, liquidity {:.2f} xSD / {:.2f} USDT".format(
+            snapshot['block'], current_epoch, snapshot['price'], snapshot['xsd_supply'], total_coupons, snapshot['xsd_b'], snapshot['usdt_b']))
+
+        if current_epoch < self.bootstrap_epoch:
+            return True, seleted_advancer
+
+        receipts = []
+        self.rng.shuffle(self.agents)
+
+        # Redeem any outstanding coupons first
+        if tr > 0 and total_coupons > 0:
+            redemptions = self.redeem(tr.to_wei())
+            receipts.extend(('redeem', receipt) for (receipt, _) in redemptions)
+            for (receipt, coupons) in redemptions:
+                self.redemption_stats.landed(coupons, receipt['status'])
+
+        (anyone_acted, txs) = self.act(snapshot, current_timestamp, seleted_advancer)
+        receipts.extend(txs)
+
+        self.chain.mine()
+        for (_, receipt) in receipts:
+            self.chain.pending.landed(receipt['id'], receipt['status'])
+        tx_fails = [tx_type for (tx_type, receipt) in receipts if receipt["status"] == 0]
+        logger.debug("total tx: {}, successful tx: {}, tx fails: {}".format(
+            len(receipts), len(receipts) - len(tx_fails), json.dumps(tx_fails)))
+
+        return anyone_acted, seleted_advancer
+
+def make_model(agent_count, seed=None, epoch_period=EPOCH_DEFAULT_PERIOD, start_time=None, advance_incentive=150, **kwargs):
+    """
+    Deploy fresh simulated contracts and a SimModel with agent_count agents
+    over them, funded and approved. advance_incentive is in xSD, and kwargs
+    go to SimModel.
+
+    Every epoch lasts epoch_period seconds. Pass 0 or None to have the period
+    adapt like Getters.epochPeriod() instead, which reverts every advance in
+    epochs 1 through 24.
+    """
+    if start_time is None:
+        # Far enough along that the first advance can go
+        start_time = EPOCH_START + 2 * EPOCH_DEFAULT_PERIOD
+    chain = SimChain(start_time)
+    usdt = SimToken(chain, sim_address('USDT'), 'USDT', USDT_DECIMALS)
+    xsd = SimToken(chain, sim_address('xSD'), 'xSD', XSD_DECIMALS,
+        infinite_allowance=True, allowance_error="Dollar: transfer amount exceeds allowance")
+    pair = SimPair(chain, sim_address('PGL'), usdt, xsd)
+    dao_address = sim_address('DAO')
+    oracle = SimOracle(chain, pair, xsd.address, dao_address)
+    dao = SimDAO(chain, dao_address, xsd, oracle, epoch_period=epoch_period or None,
+        advance_incentive=int(advance_incentive * 10**XSD_DECIMALS))
+    pangolin = SimPangolinPool(chain, pair, sim_address('PangolinRouter'), usdt, xsd)
+    agents = [sim_address('agent-{}'.format(i)) for i in range(agent_count)]
+
+    model = SimModel(chain, dao, pangolin, usdt, xsd, oracle, agents, seed=seed, **kwargs)
+    model.bootstrap()
+    return model
+
+def main():
+    """
+    Main function: run the simulation.
+    """
+    parser = argparse.ArgumentParser(description="Run the xSD model in memory.")
+    parser.add_argument('--epochs', type=int, default=50000, help="steps to run")
+    parser.add_argument('--agents', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--epoch-period', type=int, default=EPOCH_DEFAULT_PERIOD,
+        help="fixed epoch length in seconds, or 0 to adapt it like the DAO does (which reverts in epochs 1-24)")
+    parser.add_argument('--log', default='sim_log.tsv', help="TSV to log system state to, like model.py's log.tsv")
+    parser.add_argument('--progress', type=int, default=1000, help="report progress every this many steps")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model = make_model(
+        args.agents,
+        seed=args.seed,
+        epoch_period=args.epoch_period or None,
+        min_faith=0.5E6,
+        max_faith=1E6,
+        use_faith=True
+    )
+
+    start = time.time()
+    with open(args.log, 'w') as stream:
+        for i in range(args.epochs):
+            (anyone_acted, seleted_advancer) = model.step()
+            if not anyone_acted:
+                logger.info("Nobody could act")
+                break
+            model.log(stream, seleted_advancer, model.chain.timestamp, header=(i == 0))
+            if args.progress > 0 and (i + 1) % args.progress == 0:
+                elapsed = time.time() - start
+                logger.info("step {}, epoch {}, {:.1f} steps/s, {} tx ({} reverted)".format(
+                    i + 1, model.dao.current_epoch, (i + 1) / elapsed, model.chain.tx_count, model.chain.revert_count))
+
+    logger.info("Ran {} steps in {:.1f} (s)".format(model.step_count, time.time() - start))
+    logger.info("Redemptions: {}".format(json.dumps(model.redemption_stats.summary())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""
+sim_diff.py: run sim.py's model and a chain side by side, and report where
+they disagree.
+
+Every transaction the simulated agents make is also sent to the chain, one
+block each, and the simulated contracts run it at that block's timestamp.
+After every step the DAO, pair, oracle and agent balances are read from the
+chain and compared with the simulation. Needs a freshly deployed chain, like
+model.py, and runs from this directory.
+"""
+
+import argparse
+import logging
+
+import model
+from nonces import NonceTable
+import sim
+
+logger = logging.getLogger(__name__)
+
+GAS = 8000000
+
+class Sender:
+    """
+    Just enough of an Agent for model.transaction_helper().
+    """
+
+    __slots__ = ('address', 'next_tx_count')
+
+    def __init__(self, address, next_tx_count):
+        self.address = address
+        self.next_tx_count = next_tx_count
+
+class DiffChain(sim.SimChain):
+    """
+    A SimChain that sends every transaction to the chain first, and runs the
+    simulated one at the block time the chain gave it.
+    """
+
+    def __init__(self, timestamp, contracts, senders):
+        """
+        contracts maps from address to web3py contract, for every contract
+        the simulation transacts with. senders maps from address to Sender.
+        """
+        super().__init__(timestamp)
+        self.contracts = contracts
+        self.senders = senders
+        # (sender, contract address, function, args, sim receipt, chain receipt) where the status differs
+        self.divergences = []
+
+    def transact(self, sender, to, fn_name, args, fn):
+        sender = getattr(sender, 'address', sender)
+        prepared = getattr(self.contracts[to].functions, fn_name)(*args)
+        tx_hash = model.transaction_helper(self.senders[sender], prepared, GAS)
+        model.issue_block()
+        chain_receipt = model.receipt_collector.wait(tx_hash)
+        self.senders[sender].next_tx_count += 1
+        self.timestamp = model.w3.eth.get_block(chain_receipt['blockNumber'])['timestamp']
+
+        receipt = super().transact(sender, to, fn_name, args, fn)
+        if receipt['status'] != chain_receipt['status']:
+            logger.info({
+                "divergence": "status",
+                "function": fn_name,
+                "from": sender,
+                "sim": receipt,
+                "chain": chain_receipt['status'],
+                "block": chain_receipt['blockNumber'],
+            })
+            self.divergences.append((sender, to, fn_name, args, receipt, dict(chain_receipt)))
+        return receipt
+
+    def mine(self):
+        # Every transaction got its own block on the chain already
+        self.block_number += 1
+
+    def sleep(self, seconds):
+        model.provider.make_request("debug_increaseTime", [seconds])
+        super().sleep(seconds)
+
+def sync_token(token, contract, addresses):
+    """
+    Copy a token's balances for the given addresses, and its supply, from
+    the chain into a SimToken.
+    """
+    for address in addresses:
+        token.balances[address] = contract.caller().balanceOf(address)
+    token.supply = contract.caller().totalSupply()
+
+def build(agent_count, seed=None, epoch_period=None):
+    """
+    Make a SimModel over simulated contracts at the chain's addresses, in the
+    chain's current state. Raises RuntimeError if the DAO has already run an
+    auction, since that state can't be read back.
+    """
+    w3 = model.w3
+    dao_contract = w3.eth.contract(abi=model.DaoContract['abi'], address=model.xSDS["addr"])
+    if dao_contract.caller().epoch() != 0 or dao_contract.caller().totalCoupons() != 0:
+        raise RuntimeError("sim_diff.py needs a freshly deployed chain")
+
+    oracle_contract = w3.eth.contract(abi=model.OracleContract['abi'], address=dao_contract.caller().oracle())
+    pair_contract = w3.eth.contract(abi=model.PangolinPairContract['abi'], address=model.PGL["addr"])
+    usdt_contract = w3.eth.contract(abi=model.USDTContract['abi'], address=model.USDT["addr"])
+    xsd_contract = w3.eth.contract(abi=model.DollarContract['abi'], address=dao_contract.caller().dollar())
+    router_contract = w3.eth.contract(abi=model.PangolinRouterAbiContract['abi'], address=model.PGLRouter["addr"])
+
+    agents = w3.eth.accounts[:agent_count]
+    holders = agents + [dao_contract.address, pair_contract.address, sim.ZERO_ADDRESS]
+    model.nonce_table = NonceTable(model.MMAP_FILE, agents, create=True)
+    senders = {a: Sender(a, w3.eth.getTransactionCount(a)) for a in agents}
+    contracts = {c.address: c for c in [dao_contract, pair_contract, usdt_contract, xsd_contract, router_contract]}
+
+    chain = DiffChain(w3.eth.get_block('latest')['timestamp'], contracts, senders)
+    chain.block_number = w3.eth.blockNumber
+
+    usdt = sim.SimToken(chain, usdt_contract.address, 'USDT', sim.USDT_DECIMALS)
+    xsd = sim.SimToken(chain, xsd_contract.address, 'xSD', sim.XSD_DECIMALS,
+        infinite_allowance=True, allowance_error="Dollar: transfer amount exceeds allowance")
+    pair = sim.SimPair(chain, pair_contract.address, usdt, xsd)
+    for (token, contract) in [(usdt, usdt_contract), (xsd, xsd_contract), (pair.lp, pair_contract)]:
+        sync_token(token, contract, holders)
+        for a in agents:
+            for spender in [router_contract.address, dao_contract.address]:
+                allowance = contract.caller().allowance(a, spender)
+                if allowance > 0:
+                    token.allowances[(a, spender)] = allowance
+    (pair.reserve0, pair.reserve1, pair.block_timestamp_last) = pair_contract.caller().getReserves()
+    pair.price0_cumulative_last = pair_contract.caller().price0CumulativeLast()
+    pair.price1_cumulative_last = pair_contract.caller().price1CumulativeLast()
+
+    # MockOracle doesn't expose its index; sim.SimOracle works it out from the pair
+    oracle = sim.SimOracle(chain, pair, xsd.address, dao_contract.address)
+    oracle.initialized = oracle_contract.caller().isInitialized()
+    oracle.cumulative = oracle_contract.caller().cumulative()
+    oracle.timestamp = oracle_contract.caller().timestamp()
+    oracle.reserve = oracle_contract.caller().reserve()
+    oracle.latest_price = oracle_contract.caller().latestPrice()[0]
+    oracle.latest_valid = oracle_contract.caller().latestValid()
+
+    dao = sim.SimDAO(chain, dao_contract.address, xsd, oracle, epoch_period=epoch_period)
+    dao.balance_redeemable = dao_contract.caller().totalRedeemable()
+    pangolin = sim.SimPangolinPool(chain, pair, router_contract.address, usdt, xsd)
+
+    sim_model = sim.SimModel(chain, dao, pangolin, usdt, xsd, oracle, agents, seed=seed, min_faith=0.5E6, max_faith=1E6, use_faith=True)
+    sim_model.contracts = {
+        'dao': dao_contract,
+        'pair': pair_contract,
+        'oracle': oracle_contract,
+        'usdt': usdt_contract,
+        'xsd': xsd_contract,
+    }
+    return sim_model
+
+def observe(sim_model):
+    """
+    Read the state the model cares about from the chain, in one batch, and
+    from the simulation. Returns a list of (name, sim value, chain value) for
+    everything that differs.
+    """
+    contracts = sim_model.contracts
+    dao = sim_model.dao
+    pair = sim_model.pangolin.pair
+    oracle = sim_model.oracle
+
+    reads = model.new_reads()
+    pairs = [
+        ('epoch', dao.current_epoch, reads.add(contracts['dao'].functions.epoch())),
+        ('totalCoupons', dao.balance_coupons, reads.add(contracts['dao'].functions.totalCoupons())),
+        ('totalRedeemable', dao.balance_redeemable, reads.add(contracts['dao'].functions.totalRedeemable())),
+        ('earliestActiveAuction', dao.earliest_active_auction, reads.add(contracts['dao'].functions.getEarliestActiveAuctionEpoch())),
+        ('xsd.totalSupply', sim_model.xsd_token.supply, reads.add(contracts['xsd'].functions.totalSupply())),
+        ('pair.getReserves', [pair.reserve0, pair.reserve1, pair.block_timestamp_last], reads.add(contracts['pair'].functions.getReserves(), transform=list)),
+        ('pair.totalSupply', pair.lp.supply, reads.add(contracts['pair'].functions.totalSupply())),
+        ('oracle.latestPrice', oracle.latest_price, reads.add(contracts['oracle'].functions.latestPrice(), transform=lambda d: d[0])),
+        ('oracle.latestValid', oracle.latest_valid, reads.add(contracts['oracle'].functions.latestValid())),
+    ]
+    for a in sim_model.agents:
+        pairs.extend([
+            ('usdt[{}]'.format(a.address), sim_model.usdt_token.balance_of(a.address), reads.add(contracts['usdt'].functions.balanceOf(a.address))),
+            ('xsd[{}]'.format(a.address), sim_model.xsd_token.balance_of(a.address), reads.add(contracts['xsd'].functions.balanceOf(a.address))),
+            ('lp[{}]'.format(a.address), pair.lp.balance_of(a.address), reads.add(contracts['pair'].functions.balanceOf(a.address))),
+            ('coupons[{}]'.format(a.address), dao.outstanding_coupons_for.get(a.address, 0), reads.add(contracts['dao'].functions.outstandingCouponsForAddress(a.address))),
+        ])
+    reads.execute()
+
+    return [(name, value, call.result()) for (name, value, call) in pairs if value != call.result()]
+
+def main():
+    """
+    Main function: run the simulation against the chain.
+    """
+    parser = argparse.ArgumentParser(description="Check sim.py against the chain.")
+    parser.add_argument('--epochs', type=int, default=100, help="steps to run")
+    parser.add_argument('--agents', type=int, default=model.max_accounts)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--epoch-period', type=int, default=0,
+        help="fixed epoch length in seconds, if the deployed DAO was built with one, or 0 to adapt it like the DAO does")
+    parser.add_argument('--stop', action='store_true', help="stop at the first divergence")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    sim_model = build(args.agents, seed=args.seed, epoch_period=args.epoch_period or None)
+    sim_model.bootstrap()
+
+    diverged_steps = 0
+    for i in range(args.epochs):
+        (anyone_acted, _) = sim_model.step()
+        differences = observe(sim_model)
+        if len(differences) > 0:
+            diverged_steps += 1
+            for (name, sim_value, chain_value) in differences:
+                logger.info({"divergence": name, "step": i, "sim": sim_value, "chain": chain_value})
+            if args.stop:
+                break
+        if not anyone_acted:
+            logger.info("Nobody could act")
+            break
+
+    chain = sim_model.chain
+    logger.info("{} steps, {} tx, {} with a different status, {} steps with different state".format(
+        sim_model.step_count, chain.tx_count, len(chain.divergences), diverged_steps))
+
+if __name__ == "__main__":
+    main()
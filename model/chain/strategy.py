@@ -0,0 +1,90 @@
+"""
+strategy.py: how agents choose what to do.
+
+The decision rules are kept apart from the Agent in model.py, which is tied
+to the chain, so the in-memory simulation in sim.py runs the same agents.
+"""
+
+import collections
+import math
+
+class Strategy:
+    """
+    Mixin for agents with faith in xSD. Subclasses set max_faith, min_faith
+    and use_faith, and may set the liquidity weights.
+    """
+
+    # Weights for providing liquidity, and for removing it above the peg
+    provide_liquidity_weight = 0.1
+    remove_liquidity_weight = 0.1
+
+    def get_strategy(self, current_timestamp, price, total_supply, total_coupons, agent_coupons):
+        """
+        Get weights, as a dict from action to float, as a function of the price.
+        """
+        
+        strategy = collections.defaultdict(lambda: 1.0)
+        
+        # TODO: real (learned? adversarial? GA?) model of the agents
+        # TODO: agent preferences/utility function
+
+        # People are fast to coupon bid to get in front of redemption queue
+        strategy["coupon_bid"] = 2.0
+
+
+        strategy["provide_liquidity"] = self.provide_liquidity_weight
+        
+        
+        if price >= 1.0:
+            # No rewards for expansion by itself
+            strategy["bond"] = 0
+            # And not unbond
+            strategy["unbond"] = 0
+            # Or redeem if possible
+            # strategy["redeem"] = 10000000000000.0 if self.coupons > 0 else 0
+            # incetive to buy above 1 is for more coupons
+            strategy["buy"] = 1.0
+            strategy["sell"] = 1.0
+
+            # less incentive to remove liquidity above 1
+            strategy["remove_liquidity"] = self.remove_liquidity_weight
+        else:
+            # We probably want to unbond due to no returns
+            strategy["unbond"] = 0
+            # And not bond
+            strategy["bond"] = 0
+
+            # likely to remove liquidity below peg to reduce IL?
+            strategy["remove_liquidity"] = 4.0 if agent_coupons > 0 else 1.0
+       
+        if self.use_faith:
+            # Vary our strategy based on how much xSD we think ought to exist
+            if price * total_supply > self.get_faith(current_timestamp, price, total_supply):
+                # There is too much xSD, so we want to sell
+                strategy["sell"] = 2.0
+            else:
+                # no faith based buying, just selling
+                pass
+        
+        return strategy
+        
+    def get_faith(self, current_timestamp, price, total_supply):
+        """
+        Get the total faith in xSD that this agent has, in USDT.
+        
+        If the market cap is over the faith, the agent thinks the system is
+        over-valued. If the market cap is under the faith, the agent thinks the
+        system is under-valued.
+        """
+        
+        # TODO: model the real economy as bidding on utility in
+        # mutually-beneficial exchanges conducted in xSD, for which a velocity
+        # is needed, instead of an abstract faith?
+        
+        # TODO: different faith for different people
+        
+        center_faith = (self.max_faith + self.min_faith) / 2
+        swing_faith = (self.max_faith - self.min_faith) / 2
+        faith = center_faith + swing_faith * math.sin(current_timestamp * (2 * math.pi / 5000000))
+        
+        return faith
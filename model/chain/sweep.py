@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+sweep.py: run the model over a grid of parameters, in parallel.
+
+Every combination of parameter values, for every seed, is one run. Runs are
+spread over a process pool. Each gets its own in-memory chain (sim.py) and
+its own directory holding the parameters it ran with, its log.tsv and its
+result. When they are all done, the results go into one results.tsv, and
+all the logs go into combined.tsv with a run column in front.
+
+    ./sweep.py --param agents=20,40 --param max_coupon_premium=2,10 \
+        --param provide_liquidity_weight=0.1,0.01 --seeds 0 1 2 --epochs 2000
+
+A parameter is anything sim.make_model() takes: agents, epoch_period (0 to
+adapt it like the DAO), advance_incentive (in xSD), the model-level
+parameters in params.MODEL_DEFAULTS, and agent settings like max_faith,
+min_faith and the liquidity weights. Runs already finished in the output
+directory are not run again.
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import time
+
+import sim
+
+logger = logging.getLogger(__name__)
+
+# What a run uses for anything not in the grid, as model.py's main() has it
+RUN_DEFAULTS = {
+    'agents': 40,
+    'epoch_period': sim.EPOCH_DEFAULT_PERIOD,
+    'advance_incentive': 150,
+    'min_faith': 0.5E6,
+    'max_faith': 1E6,
+    'use_faith': True,
+}
+
+# Columns of a run's log.tsv, as Model.log() writes them
+LOG_COLUMNS = ['block', 'epoch', 'price', 'supply', 'coupons', 'total_redeemable', 'lp_supply', 'faith']
+
+def parse_param(text):
+    """
+    Parse name=v1,v2,... into (name, [values]). Values are JSON where they
+    parse as JSON, and strings otherwise.
+    """
+    (name, values) = text.split('=', 1)
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(json.loads(value))
+        except ValueError:
+            parsed.append(value)
+    return name.strip(), parsed
+
+def expand(grid, seeds):
+    """
+    Get every combination of the grid's values, for every seed, as a list of
+    (seed, params dict).
+    """
+    names = sorted(grid)
+    return [
+        (seed, dict(zip(names, values)))
+        for values in itertools.product(*[grid[name] for name in names])
+        for seed in seeds
+    ]
+
+def run(spec):
+    """
+    Do one run, in a worker process. spec has the run 'id', its 'dir', the
+    'seed', the grid 'params' and how many 'epochs' to step.
+
+    Returns the run's result dict, which is also saved as result.json.
+    """
+    params = dict(RUN_DEFAULTS, **spec['params'])
+    os.makedirs(spec['dir'], exist_ok=True)
+    with open(os.path.join(spec['dir'], 'params.json'), 'w') as f:
+        json.dump(dict(params, seed=spec['seed']), f, indent=2)
+
+    start = time.time()
+    kwargs = dict(params)
+    agents = kwargs.pop('agents')
+    epoch_period = kwargs.pop('epoch_period')
+    model = sim.make_model(agents, seed=spec['seed'], epoch_period=epoch_period or None, **kwargs)
+
+    with open(os.path.join(spec['dir'], 'log.tsv'), 'w') as stream:
+        for i in range(spec['epochs']):
+            (anyone_acted, seleted_advancer) = model.step()
+            if not anyone_acted:
+                break
+            model.log(stream, seleted_advancer, model.chain.timestamp, header=(i == 0))
+
+    result = {
+        'id': spec['id'],
+        'seed': spec['seed'],
+        'params': spec['params'],
+        'steps': model.step_count,
+        'tx': model.chain.tx_count,
+        'reverted': model.chain.revert_count,
+        'seconds': time.time() - start,
+    }
+    tmp_path = os.path.join(spec['dir'], 'result.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(result, f)
+    os.replace(tmp_path, os.path.join(spec['dir'], 'result.json'))
+    return result
+
+def read_log(path):
+    """
+    Read a run's log.tsv into a list of rows of floats.
+    """
+    rows = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            rows.append([float(x) for x in line.split('\t')])
+    return rows
+
+def collect(out_dir, results, names):
+    """
+    Write results.tsv, one row of parameters and outcomes per run, and
+    combined.tsv, every run's log with its run id in front.
+    """
+    price = LOG_COLUMNS.index('price')
+    with open(os.path.join(out_dir, 'results.tsv'), 'w') as table, \
+            open(os.path.join(out_dir, 'combined.tsv'), 'w') as combined:
+        table.write('#' + '\t'.join(['run', 'seed'] + names + [
+            'steps', 'epoch', 'final_price', 'min_price', 'max_price', 'mean_price',
+            'supply', 'coupons', 'total_redeemable', 'tx', 'reverted', 'seconds'
+        ]) + '\n')
+        combined.write('#' + '\t'.join(['run'] + LOG_COLUMNS) + '\n')
+
+        for result in sorted(results, key=lambda r: r['id']):
+            rows = read_log(os.path.join(out_dir, result['id'], 'log.tsv'))
+            for row in rows:
+                combined.write(result['id'] + '\t' + '\t'.join('{:g}'.format(x) for x in row) + '\n')
+
+            prices = [row[price] for row in rows] or [0.0]
+            last = dict(zip(LOG_COLUMNS, rows[-1])) if rows else {c: 0.0 for c in LOG_COLUMNS}
+            table.write('\t'.join([result['id'], str(result['seed'])] + [
+                json.dumps(result['params'].get(name)) for name in names
+            ] + [
+                str(result['steps']),
+                '{:g}'.format(last['epoch']),
+                '{:.4f}'.format(prices[-1]),
+                '{:.4f}'.format(min(prices)),
+                '{:.4f}'.format(max(prices)),
+                '{:.4f}'.format(sum(prices) / len(prices)),
+                '{:.2f}'.format(last['supply']),
+                '{:.2f}'.format(last['coupons']),
+                '{:.2f}'.format(last['total_redeemable']),
+                str(result['tx']),
+                str(result['reverted']),
+                '{:.1f}'.format(result['seconds']),
+            ]) + '\n')
+
+def main():
+    """
+    Main function: run the sweep.
+    """
+    parser = argparse.ArgumentParser(description="Run the model over a grid of parameters.")
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=V1,V2',
+        help="values to sweep a parameter over; repeat for more parameters")
+    parser.add_argument('--grid', help="JSON file of {name: [values]}, as well as or instead of --param")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--epochs', type=int, default=2000, help="steps per run")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processes to run at once")
+    parser.add_argument('--out', default='sweep', help="directory for run directories and combined results")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    grid = {}
+    if args.grid:
+        with open(args.grid, 'r') as f:
+            grid.update(json.load(f))
+    for text in args.param:
+        (name, values) = parse_param(text)
+        grid[name] = values
+    names = sorted(grid)
+
+    os.makedirs(args.out, exist_ok=True)
+    specs = []
+    results = []
+    for i, (seed, params) in enumerate(expand(grid, args.seeds)):
+        run_id = 'run-{:04d}'.format(i)
+        run_dir = os.path.join(args.out, run_id)
+        result_path = os.path.join(run_dir, 'result.json')
+        if os.path.exists(result_path):
+            with open(result_path, 'r') as f:
+                done = json.load(f)
+            if done['params'] == params and done['seed'] == seed:
+                results.append(done)
+                continue
+        specs.append({'id': run_id, 'dir': run_dir, 'seed': seed, 'params': params, 'epochs': args.epochs})
+
+    logger.info("{} runs ({} already done) over {} with {} workers".format(
+        len(specs) + len(results), len(results), json.dumps(grid), args.workers))
+
+    start = time.time()
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run, spec): spec for spec in specs}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            spec = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as inst:
+                failed += 1
+                logger.info({"run": spec['id'], "params": spec['params'], "seed": spec['seed'], "error": inst})
+                continue
+            elapsed = time.time() - start
+            logger.info("{} done ({}/{}), {:.1f} runs/hour".format(spec['id'], done, len(specs), done / elapsed * 3600))
+
+    collect(args.out, results, names)
+    elapsed = time.time() - start
+    logger.info("Ran {} runs ({} failed) in {:.1f} (s), {:.1f} runs/hour; results in {}".format(
+        len(specs), failed, elapsed, len(specs) / elapsed * 3600 if elapsed > 0 else 0.0,
+        os.path.join(args.out, 'results.tsv')))
+
+if __name__ == "__main__":
+    main()
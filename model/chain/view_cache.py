@@ -0,0 +1,116 @@
+"""
+view_cache.py: block-scoped read-through cache for contract view calls.
+
+Values are keyed by (block number, contract, function, args), so a repeated
+view call costs nothing until the chain head moves. Calls are pinned to the
+cached head block, so everything read between two head checks is consistent.
+Values that can never change (token0, decimals, symbol...) can be cached
+permanently instead.
+"""
+
+import time
+
+def freeze(value):
+    """
+    Make call arguments (which may contain lists, like swap paths) hashable.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    return value
+
+class ViewCache:
+    """
+    Caches view call results per block. The head is re-checked (one
+    eth_blockNumber) when the cache has been marked dirty, e.g. because we
+    sent a transaction or issued a block, or when it is older than head_ttl
+    seconds. When the head has moved, everything but the permanent entries is
+    dropped.
+    """
+
+    def __init__(self, w3, head_ttl=1.0):
+        self.w3 = w3
+        self.head_ttl = head_ttl
+
+        # Counters, to see how many RPCs we save
+        self.hits = 0
+        self.misses = 0
+        self.head_polls = 0
+
+        self.__head = None
+        self.__head_time = 0
+        self.__dirty = True
+        # This maps from (block, address, function, args) to value
+        self.__entries = {}
+        # This maps from (address, function, args) to value, for values that never change
+        self.__permanent = {}
+
+    def mark_dirty(self):
+        """
+        Note that the chain may have moved (we sent a transaction, issued a
+        block, or moved the clock), so the head must be checked on next use.
+        """
+        self.__dirty = True
+
+    def head(self):
+        """
+        Get the block number that cached reads are made against.
+        """
+        now = time.monotonic()
+        if self.__dirty or self.__head is None or now - self.__head_time > self.head_ttl:
+            head = self.w3.eth.blockNumber
+            self.head_polls += 1
+            if head != self.__head:
+                self.__entries.clear()
+                self.__head = head
+            self.__head_time = now
+            self.__dirty = False
+        return self.__head
+
+    def call(self, prepared, transaction=None, permanent=False):
+        """
+        Get the result of a prepared contract function call, like
+        contract.functions.getReserves(), from the cache or from the chain.
+
+        transaction is passed through like ContractFunction.call(); it is not
+        part of the key, since view results don't depend on the caller.
+        """
+        key = (
+            prepared.address,
+            prepared.fn_name,
+            freeze(prepared.args or ()),
+            freeze(prepared.kwargs or {}),
+        )
+
+        if permanent:
+            entries = self.__permanent
+            block_identifier = 'latest'
+        else:
+            block_identifier = self.head()
+            entries = self.__entries
+            key = (block_identifier,) + key
+
+        try:
+            value = entries[key]
+            self.hits += 1
+            return value
+        except KeyError:
+            pass
+
+        self.misses += 1
+        value = prepared.call(transaction or {}, block_identifier=block_identifier)
+        entries[key] = value
+        return value
+
+    def stats(self):
+        """
+        Get the counters as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "head_polls": self.head_polls,
+            "hit_rate": self.hits / float(lookups) if lookups > 0 else 0.0,
+        }
@@ -2,77 +2,378 @@
 project_name = "cinquemb:xsd-protocol"
 """
 plot.py: plot log of % system behavior
+
+Reads a log.tsv, or a run log (log.bin) from model.py, and plots each column
+against epoch. Only the columns asked for are read, and each is parsed into
+a numpy array in one go instead of a Python float at a time. Before drawing,
+each line is cut down to about two points per pixel of its plot's width,
+keeping each pixel's minimum and maximum (or, with --method lttb, the points
+that keep the line's shape best), so drawing costs the same however long
+the run was.
+
+With --follow, it keeps watching the log while a run writes it, reading only
+what was added since the last look into fixed-size ring buffers of the
+latest --window rows, and redraws just the lines a few times a second.
+
+    ./plot.py                                   # chain/log.tsv
+    ./plot.py chain/log.bin price supply faith
+    ./plot.py chain/log.bin --follow
 """ % (project_name)
 
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.animation import FuncAnimation
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chain'))
+from run_log import MAGIC, RunLogReader, read_run_log
+
+# What to plot when no columns are asked for, as log.tsv has them
+DEFAULT_COLUMNS = ['price', 'supply', 'coupons', 'total_redeemable', 'lp_supply', 'faith']
+
+# A header line of a log.tsv
+HEADER = re.compile(rb'^#(.*)$', re.M)
+
+def parse_tsv(data, columns=None, headings=None):
+    """
+    Parse the whole lines of TSV text (bytes) into a dict from column name
+    to array, for the given columns (all of them, if None). A header line
+    (starting with #) names the columns of the lines after it, so a header
+    written again partway through, as when a run resumes, is fine. Lines
+    before the first header have the given headings.
+
+    Returns the dict, and the headings in force at the end.
+    """
+    segments = []
+    start = 0
+    for match in list(HEADER.finditer(data)) + [None]:
+        end = len(data) if match is None else match.start()
+        if headings is not None and end > start:
+            segments.append(_parse_segment(data[start:end], headings, columns))
+        if match is not None:
+            headings = [h.strip() for h in match.group(1).decode('utf-8').split('\t')]
+            start = match.end()
+    # A column some headers lack is NaN for their rows
+    names = list(dict.fromkeys(name for (_, arrays) in segments for name in arrays))
+    return {
+        name: np.concatenate([
+            arrays[name] if name in arrays else np.full(rows, np.nan)
+            for (rows, arrays) in segments
+        ])
+        for name in names
+    }, headings
+
+def _parse_segment(text, headings, columns):
+    # Every number in one C pass; rows are as wide as the header
+    values = np.fromstring(text.decode('utf-8'), sep=' ')
+    rows = len(values) // len(headings)
+    table = values[:rows * len(headings)].reshape(rows, len(headings))
+    return rows, {
+        name: np.ascontiguousarray(table[:, i])
+        for i, name in enumerate(headings)
+        if columns is None or name in columns
+    }
+
+def is_run_log(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def load(path, columns=None):
+    """
+    Load the given columns (all of them, if None) of a log.tsv or run log
+    as a dict from column name to array.
+    """
+    if is_run_log(path):
+        return read_run_log(path, columns)
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Leave off a line still being written
+    return parse_tsv(data[:data.rfind(b'\n') + 1], columns)[0]
+
+class TsvTail:
+    """
+    Reads the lines added to a log.tsv since the last look.
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns
+        # Where the next unread line starts
+        self.offset = 0
+        self.headings = None
+
+    def poll(self):
+        """
+        Read the whole lines added since the last poll(). Returns a dict from
+        column name to array of the new rows.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        if os.path.getsize(self.path) < self.offset:
+            # Started over
+            (self.offset, self.headings) = (0, None)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        (batch, self.headings) = parse_tsv(data, self.columns, self.headings)
+        return batch
+
+class Ring:
+    """
+    The latest capacity rows of some columns, in preallocated arrays.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # Each value is stored twice, capacity apart, so the window is
+        # always one contiguous slice
+        self.__buffers = {}
+        self.__end = 0
+        self.count = 0
+
+    def extend(self, batch):
+        """
+        Add rows, as a dict from column name to equal-length arrays. Columns
+        not in the batch get NaN for these rows.
+        """
+        if not batch:
+            return
+        rows = len(next(iter(batch.values())))
+        skip = max(0, rows - self.capacity)
+        positions = (self.__end + np.arange(skip, rows)) % self.capacity
+        for name in list(batch) + [name for name in self.__buffers if name not in batch]:
+            buffer = self.__buffers.get(name)
+            if buffer is None:
+                buffer = self.__buffers[name] = np.full(2 * self.capacity, np.nan)
+            values = batch[name][skip:] if name in batch else np.nan
+            buffer[positions] = values
+            buffer[positions + self.capacity] = values
+        self.__end = (self.__end + rows) % self.capacity
+        self.count = min(self.count + rows, self.capacity)
+
+    def __contains__(self, name):
+        return name in self.__buffers
+
+    def __getitem__(self, name):
+        """
+        Get a column's rows, oldest first, as a view.
+        """
+        start = (self.__end - self.count) % self.capacity
+        return self.__buffers[name][start:start + self.count]
+
+    def names(self):
+        return list(self.__buffers)
+
+def downsample_minmax(x, y, buckets):
+    """
+    Get the indices of the points to draw so that each of buckets runs of
+    points keeps its lowest and highest, in order.
+    """
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    whole = n // size
+    # Gaps (NaN) are never the lowest or highest
+    low = np.where(np.isnan(y), np.inf, y)
+    high = np.where(np.isnan(y), -np.inf, y)
+    starts = np.arange(whole) * size
+    picks = [
+        starts + low[:whole * size].reshape(whole, size).argmin(axis=1),
+        starts + high[:whole * size].reshape(whole, size).argmax(axis=1),
+    ]
+    if whole * size < n:
+        picks.append(whole * size + np.array([low[whole * size:].argmin(), high[whole * size:].argmax()]))
+    # Keep the ends, so the x range doesn't change
+    picks.append(np.array([0, n - 1]))
+    return np.unique(np.concatenate(picks))
+
+def downsample_lttb(x, y, points):
+    """
+    Get the indices of points points to draw, picked by Largest Triangle
+    Three Buckets: in each bucket, the point making the biggest triangle
+    with the last one picked and the mean of the next bucket.
+    """
+    n = len(y)
+    if n <= points or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    picked = np.empty(points, dtype=int)
+    picked[0] = 0
+    picked[-1] = n - 1
+    last = 0
+    for i in range(points - 2):
+        (start, end) = (edges[i], edges[i + 1])
+        (next_start, next_end) = (edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n)
+        mean_x = x[next_start:next_end].mean()
+        mean_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[last] - mean_x) * (y[start:end] - y[last]) -
+            (x[last] - x[start:end]) * (mean_y - y[last])
+        )
+        last = start + int(np.nan_to_num(area, nan=-1.0).argmax()) if end > start else start
+        picked[i + 1] = last
+    return np.unique(picked)
+
+def downsample(x, y, pixels, method='minmax'):
+    """
+    Cut a line down to what pixels across can show. Returns (x, y).
+    """
+    if method == 'lttb':
+        keep = downsample_lttb(x, y, 2 * pixels)
+    else:
+        keep = downsample_minmax(x, y, pixels)
+    return x[keep], y[keep]
+
+def style_axis(ax, heading, x):
+    """
+    Label an axis, with the special price axes so we can see 1.0.
+    """
+    ax.set_ylabel(heading)
+    if heading == "price":
+        ax.set_ylim(0, 1.4)
+        ax.set_yticks([0, 0.35, 0.7, 1.05, 1.4])
+        if len(x) > 0:
+            ax.hlines(1.0, np.nanmin(x), np.nanmax(x))
+
+def _open_tail(path, columns):
+    """
+    Make the right reader for the log at path, or None if there isn't
+    enough of it yet to tell what it is.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < len(MAGIC):
+        return None
+    if is_run_log(path):
+        return RunLogReader(path, columns)
+    return TsvTail(path, columns)
+
+def follow(args):
+    """
+    Plot the log as it grows, until the window is closed.
+    """
+    columns = None if not args.columns else args.columns + [args.x]
+    ring = Ring(args.window)
+    source = None
+    while True:
+        # Wait for the run to write some rows
+        source = source or _open_tail(args.path, columns)
+        if source is not None:
+            ring.extend(source.poll())
+            if args.x in ring:
+                break
+        time.sleep(1.0 / args.fps)
+
+    if args.columns:
+        headings = args.columns
+    elif isinstance(source, RunLogReader):
+        headings = [name for name in DEFAULT_COLUMNS if name in ring]
+    else:
+        headings = [name for name in ring.names() if name not in ('block', args.x)]
+    fig, axes = plt.subplots(len(headings), 1, sharex=True, squeeze=False)
+    fig.suptitle('%s Simulation Results' % (project_name))
+    pixels = args.pixels or int(fig.get_size_inches()[0] * fig.dpi)
+    lines = []
+    for ax, heading in zip(axes[:, 0], headings):
+        (line,) = ax.plot([], [], '-', animated=True)
+        lines.append(line)
+        ax.set_xlabel(args.x)
+        style_axis(ax, heading, [])
+    price_line = None
+
+    def update(frame):
+        nonlocal price_line
+        batch = source.poll()
+        if frame > 0 and not batch:
+            return lines
+        ring.extend(batch)
+        x = ring[args.x]
+        if ring.count == 0 or np.all(np.isnan(x)):
+            return lines
+        rescale = False
+        (x_low, x_high) = (np.nanmin(x), np.nanmax(x))
+        for ax, line, heading in zip(axes[:, 0], lines, headings):
+            y = ring[heading] if heading in ring else np.full(ring.count, np.nan)
+            (px, py) = downsample(x, y, pixels, args.method)
+            line.set_data(px, py)
+            # The lines are redrawn alone each frame; the axes only when
+            # the data outgrows them
+            (low, high) = ax.get_xlim()
+            if x_low < low or x_high > high or frame == 0:
+                ax.set_xlim(x_low, x_high + max(1.0, 0.1 * (x_high - x_low)))
+                rescale = True
+            if heading != 'price' and not np.all(np.isnan(py)):
+                (y_low, y_high) = (np.nanmin(py), np.nanmax(py))
+                (low, high) = ax.get_ylim()
+                if y_low < low or y_high > high or frame == 0:
+                    margin = max(abs(y_high - y_low) * 0.1, 1e-9)
+                    ax.set_ylim(y_low - margin, y_high + margin)
+                    rescale = True
+            if heading == 'price' and rescale:
+                if price_line is not None:
+                    price_line.remove()
+                price_line = ax.hlines(1.0, *ax.get_xlim())
+        if rescale:
+            fig.canvas.draw_idle()
+        return lines
+
+    # Keep a reference, or the animation stops
+    animation = FuncAnimation(fig, update, interval=1000.0 / args.fps, blit=True, cache_frame_data=False)
+    plt.show()
+    return animation
 
 def main():
     """
     Main function: plot the simulation.
     """
-    
-    # This will hold the headings for columns
-    headings = []
-    # This will hold each column, as a list
-    columns = []
-
-    #log = open("./chain/log.150adv.10prem.40agents_3.tsv")
-    log = open("./chain/log.tsv")
-    for line in log:
-        line = line.strip()
-        if line == '':
-            continue
-        parts = line.split('\t')
-        if parts[0].startswith('#'):
-            # This is a header
-            headings = parts
-            headings[0] = headings[0][1:].strip()
-        else:
-            # This is data. Assume all columns are the same length
-            for i, item in enumerate(parts):
-                if len(columns) <= i:
-                    columns.append([])
-                columns[i].append(float(item))
-                
-    # Now plot
-    
-    # Find what to plot against
-    x_heading = "epoch"
-    x_column_number = headings.index(x_heading)
-    if x_column_number == -1:
-        raise RuntimeError("No column: " + x_heading)
-        
-    fig, axes = plt.subplots(len(columns) - 2, 1, sharex=True)
+    parser = argparse.ArgumentParser(description="Plot a model run's log.")
+    parser.add_argument('path', nargs='?', default='./chain/log.tsv', help="log.tsv or run log to plot")
+    parser.add_argument('columns', nargs='*', help="columns to plot (default: {}, or all in a log.tsv)".format(' '.join(DEFAULT_COLUMNS)))
+    parser.add_argument('--x', default='epoch', help="column to plot against")
+    parser.add_argument('--method', choices=['minmax', 'lttb'], default='minmax', help="how to downsample")
+    parser.add_argument('--pixels', type=int, default=0, help="points across per plot (default: the figure's width)")
+    parser.add_argument('--follow', action='store_true', help="keep plotting the log as it grows")
+    parser.add_argument('--window', type=int, default=100000, help="with --follow, how many of the latest rows to keep")
+    parser.add_argument('--fps', type=float, default=2.0, help="with --follow, redraws per second")
+    args = parser.parse_args()
+
+    if args.follow:
+        follow(args)
+        return
+
+    data = load(args.path, None if not args.columns else args.columns + [args.x])
+    if args.x not in data:
+        raise RuntimeError("No column: " + args.x)
+    if args.columns:
+        headings = args.columns
+    elif is_run_log(args.path):
+        headings = [name for name in DEFAULT_COLUMNS if name in data]
+    else:
+        headings = [name for name in data if name not in ('block', args.x)]
+    missing = [name for name in headings if name not in data]
+    if missing:
+        raise RuntimeError("No column: " + ', '.join(missing))
+    x = data[args.x].astype(float)
+
+    fig, axes = plt.subplots(len(headings), 1, sharex=True, squeeze=False)
     fig.suptitle('%s Simulation Results' % (project_name))
+    pixels = args.pixels or int(fig.get_size_inches()[0] * fig.dpi)
 
-    axis_cursor = 0
-        
-    for column_number in range(len(columns)):
-
-        if headings[column_number] == 'block':
-            continue
-        
-        if column_number == x_column_number:
-            # Don't plot against self
-            continue
-            
+    for ax, heading in zip(axes[:, 0], headings):
         # Plot this column against the designated x
-        ax = axes[axis_cursor]
-        ax.plot(columns[x_column_number], columns[column_number], '-')
-        ax.set_xlabel(headings[x_column_number])
-        ax.set_ylabel(headings[column_number])
-        
-        if headings[column_number] == "price":
-            # Special axes here so we can see 1.0
-            ax.set_ylim(0, 1.4)
-            ax.set_yticks([0, 0.35, 0.7, 1.05, 1.4])
-            ax.hlines(1.0, min(columns[x_column_number]), max(columns[x_column_number]))
-        
-        # Make the next plot on the next axes
-        axis_cursor += 1
-            
+        (px, py) = downsample(x, data[heading].astype(float), pixels, args.method)
+        ax.plot(px, py, '-')
+        ax.set_xlabel(args.x)
+        style_axis(ax, heading, x)
+
     # Show all the plots
     plt.show()
-    
+
 if __name__ == "__main__":
     main()
@@ -34,6 +34,8 @@ contract Regulator is Comptroller {
 
     event SupplyIncrease(uint256 indexed epoch, uint256 price, uint256 newRedeemable, uint256 lessDebt, uint256 newBonded);
     event SupplyNeutral(uint256 indexed epoch);
+    event CouponPurchase(address indexed account, uint256 indexed epoch, uint256 dollarAmount, uint256 couponAmount);
+    event CouponAutoRedemption(address indexed account, uint256 indexed epoch, uint256 couponAmount);
 
     function step() internal {
         Decimal.D256 memory price = oracleCapture();
@@ -180,6 +182,7 @@ contract Regulator is Comptroller {
                     
                     burnFromAccount(bidder.bidder, bidder.dollarAmount);
                     incrementBalanceOfCoupons(bidder.bidder, bidder.couponExpiryEpoch, bidder.couponAmount);
+                    emit CouponPurchase(bidder.bidder, bidder.couponExpiryEpoch, bidder.dollarAmount, bidder.couponAmount);
                     setCouponBidderStateSelected(epoch, bidder.bidder, auctionInternals[2]);
                     auctionInternals[0]++;
                 }
@@ -215,6 +218,7 @@ contract Regulator is Comptroller {
                 redeemToAccount(baddr, bal_coupons);
                 decrementBalanceOfCoupons(baddr, exp_epoch, bal_coupons, "Regulator: Insufficient coupon balance");
                 setCouponBidderStateRedeemed(exp_epoch, baddr);
+                emit CouponAutoRedemption(baddr, exp_epoch, bal_coupons);
                 return true;
             }
             
@@ -539,6 +539,22 @@ describe('Regulator', function () {
                 expect(await this.regulator.getTotalAuctioned(7)).to.be.bignumber.equal(new BN(3 * 50000));
                 expect(await this.regulator.getTotalBurned(7)).to.be.bignumber.equal(new BN(3800));
               });
+
+              it('emits CouponPurchase for each filled bid', async function () {
+                await this.regulator.placeCouponAuctionBid(5, 2000, 50000, {from: userAddress2});
+                await this.regulator.placeCouponAuctionBid(1000, 900, 50000, {from: userAddress3});
+                await this.regulator.placeCouponAuctionBid(100990, 900, 50000, {from: userAddress4});
+
+                this.auction_settlement = await this.regulator.settleCouponAuctionE(7);
+
+                const event = await expectEvent.inTransaction(this.auction_settlement.tx, MockRegulator, 'CouponPurchase', {
+                  account: userAddress2
+                });
+
+                expect(event.args.epoch).to.be.bignumber.equal(new BN(12));
+                expect(event.args.dollarAmount).to.be.bignumber.equal(new BN(2000));
+                expect(event.args.couponAmount).to.be.bignumber.equal(new BN(50000));
+              });
             });
             
             describe('auction is finished', function () {
@@ -0,0 +1,78 @@
+const { accounts, contract, web3 } = require('@openzeppelin/test-environment');
+
+const { BN, expectRevert } = require('@openzeppelin/test-helpers');
+const { expect } = require('chai');
+
+const Multicall = contract.fromArtifact('Multicall');
+const MockToken = contract.fromArtifact('MockToken');
+
+describe('Multicall', function () {
+  const [ ownerAddress, userAddress ] = accounts;
+
+  beforeEach(async function () {
+    this.multicall = await Multicall.new({from: ownerAddress});
+    this.token = await MockToken.new("Test Token", "TEST", 18, {from: ownerAddress});
+    await this.token.mint(userAddress, 1000);
+    await this.token.mint(ownerAddress, 250);
+
+    this.calls = [
+      {target: this.token.address, callData: this.token.contract.methods.balanceOf(userAddress).encodeABI()},
+      {target: this.token.address, callData: this.token.contract.methods.balanceOf(ownerAddress).encodeABI()},
+      {target: this.token.address, callData: this.token.contract.methods.totalSupply().encodeABI()},
+    ];
+  });
+
+  describe('aggregate', function () {
+    describe('when all calls succeed', function () {
+      beforeEach('call', async function () {
+        this.result = await this.multicall.aggregate.call(this.calls);
+      });
+
+      it('returns the current block', async function () {
+        expect(this.result.blockNumber).to.be.bignumber.equal(new BN(await web3.eth.getBlockNumber()));
+      });
+
+      it('returns every result in order', async function () {
+        const values = this.result.returnData.map(data => web3.eth.abi.decodeParameter('uint256', data));
+        expect(values).to.be.deep.equal(['1000', '250', '1250']);
+      });
+    });
+
+    describe('when a call fails', function () {
+      it('reverts', async function () {
+        const calls = this.calls.concat([
+          {target: this.token.address, callData: this.token.contract.methods.transfer(ownerAddress, 1).encodeABI()}
+        ]);
+        await expectRevert(this.multicall.aggregate(calls, {from: userAddress}), "Multicall: call failed");
+      });
+    });
+  });
+
+  describe('tryAggregate', function () {
+    describe('when a call fails', function () {
+      beforeEach('call', async function () {
+        const calls = this.calls.concat([
+          {target: this.token.address, callData: this.token.contract.methods.transfer(ownerAddress, 1).encodeABI()}
+        ]);
+        this.result = await this.multicall.tryAggregate.call(false, calls);
+      });
+
+      it('reports success per call', async function () {
+        expect(this.result.returnData.map(r => r.success)).to.be.deep.equal([true, true, true, false]);
+      });
+
+      it('returns the successful results', async function () {
+        expect(web3.eth.abi.decodeParameter('uint256', this.result.returnData[2].returnData)).to.be.equal('1250');
+      });
+    });
+
+    describe('when success is required', function () {
+      it('reverts', async function () {
+        const calls = this.calls.concat([
+          {target: this.token.address, callData: this.token.contract.methods.transfer(ownerAddress, 1).encodeABI()}
+        ]);
+        await expectRevert(this.multicall.tryAggregate(true, calls, {from: userAddress}), "Multicall: call failed");
+      });
+    });
+  });
+});